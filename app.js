@@ -8,6 +8,12 @@ let mapPoint = null;
 // Modal / alvo atual
 let TARGET = { type: null, name: null };
 
+// Alimentador (?feeder=... na URL); sem ele o backend usa o padrão
+const FEEDER = new URLSearchParams(location.search).get("feeder");
+const SESSION = new URLSearchParams(location.search).get("session");  // sessão de treino (cópia própria)
+const Q = [FEEDER && `feeder=${encodeURIComponent(FEEDER)}`, SESSION && `session=${encodeURIComponent(SESSION)}`]
+  .filter(Boolean).map((x,i)=>(i ? "&" : "?") + x).join("");
+
 // ---------- util ----------
 function log(msg){
   const el = document.getElementById("log");
@@ -20,10 +26,30 @@ async function fetchJSON(url, options){
   return r.json();
 }
 
+// topologia binária: float32 (x,y) por barra + arestas por posição + nomes (ver feeders.pack_layout)
+async function fetchTopology(){
+  const r = await fetch("/api/topology" + (Q ? Q + "&" : "?") + "format=bin");
+  if(!r.ok){ throw new Error(`${r.status} ${await r.text()}`); }
+  const buf = await r.arrayBuffer(), dv = new DataView(buf);
+  if(new TextDecoder().decode(new Uint8Array(buf, 0, 4)) !== "TOP1") throw new Error("topologia: formato desconhecido");
+  const [nb, nl, nt, nn] = [4, 8, 12, 16].map(o=>dv.getUint32(o, true));
+  let o = 20;
+  const xy = new Float32Array(buf, o, nb*2); o += nb*8;
+  const le = new Uint32Array(buf, o, nl*2); o += nl*8;
+  const te = new Uint32Array(buf, o, nt*2); o += nt*8;
+  const names = JSON.parse(new TextDecoder().decode(new Uint8Array(buf, o, nn)));
+  const bn = names.buses, topo = {buses:{}, lines:[], trafos:[]};
+  bn.forEach((n,i)=>{ if(Number.isFinite(xy[2*i])) topo.buses[n] = [xy[2*i], xy[2*i+1]]; });
+  names.lines.forEach((n,i)=>topo.lines.push([n, bn[le[2*i]], bn[le[2*i+1]]]));
+  names.trafos.forEach((n,i)=>topo.trafos.push([n, bn[te[2*i]], bn[te[2*i+1]]]));
+  topo.index = {buses: bn, lines: names.index_lines || names.lines};
+  return topo;
+}
+
 // ---------- boot ----------
 async function loadAll(){
   try{
-    TOPO = await fetchJSON("/api/topology");
+    TOPO = await fetchTopology();
     buildMapper(TOPO.buses);
     await refreshState();
     buildSelectors();
@@ -41,7 +67,47 @@ async function loadAll(){
   }catch(e){ log("Falha ao iniciar: " + e.message); }
 }
 
-async function refreshState(){ STATE = await fetchJSON("/api/state"); }
+// ---------- estado compacto ----------
+// o backend manda bitsets (bit i = posição i em TOPO.index) ou, com "since", só as posições que inverteram
+let ETAG = null;
+function decodeBits(b64, n){
+  const bytes = Uint8Array.from(atob(b64), c=>c.charCodeAt(0));
+  const out = new Array(n);
+  for(let i=0;i<n;i++) out[i] = ((bytes[i>>3] >> (i&7)) & 1) === 1;
+  return out;
+}
+function applyState(d){
+  const bus = TOPO.index.buses, line = TOPO.index.lines;
+  if(d.since === undefined || !STATE){
+    const on = decodeBits(d.bus_on, d.n_bus);
+    const op = decodeBits(d.line_open, d.n_line), ft = decodeBits(d.line_fault, d.n_line), lo = decodeBits(d.line_on, d.n_line);
+    const ends = {}; TOPO.lines.forEach(([n,a,b])=>{ ends[n] = [a,b]; });
+    STATE = {buses:{}, lines:{}};
+    bus.forEach((n,i)=>{ STATE.buses[n] = {energized:on[i]}; });
+    line.forEach((n,i)=>{ const [a,b] = ends[n] || ["?","?"];
+      STATE.lines[n] = {open:op[i], fault:ft[i], energized:lo[i], from:a, to:b}; });
+  } else {
+    d.flip.bus_on.forEach(i=>{ const s = STATE.buses[bus[i]]; s.energized = !s.energized; });
+    [["line_open","open"],["line_fault","fault"],["line_on","energized"]].forEach(([m,k])=>
+      d.flip[m].forEach(i=>{ const s = STATE.lines[line[i]]; s[k] = !s[k]; }));
+  }
+  STATE.open = d.open; STATE.fault = d.fault; STATE.version = d.version;
+}
+async function refreshState(){
+  const r = await fetch("/api/state" + (Q ? Q + "&" : "?") + "format=compact",
+                        {headers: ETAG && STATE ? {"If-None-Match": ETAG} : {}});
+  if(r.status === 304) return;
+  if(!r.ok){ throw new Error(`${r.status} ${await r.text()}`); }
+  ETAG = r.headers.get("ETag");
+  STATE = null; applyState(await r.json());
+}
+// envia uma manobra pedindo só o que mudou desde a versão em STATE (sem refazer GET /api/state)
+async function postAction(url, body){
+  const d = await fetchJSON(url,{method:"POST",headers:{"Content-Type":"application/json"},
+    body: JSON.stringify({...body, format:"compact", since:STATE ? STATE.version : undefined,
+                          feeder:FEEDER || undefined, session:SESSION || undefined})});
+  applyState(d); ETAG = null;
+}
 function buildSelectors(){
   const lines = TOPO.lines.map(x=>x[0]);
   document.getElementById("selLine").innerHTML  = lines.map(n=>`<option>${n}</option>`).join("");
@@ -189,57 +255,49 @@ document.addEventListener("keydown", (e)=>{ if(e.key==="Escape") closeModal(); }
 
 document.getElementById("mOpen").addEventListener("click", async ()=>{
   if(TARGET.type!=="line") return;
-  await fetchJSON("/api/switch",{method:"POST",headers:{"Content-Type":"application/json"},
-    body: JSON.stringify({name:TARGET.name, action:"open"})});
-  await refreshState(); draw(); log("ABRIR " + TARGET.name); openModalForLine(TARGET.name);
+  await postAction("/api/switch", {name:TARGET.name, action:"open"});
+  draw(); log("ABRIR " + TARGET.name); openModalForLine(TARGET.name);
 });
 document.getElementById("mClose").addEventListener("click", async ()=>{
   if(TARGET.type!=="line") return;
-  await fetchJSON("/api/switch",{method:"POST",headers:{"Content-Type":"application/json"},
-    body: JSON.stringify({name:TARGET.name, action:"close"})});
-  await refreshState(); draw(); log("FECHAR " + TARGET.name); openModalForLine(TARGET.name);
+  await postAction("/api/switch", {name:TARGET.name, action:"close"});
+  draw(); log("FECHAR " + TARGET.name); openModalForLine(TARGET.name);
 });
 document.getElementById("mFault").addEventListener("click", async ()=>{
   if(TARGET.type!=="line") return;
-  await fetchJSON("/api/fault",{method:"POST",headers:{"Content-Type":"application/json"},
-    body: JSON.stringify({name:TARGET.name, action:"apply"})});
-  await refreshState(); draw(); log("DEFEITO " + TARGET.name); openModalForLine(TARGET.name);
+  await postAction("/api/fault", {name:TARGET.name, action:"apply"});
+  draw(); log("DEFEITO " + TARGET.name); openModalForLine(TARGET.name);
 });
 document.getElementById("mClear").addEventListener("click", async ()=>{
   if(TARGET.type!=="line") return;
-  await fetchJSON("/api/fault",{method:"POST",headers:{"Content-Type":"application/json"},
-    body: JSON.stringify({name:TARGET.name, action:"clear"})});
-  await refreshState(); draw(); log("LIMPAR DEFEITO " + TARGET.name); openModalForLine(TARGET.name);
+  await postAction("/api/fault", {name:TARGET.name, action:"clear"});
+  draw(); log("LIMPAR DEFEITO " + TARGET.name); openModalForLine(TARGET.name);
 });
 
 // ---------- botões laterais (mantidos) ----------
 document.getElementById("btnOpen").addEventListener("click", async ()=>{
   const n = document.getElementById("selLine").value;
-  await fetchJSON("/api/switch",{method:"POST",headers:{"Content-Type":"application/json"},
-    body: JSON.stringify({name:n, action:"open"})});
-  await refreshState(); draw(); log("ABRIR " + n);
+  await postAction("/api/switch", {name:n, action:"open"});
+  draw(); log("ABRIR " + n);
 });
 document.getElementById("btnClose").addEventListener("click", async ()=>{
   const n = document.getElementById("selLine").value;
-  await fetchJSON("/api/switch",{method:"POST",headers:{"Content-Type":"application/json"},
-    body: JSON.stringify({name:n, action:"close"})});
-  await refreshState(); draw(); log("FECHAR " + n);
+  await postAction("/api/switch", {name:n, action:"close"});
+  draw(); log("FECHAR " + n);
 });
 document.getElementById("btnApplyFault").addEventListener("click", async ()=>{
   const n = document.getElementById("selFault").value;
-  await fetchJSON("/api/fault",{method:"POST",headers:{"Content-Type":"application/json"},
-    body: JSON.stringify({name:n, action:"apply"})});
-  await refreshState(); draw(); log("DEFEITO " + n);
+  await postAction("/api/fault", {name:n, action:"apply"});
+  draw(); log("DEFEITO " + n);
 });
 document.getElementById("btnClearFault").addEventListener("click", async ()=>{
   const n = document.getElementById("selFault").value;
-  await fetchJSON("/api/fault",{method:"POST",headers:{"Content-Type":"application/json"},
-    body: JSON.stringify({name:n, action:"clear"})});
-  await refreshState(); draw(); log("LIMPAR DEFEITO " + n);
+  await postAction("/api/fault", {name:n, action:"clear"});
+  draw(); log("LIMPAR DEFEITO " + n);
 });
 document.getElementById("btnReset").addEventListener("click", async ()=>{
-  await fetchJSON("/api/reset",{method:"POST"});
-  await refreshState(); draw(); log("RESET");
+  await postAction("/api/reset", {});
+  draw(); log("RESET");
 });
 
 // init
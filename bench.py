@@ -0,0 +1,281 @@
+"""
+Benchmarks de latência da API (rodar a partir de backend/):
+
+    python bench.py template [--n 50]
+    python bench.py loads [--n 20]
+    python bench.py timeseries [--n 50]
+    python bench.py reliability [--n 100000]   (n = anos simulados)
+    python bench.py solver [--n 20] [--sizes 2000,5000,10000]   (runpp x varredura radial)
+    python bench.py scale [--n 3] [--sizes 2000,5000,10000,20000] [--json out.json]
+                          [--baseline base.json --tolerance 0.25]
+
+Usa um banco SQLite temporário para não poluir runs.db.
+"""
+import argparse
+import json
+import os
+import pickle
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+
+os.environ.setdefault("SIM_DB_URL", f"sqlite:///{tempfile.mkdtemp()}/bench.db")
+os.environ.setdefault("SIM_SYNTHETIC", "1")
+
+def _pct(samples, q):
+    xs = sorted(samples)
+    return xs[min(len(xs) - 1, int(round(q / 100.0 * (len(xs) - 1))))]
+
+def _measure(fn, n):
+    samples = []
+    for _ in range(n):
+        t0 = time.perf_counter(); fn(); samples.append((time.perf_counter() - t0) * 1000.0)
+    return {"p50_ms": round(_pct(samples, 50), 2), "p99_ms": round(_pct(samples, 99), 2)}
+
+def _report(title, rows):
+    print(title)
+    for name, r in rows.items():
+        print(f"  {name:<28} p50={r['p50_ms']:>9.2f} ms   p99={r['p99_ms']:>9.2f} ms")
+
+def bench_template(n: int = 50):
+    """Antes: build_w0321p3 a cada request (template invalidado). Depois: cópia do template."""
+    from fastapi.testclient import TestClient
+    from app.main import app
+    from app.sim.model import invalidate_template
+
+    c = TestClient(app)
+    c.get("/api/state"); c.post("/api/run", json={})  # aquece numba/pandapower
+
+    def cold(path, **kw):
+        def call():
+            invalidate_template(); (c.post if kw else c.get)(path, **kw)
+        return call
+
+    def warm(path, **kw):
+        return lambda: (c.post if kw else c.get)(path, **kw)
+
+    _report("antes (build_w0321p3 por request)", {
+        "GET /api/state": _measure(cold("/api/state"), n),
+        "POST /api/run": _measure(cold("/api/run", json={}), n),
+    })
+    _report("depois (template em cache)", {
+        "GET /api/state": _measure(warm("/api/state"), n),
+        "POST /api/run": _measure(warm("/api/run", json={}), n),
+    })
+
+def _star_net(n_loads: int):
+    """Rede sintética: n_loads barras em estrela, uma carga por barra."""
+    import numpy as np
+    import pandapower as pp
+    net = pp.create_empty_network()
+    src = pp.create_bus(net, vn_kv=13.8)
+    buses = pp.create_buses(net, n_loads, vn_kv=13.8)
+    pp.create_lines_from_parameters(net, [src] * n_loads, buses, 0.1, 0.3, 0.4, 10, 0.6)
+    prio = np.array(["", "|prior:alta", "|prior:critica"])[np.arange(n_loads) % 3]
+    pp.create_loads(net, buses, p_mw=0.08, q_mvar=0.02, name=[f"LD-{i}{p}" for i, p in enumerate(prio)])
+    pp.create_ext_grid(net, src)
+    net.line.loc[net.line.index[::7], "in_service"] = False
+    return net
+
+def bench_loads(n: int = 50):
+    """Contabilidade de cargas: iterrows (antes) x arrays (load_accounting)."""
+    from app.sim.model import customers_from_mw
+    from app.sim.ops import _priority_of, energized_buses, energized_mask, load_accounting
+
+    def iterrows_accounting(net, energized):
+        p_total = 0.0; score = 0
+        for _, load in net.load.iterrows():
+            if load.bus not in energized: p_total += load.p_mw
+            else: score += _priority_of(load["name"] or "")
+        return customers_from_mw(p_total), score
+
+    for size in (1_000, 10_000, 50_000):
+        net = _star_net(size)
+        energ = energized_buses(net); mask = energized_mask(net)
+        assert iterrows_accounting(net, energ) == load_accounting(net, mask)[1:]
+        _report(f"{size} cargas", {
+            "iterrows": _measure(lambda: iterrows_accounting(net, energ), max(1, n // 10)),
+            "load_accounting (set)": _measure(lambda: load_accounting(net, energ), n),
+            "load_accounting (mask)": _measure(lambda: load_accounting(net, mask), n),
+        })
+
+def bench_timeseries(n: int = 50):
+    """Um ano de perfis de 15 min (35.040 passos): runpp por passo (extrapolado de n passos) x solver em lote."""
+    import numpy as np
+    import pandas as pd
+    import pandapower as pp
+    from app.sim.model import NORMALLY_OPEN, new_network
+    from app.sim.ops import apply_switching
+    from app.sim.timeseries import TimeSeriesSolver, load_profile
+
+    net = new_network(); apply_switching(net, open_names=NORMALLY_OPEN)
+    idx = pd.date_range("2025-01-01", periods=35_040, freq="15min")
+    hour = idx.hour.values + idx.minute.values / 60.0
+    daily = 0.6 + 0.5 * np.sin((hour - 6.0) / 24.0 * 2 * np.pi).clip(0)
+    cols = [n for n in net.trafo.name.tolist() if n != "TR-SE"]
+    rng = np.random.default_rng(0)
+    prof = load_profile(net, pd.DataFrame(daily[:, None] * rng.uniform(0.7, 1.3, (len(idx), len(cols))),
+                                          index=idx, columns=cols))
+
+    t0 = time.perf_counter(); solver = TimeSeriesSolver(net); t_setup = time.perf_counter() - t0
+    res = solver.solve(prof)
+    ref = new_network(); apply_switching(ref, open_names=NORMALLY_OPEN)
+    t0 = time.perf_counter()
+    for k in range(n):
+        ref.load["p_mw"] = prof.p_mw[k]; ref.load["q_mvar"] = prof.q_mvar[k]; pp.runpp(ref)
+    per_step = (time.perf_counter() - t0) / n
+    err = np.nanmax(np.abs(ref.res_bus.vm_pu.values - res.vm_pu[n - 1]))
+    print(f"{prof.n_steps} passos, {len(cols)} perfis")
+    print(f"  runpp por passo (estimado)   {per_step * prof.n_steps:>9.1f} s")
+    print(f"  solver em lote               {res.elapsed_s:>9.1f} s  (+{t_setup:.1f} s de montagem, "
+          f"{res.iterations} iterações, {len(res.fallback_steps)} passos no runpp)")
+    print(f"  |dV| máx. vs runpp           {err:>9.2e} pu")
+
+def bench_reliability(n: int = 100_000):
+    """Monte Carlo de n anos: 1ª chamada (varredura N-1 + amostragem) x efeitos em cache, por nº de processos."""
+    from app.sim.model import NORMALLY_OPEN, new_network
+    from app.sim.ops import apply_switching
+    from app.sim.reliability import clear_outcomes, monte_carlo
+
+    net = new_network(); apply_switching(net, open_names=NORMALLY_OPEN)
+    print(f"{n} anos")
+    for workers in (0, 4):
+        clear_outcomes()
+        cold = monte_carlo(net, years=n, seed=1, workers=workers)
+        warm = monte_carlo(net, years=n, seed=1, workers=workers)
+        assert warm.kpis == cold.kpis
+        print(f"  workers={workers}  1ª chamada {cold.elapsed_s:>7.2f} s   em cache {warm.elapsed_s:>7.2f} s   "
+              f"SAIDI médio {warm.kpis['saidi_h']['mean']:.4f} h")
+
+def _scale_one(size: int, n: int) -> dict:
+    from app.sim.events import Event
+    from app.sim.feeders import FEEDERS
+    from app.sim.ops import apply_switching, isolate_and_reconfigure, run_powerflow
+    from app.sim.synthetic import build_synthetic, params_for
+    from app.scenario import _compute
+    from app.state import get_state
+
+    params = params_for(size)
+    t0 = time.perf_counter(); build_synthetic(params); build_s = time.perf_counter() - t0
+    tracemalloc.start()
+    net, normally_open, _ = build_synthetic(params)
+    mem_mb = tracemalloc.get_traced_memory()[0] / 2**20
+    tracemalloc.stop()
+
+    feeder = FEEDERS.get(f"SYN-{size}")
+    mid = params.trunk_sections // 2
+    target = next(n for n in feeder.template().line.name.tolist() if n.endswith(f"-T{mid:03d}"))
+
+    def solve():
+        net = feeder.new_network(); apply_switching(net, open_names=feeder.normally_open)
+        ok, err = run_powerflow(net); assert ok, err
+
+    restore = []
+    for _ in range(n):
+        net = feeder.new_network(); apply_switching(net, open_names=feeder.normally_open)
+        t0 = time.perf_counter(); isolate_and_reconfigure(net, target, workers=0)
+        restore.append((time.perf_counter() - t0) * 1000.0)
+
+    ev = Event(type="fault_permanent", target=f"line:{target}")
+    t0 = time.perf_counter(); get_state(feeder.id); state_cold = (time.perf_counter() - t0) * 1000.0
+    return {
+        "size": size, "n_bus": len(net.bus), "n_line": len(net.line), "n_trafo": len(net.trafo),
+        "build_s": round(build_s, 3),
+        "mem_mb": round(mem_mb, 2),
+        "pickle_mb": round(len(pickle.dumps(net, protocol=pickle.HIGHEST_PROTOCOL)) / 2**20, 2),
+        "copy_ms": _measure(feeder.new_network, n)["p50_ms"],
+        "solve_ms": _measure(solve, n)["p50_ms"],
+        "restore_ms": round(_pct(restore, 50), 2),
+        "run_ms": _measure(lambda: _compute(feeder, ev, 20.0, None, None), n)["p50_ms"],
+        "state_cold_ms": round(state_cold, 2),
+        "state_ms": _measure(lambda: get_state(feeder.id), n)["p50_ms"],
+    }
+
+def bench_solver(n: int = 20, sizes=(2000, 5000, 10000)):
+    """
+    pp.runpp x varredura radial (sweep.py) na configuração normal de cada
+    alimentador, mais a recomposição com limites (um fluxo por candidato)
+    e o caso com uma tie fechada (se a rede fica malhada, a varredura cai no runpp).
+    """
+    import warnings
+    warnings.filterwarnings("ignore")   # runpp em rede malhada com duas fontes avisa a cada chamada
+    from app.sim import ops
+    from app.sim.feeders import FEEDERS
+    from app.sim.ops import apply_switching, isolate_and_reconfigure, run_powerflow
+    from app.sim.sweep import compare
+    limits = {"vmin_pu": 0.9, "vmax_pu": 1.1, "imax_percent": 200}
+    for fid in ["W0321P3"] + [f"SYN-{s}" for s in sizes]:
+        feeder = FEEDERS.get(fid)
+        def fresh(closed=()):
+            net = feeder.new_network()
+            apply_switching(net, open_names=set(feeder.normally_open) - set(closed)); return net
+        nets = {s: fresh() for s in ("pp", "sweep")}
+        for s, net in nets.items(): run_powerflow(net, solver=s)
+        dv, dl = compare(nets["sweep"], nets["pp"])
+        tie = sorted(feeder.normally_open)[0]
+        trunk = [l for l in feeder.template().line.name.tolist() if not l.endswith("(tie)")]
+        target = trunk[len(trunk) // 3]
+        rows = {}
+        for s in ("pp", "sweep"):
+            net = fresh(); meshed = fresh([tie])
+            rows[f"fluxo {s}"] = _measure(lambda: run_powerflow(net, solver=s), n)
+            rows[f"tie fechada {s}"] = _measure(lambda: run_powerflow(meshed, solver=s), max(1, n // 4))
+            ops.DEFAULT_SOLVER = s
+            rows[f"recomposição {s}"] = _measure(
+                lambda: isolate_and_reconfigure(fresh(), target, limits=limits, workers=0), max(1, n // 4))
+        ops.DEFAULT_SOLVER = "sweep"
+        _report(f"{fid} ({len(feeder.template().bus)} barras)  |dV| máx={dv:.1e} pu  "
+                f"|Δcarregamento| máx={dl:.1e} %", rows)
+
+# métricas comparadas com a linha de base (maior = pior)
+SCALE_METRICS = ("build_s", "mem_mb", "pickle_mb", "copy_ms", "solve_ms", "restore_ms", "run_ms",
+                 "state_cold_ms", "state_ms")
+
+def bench_scale(n: int = 3, sizes=(2000, 5000, 10000, 20000), out=None, baseline=None, tolerance=0.25):
+    """
+    Alimentadores sintéticos SYN-<barras>: montagem, memória, cópia, fluxo,
+    recomposição, /api/run (sem cache/banco) e serialização do estado.
+    Com --json grava os resultados; com --baseline sai com código 1 se
+    alguma métrica piorar mais que --tolerance.
+    """
+    from app.sim.synthetic import GENERATOR_VERSION
+    rows = []
+    for size in sizes:
+        r = _scale_one(size, n); rows.append(r)
+        print(f"  {r['n_bus']:>6} barras  " + "  ".join(f"{k}={r[k]}" for k in SCALE_METRICS), flush=True)
+    report = {"suite": "scale", "generator": GENERATOR_VERSION, "n": n, "python": sys.version.split()[0],
+              "machine": platform.machine(), "results": rows}
+    if out:
+        with open(out, "w", encoding="utf-8") as f: json.dump(report, f, indent=2)
+    if baseline:
+        with open(baseline, encoding="utf-8") as f:
+            base = {r["size"]: r for r in json.load(f)["results"]}
+        worse = [(r["size"], k, base[r["size"]][k], r[k]) for r in rows if r["size"] in base
+                 for k in SCALE_METRICS if k in base[r["size"]] and r[k] > base[r["size"]][k] * (1 + tolerance)]
+        for size, k, old, new in worse:
+            print(f"  REGRESSÃO {size} {k}: {old} -> {new}")
+        if worse: sys.exit(1)
+    return report
+
+BENCHES = {"template": bench_template, "loads": bench_loads, "timeseries": bench_timeseries,
+           "reliability": bench_reliability, "scale": bench_scale, "solver": bench_solver}
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("bench", choices=sorted(BENCHES))
+    ap.add_argument("--n", type=int, default=None, help="repetições (padrão de cada benchmark)")
+    ap.add_argument("--sizes", default="2000,5000,10000,20000", help="scale: barras por alimentador")
+    ap.add_argument("--json", default=None, help="scale: grava os resultados neste arquivo")
+    ap.add_argument("--baseline", default=None, help="scale: compara com resultados anteriores")
+    ap.add_argument("--tolerance", type=float, default=0.25)
+    args = ap.parse_args()
+    kw = {} if args.n is None else {"n": args.n}
+    if args.bench == "solver":
+        kw.update(sizes=[int(s) for s in args.sizes.split(",")] if args.sizes != ap.get_default("sizes")
+                  else (2000, 5000, 10000))
+    if args.bench == "scale":
+        kw.update(sizes=[int(s) for s in args.sizes.split(",")], out=args.json,
+                  baseline=args.baseline, tolerance=args.tolerance)
+    BENCHES[args.bench](**kw)
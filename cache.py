@@ -0,0 +1,77 @@
+import hashlib
+import json
+import os
+import sys
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+import numpy as np
+
+# ------------------------------------------------------------------
+#  Cache LRU de soluções, compartilhado pelo estado do unifilar e por
+#  /api/run. A chave é um hash canônico da configuração (chaves abertas,
+#  defeitos, evento, limites, versão do modelo).
+#   SIM_CACHE_ENTRIES : máximo de entradas
+#   SIM_CACHE_MB      : memória aproximada máxima (MB)
+# ------------------------------------------------------------------
+CACHE_ENTRIES = int(os.getenv("SIM_CACHE_ENTRIES", "512"))
+CACHE_MB = float(os.getenv("SIM_CACHE_MB", "64"))
+
+def solution_key(kind: str, **parts) -> str:
+    """Hash canônico: conjuntos viram listas ordenadas, dicts com chaves ordenadas."""
+    def canon(v):
+        if isinstance(v, (set, frozenset)): return sorted(canon(x) for x in v)
+        if isinstance(v, (list, tuple)): return [canon(x) for x in v]
+        if isinstance(v, dict): return {str(k): canon(x) for k, x in v.items()}
+        return v
+    blob = json.dumps({"kind": kind, **canon(parts)}, sort_keys=True, separators=(",", ":"), default=str)
+    return f"{kind}:{hashlib.sha256(blob.encode()).hexdigest()}"
+
+def approx_size(value: Any) -> int:
+    if isinstance(value, np.ndarray): return int(value.nbytes)
+    if isinstance(value, dict): return sys.getsizeof(value) + sum(approx_size(k) + approx_size(v) for k, v in value.items())
+    if isinstance(value, (list, tuple, set, frozenset)): return sys.getsizeof(value) + sum(approx_size(x) for x in value)
+    return sys.getsizeof(value)
+
+class SolutionCache:
+    def __init__(self, max_entries: int = CACHE_ENTRIES, max_bytes: int = int(CACHE_MB * 1024 * 1024)):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._data: "OrderedDict[str, tuple]" = OrderedDict()  # chave -> (valor, bytes)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = self.misses = self.evictions = 0
+
+    def get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                self.misses += 1; return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return item[0]
+
+    def put(self, key: str, value: Any, size: Optional[int] = None):
+        size = approx_size(value) if size is None else size
+        if size > self.max_bytes: return
+        with self._lock:
+            old = self._data.pop(key, None)
+            if old is not None: self._bytes -= old[1]
+            self._data[key] = (value, size); self._bytes += size
+            while self._data and (len(self._data) > self.max_entries or self._bytes > self.max_bytes):
+                _, (_, sz) = self._data.popitem(last=False)
+                self._bytes -= sz; self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._data.clear(); self._bytes = 0
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            total = self.hits + self.misses
+            return {"entries": len(self._data), "bytes": self._bytes, "max_entries": self.max_entries,
+                    "max_bytes": self.max_bytes, "hits": self.hits, "misses": self.misses,
+                    "evictions": self.evictions, "hit_ratio": (self.hits / total) if total else 0.0}
+
+SOLUTIONS = SolutionCache()
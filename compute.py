@@ -0,0 +1,119 @@
+import asyncio
+import contextvars
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Iterator
+
+# ------------------------------------------------------------------
+#  Executor de cálculo: todo endpoint que roda pandapower/planejador/DB
+#  despacha para cá, liberando o event loop (/health etc. continuam
+#  respondendo). Com a fila cheia o request é recusado (429). Respostas
+#  em streaming (stream) ocupam uma vaga até o fim e produzem cada item
+#  numa thread do executor.
+#   SIM_COMPUTE_WORKERS : threads de cálculo
+#   SIM_COMPUTE_QUEUE   : máximo de tarefas pendentes (na fila + rodando)
+# ------------------------------------------------------------------
+COMPUTE_WORKERS = int(os.getenv("SIM_COMPUTE_WORKERS", "4"))
+COMPUTE_QUEUE = int(os.getenv("SIM_COMPUTE_QUEUE", "32"))
+
+class Overloaded(Exception):
+    """Executor sem vaga; a API responde 429."""
+
+class ComputeExecutor:
+    def __init__(self, workers: int = COMPUTE_WORKERS, max_pending: int = COMPUTE_QUEUE):
+        self.workers = workers
+        self.max_pending = max_pending
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="sim-compute")
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._lock = threading.Lock()
+        self._m = {"submitted": 0, "completed": 0, "failed": 0, "rejected": 0, "pending": 0, "running": 0,
+                   "queue_wait_s_sum": 0.0, "queue_wait_s_max": 0.0,
+                   "compute_s_sum": 0.0, "compute_s_max": 0.0}
+
+    def _record(self, **delta):
+        with self._lock:
+            for k, v in delta.items():
+                if k.endswith("_max"): self._m[k] = max(self._m[k], v)
+                else: self._m[k] += v
+
+    async def run(self, fn: Callable[..., Any], *args, **kwargs) -> Any:
+        if not self._slots.acquire(blocking=False):
+            self._record(rejected=1)
+            raise Overloaded()
+        t_submit = time.perf_counter()
+        self._record(submitted=1, pending=1)
+
+        def task():
+            t_start = time.perf_counter()
+            wait = t_start - t_submit
+            self._record(running=1, queue_wait_s_sum=wait, queue_wait_s_max=wait)
+            ok = False
+            try:
+                out = fn(*args, **kwargs); ok = True
+                return out
+            finally:
+                dt = time.perf_counter() - t_start
+                self._record(running=-1, compute_s_sum=dt, compute_s_max=dt,
+                             completed=1 if ok else 0, failed=0 if ok else 1)
+        try:
+            # o contexto acompanha a tarefa (trace de profiling do request, se houver)
+            return await asyncio.wrap_future(self._pool.submit(contextvars.copy_context().run, task))
+        finally:
+            self._slots.release()
+            self._record(pending=-1)
+
+    def stream(self, items: Iterator[Any]) -> "ComputeStream":
+        """Reserva a vaga já (Overloaded antes de responder) e devolve o iterador assíncrono de items."""
+        if not self._slots.acquire(blocking=False):
+            self._record(rejected=1)
+            raise Overloaded()
+        self._record(submitted=1, pending=1)
+        return ComputeStream(self, items)
+
+    def metrics(self) -> Dict[str, Any]:
+        with self._lock: m = dict(self._m)
+        done = max(1, m["completed"] + m["failed"])
+        m.update(workers=self.workers, max_pending=self.max_pending,
+                 queue_wait_s_avg=m["queue_wait_s_sum"] / done, compute_s_avg=m["compute_s_sum"] / done)
+        return m
+
+_END = object()
+
+class ComputeStream:
+    """Gerador de cálculo consumido item a item no executor; a vaga é liberada uma vez, no fim ou no descarte."""
+    def __init__(self, executor: ComputeExecutor, items: Iterator[Any]):
+        self._ex = executor; self._items = items; self._open = True
+        self._t0 = time.perf_counter()
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        if not self._open: raise StopAsyncIteration
+        try:
+            fut = self._ex._pool.submit(contextvars.copy_context().run, next, self._items, _END)
+            item = await asyncio.wrap_future(fut)
+        except BaseException:       # inclui o cancelamento quando o cliente desconecta
+            self.close(ok=False); raise
+        if item is _END:
+            self.close(); raise StopAsyncIteration
+        return item
+
+    def close(self, ok: bool = True):
+        if not self._open: return
+        self._open = False
+        try:
+            self._items.close()
+        except (AttributeError, ValueError):    # não é gerador / item ainda rodando numa thread
+            pass
+        dt = time.perf_counter() - self._t0
+        self._ex._record(pending=-1, compute_s_sum=dt, compute_s_max=dt,
+                         completed=1 if ok else 0, failed=0 if ok else 1)
+        self._ex._slots.release()
+
+    def __del__(self):
+        self.close(ok=False)   # resposta descartada antes de começar
+
+COMPUTE = ComputeExecutor()
@@ -0,0 +1,90 @@
+import copy
+from typing import Iterable, Iterator, List, Optional
+
+from .events import Event
+from .kpis import compute_kpis
+from .model import customers_from_mw, is_switch
+from .ops import OffTracker, apply_event_and_operate, energized_mask, load_accounting, run_powerflow
+from .parallel import DEFAULT_WORKERS, iter_parallel, read_shared, shared
+
+# ------------------------------------------------------------------
+#  Varredura N-1: aplica o mesmo tipo de evento a cada linha/chave a
+#  partir de um único caso base (configuração + solução compartilhadas)
+#  e ranqueia as contingências pelo impacto em clientes.
+# ------------------------------------------------------------------
+
+def default_targets(net, event_type: str, match: Optional[str] = None) -> List[str]:
+    names = [n for n in net.line.name.tolist() if n]
+    if event_type == "device_out":
+        names = [n for n in names if is_switch(n)]
+    if match:
+        names = [n for n in names if match in n]
+    return names
+
+def _run_one(net, line_in_service, event_type: str, target: str, interruption_min: float,
+             customers_total: int, limits=None) -> dict:
+    net.line["in_service"] = line_in_service.copy()  # volta ao caso base
+    try:
+        ev = Event(type=event_type, target=f"line:{target}")
+        track = OffTracker()
+        timeline, c_ini, c_pos, _ = apply_event_and_operate(net, ev, limits=limits, workers=0, on_step=track)
+    except Exception as e:
+        return {"target": target, "event_type": event_type, "error": str(e)}
+    p_after = load_accounting(net, energized_mask(net))[0]
+    # como o SAIDI: a carga do estado isolado fica sem energia durante toda a interrupção
+    kpis = compute_kpis(customers_total, c_ini, c_pos, interruption_min,
+                        ens_mwh=max(track.p_off, p_after) * interruption_min / 60.0)
+    return {"target": target, "event_type": event_type, "clients_initial": c_ini,
+            "clients_after": c_pos, "clients_restored": c_ini - c_pos,
+            "p_initial_mw": max(track.p_off, p_after), "p_after_mw": p_after,
+            "n_ops": len(timeline), "kpis": kpis.__dict__}
+
+# caso base mantido por cada processo do pool
+_WORKER_BASE = {"key": None, "net": None, "line_in_service": None}
+
+def _run_one_worker(key: str, path: str, event_type: str, target: str, interruption_min: float,
+                    customers_total: int, limits=None) -> dict:
+    if _WORKER_BASE["key"] != key:
+        net = read_shared(path)
+        _WORKER_BASE.update(key=key, net=net, line_in_service=net.line.in_service.values.copy())
+    return _run_one(_WORKER_BASE["net"], _WORKER_BASE["line_in_service"], event_type, target,
+                    interruption_min, customers_total, limits)
+
+def iter_contingencies(net, event_type: str = "fault_permanent", targets: Optional[Iterable[str]] = None,
+                       match: Optional[str] = None, interruption_min: float = 20.0, limits=None,
+                       workers: Optional[int] = None, timeout_s: Optional[float] = None) -> Iterator[dict]:
+    """
+    Produz um resultado por contingência, na ordem dos alvos, à medida que ficam prontos.
+    `net` é o caso base (não é alterado). Com limites, a solução do caso base
+    é calculada uma vez e serve de ponto de partida para todas as contingências.
+    """
+    targets = list(targets) if targets is not None else default_targets(net, event_type, match)
+    workers = DEFAULT_WORKERS if workers is None else workers
+    base = copy.deepcopy(net)
+    if limits: run_powerflow(base)
+    customers_total = customers_from_mw(base.load.p_mw.sum())
+
+    # sem limites não há fluxo: cada contingência é só conectividade e o pool não compensa
+    if workers <= 1 or not limits:
+        line_in_service = base.line.in_service.values.copy()
+        for target in targets:
+            yield _run_one(base, line_in_service, event_type, target, interruption_min, customers_total, limits)
+        return
+
+    with shared(base) as (key, path):
+        tasks = [(key, path, event_type, t, interruption_min, customers_total, limits) for t in targets]
+        for i, res in iter_parallel(_run_one_worker, tasks, workers, timeout_s):
+            yield res if res is not None else {"target": targets[i], "event_type": event_type, "error": "timeout"}
+
+def rank_contingencies(rows: List[dict]) -> List[dict]:
+    """Ordena por clientes ainda interrompidos após a recomposição, depois pelos iniciais."""
+    ok = [r for r in rows if "error" not in r]
+    ok.sort(key=lambda r: (-r["clients_after"], -r["clients_initial"], r["target"]))
+    for i, r in enumerate(ok, start=1): r["rank"] = i
+    return ok + [r for r in rows if "error" in r]
+
+def contingency_sweep(net, event_type: str = "fault_permanent", targets: Optional[Iterable[str]] = None,
+                      match: Optional[str] = None, interruption_min: float = 20.0, limits=None,
+                      workers: Optional[int] = None, timeout_s: Optional[float] = None) -> List[dict]:
+    return rank_contingencies(list(iter_contingencies(net, event_type, targets, match, interruption_min,
+                                                      limits, workers, timeout_s)))
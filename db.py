@@ -1,14 +1,57 @@
+import json
 import os
+import queue
+import threading
+import zlib
+from concurrent.futures import Future
 from datetime import datetime
-from sqlalchemy import create_engine, Column, Integer, Float, String, JSON, DateTime
-from sqlalchemy.orm import declarative_base, sessionmaker
+from typing import Any, Dict, List, Optional, Tuple
 
+from sqlalchemy import (create_engine, event, inspect, update, Column, ForeignKey, Index, Integer, Float,
+                        LargeBinary, PrimaryKeyConstraint, String, JSON, DateTime)
+from sqlalchemy.orm import declarative_base, deferred, sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from app.sim.profiling import count, span
+
+# ------------------------------------------------------------------
+#  Histórico de runs. A tabela `runs` guarda só metadados (indexados
+#  para filtro por alimentador/evento/alvo/data); o resultado completo
+#  fica comprimido em `run_payloads`, lido apenas em GET /api/runs/{id}.
+#  As gravações passam por uma thread única que agrupa o que estiver na
+#  fila num só commit (o chamador espera só pelo id).
+#  content_hash identifica o cenário (alimentador + versão do modelo +
+#  evento + parâmetros): run repetido devolve o resultado já gravado.
+#  `switch_state` guarda o estado de manobras do unifilar quando
+#  SIM_STATE_BACKEND=db (ver app/statestore.py).
+#   SIM_DB_URL   : URL do banco (SQLite em WAL por padrão)
+#   SIM_DB_POOL  : conexões mantidas no pool
+#   SIM_DB_BATCH : máximo de runs por commit
+# ------------------------------------------------------------------
 DB_URL = os.getenv("SIM_DB_URL", "sqlite:///./runs.db")
+DB_POOL = int(os.getenv("SIM_DB_POOL", "5"))
+DB_BATCH = int(os.getenv("SIM_DB_BATCH", "256"))
 
-engine = create_engine(DB_URL, echo=False, future=True)
-SessionLocal = sessionmaker(bind=engine, autoflush=False, autocommit=False, future=True)
+_SQLITE = DB_URL.startswith("sqlite")
+# SQLite em memória (sqlite:// ou :memory:): uma conexão só, compartilhada entre as threads (a de
+# gravação inclusive); o banco some com ela, e StaticPool não aceita tamanho de pool
+_MEMORY = _SQLITE and (DB_URL.rstrip("/") in ("sqlite:", "sqlite+pysqlite:") or ":memory:" in DB_URL
+                       or "mode=memory" in DB_URL)
+engine = create_engine(DB_URL, echo=False, future=True, pool_pre_ping=not _SQLITE,
+                       connect_args={"check_same_thread": False, "timeout": 30} if _SQLITE else {},
+                       **({"poolclass": StaticPool} if _MEMORY else {"pool_size": DB_POOL, "max_overflow": 2 * DB_POOL}))
+SessionLocal = sessionmaker(bind=engine, autoflush=False, autocommit=False, future=True, expire_on_commit=False)
 Base = declarative_base()
 
+if _SQLITE:
+    @event.listens_for(engine, "connect")
+    def _sqlite_pragmas(conn, _):
+        # WAL: leituras não bloqueiam a escrita; NORMAL basta com WAL (sem fsync por commit)
+        cur = conn.cursor()
+        for pragma in ("journal_mode=WAL", "synchronous=NORMAL", "foreign_keys=ON", "busy_timeout=30000"):
+            cur.execute(f"PRAGMA {pragma}")
+        cur.close()
+
 class Run(Base):
     __tablename__ = "runs"
     id = Column(Integer, primary_key=True, autoincrement=True)
@@ -16,8 +59,164 @@ class Run(Base):
     event_type = Column(String(32))
     target = Column(String(64))
     interruption_min = Column(Float)
-    result_json = Column(JSON)
+    model_version = Column(String(64))
+    content_hash = Column(String(64))      # NULL = não reaproveitável (invalidado ou legado)
+    result_json = deferred(Column(JSON))   # legado: runs anteriores a run_payloads
     created_at = Column(DateTime, default=datetime.utcnow)
 
+    __table_args__ = (
+        Index("ix_runs_feeder_id", "feeder", "id"),
+        Index("ix_runs_event_id", "event_type", "id"),
+        Index("ix_runs_target_id", "target", "id"),
+        Index("ix_runs_created_at", "created_at"),
+        Index("ix_runs_hash_id", "content_hash", "id"),
+        Index("ix_runs_model_version", "model_version"),
+    )
+
+class RunPayload(Base):
+    __tablename__ = "run_payloads"
+    run_id = Column(Integer, ForeignKey("runs.id", ondelete="CASCADE"), primary_key=True)
+    codec = Column(String(8), default="zlib")
+    data = Column(LargeBinary)
+
+class SwitchState(Base):
+    __tablename__ = "switch_state"
+    feeder = Column(String(64))
+    session = Column(String(64))           # "" = estado compartilhado do alimentador
+    version = Column(Integer, nullable=False)
+    token = Column(String(16))             # linhagem do registro (ETag); muda se for recriado
+    open = Column(JSON)
+    fault = Column(JSON)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    __table_args__ = (
+        PrimaryKeyConstraint("feeder", "session"),
+        Index("ix_switch_state_session", "session"),
+    )
+
+_READY = threading.Event()
+_INIT_LOCK = threading.Lock()
+
 def init_db():
+    """Cria/atualiza o esquema uma vez por processo (no aquecimento ou no primeiro uso do banco)."""
+    if _READY.is_set(): return
+    with _INIT_LOCK:
+        if not _READY.is_set():
+            _create_schema(); _READY.set()
+
+def _session():
+    init_db()
+    return SessionLocal()
+
+db_session = _session   # para os outros módulos: sessão com o esquema garantido
+
+def _create_schema():
     Base.metadata.create_all(engine)
+    # create_all não altera tabelas que já existiam (bancos antigos): colunas e índices novos aqui
+    have = {c["name"] for c in inspect(engine).get_columns(Run.__tablename__)}
+    with engine.begin() as conn:
+        for col in Run.__table__.columns:
+            if col.name not in have:
+                conn.exec_driver_sql(f"ALTER TABLE {Run.__tablename__} ADD COLUMN {col.name} "
+                                     f"{col.type.compile(engine.dialect)}")
+    for idx in Run.__table__.indexes:
+        idx.create(engine, checkfirst=True)
+
+def encode_payload(payload: Dict[str, Any]) -> bytes:
+    return zlib.compress(json.dumps(payload, separators=(",", ":"), default=str).encode(), 6)
+
+def decode_payload(codec: str, data: bytes) -> Dict[str, Any]:
+    if codec != "zlib":
+        raise ValueError(f"codec de payload desconhecido: {codec}")
+    return json.loads(zlib.decompress(data))
+
+class RunStore:
+    """Gravação agrupada de runs (uma thread, um commit por lote) e leitura paginada."""
+    def __init__(self, batch: int = DB_BATCH):
+        self.batch = batch
+        self._queue: "queue.Queue[Tuple[dict, bytes, Future]]" = queue.Queue()
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+
+    def _ensure_thread(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._loop, name="sim-db-writer", daemon=True)
+                self._thread.start()
+
+    def add(self, payload: Dict[str, Any], wait: bool = True, **meta) -> Optional[int]:
+        """Enfileira o run (compressão aqui, na thread do chamador); com wait=True devolve o id."""
+        fut: Future = Future()
+        with span("db.encode"): blob = encode_payload(payload)
+        self._queue.put((meta, blob, fut))
+        self._ensure_thread()
+        if not wait: return None
+        with span("db.add_wait"): return fut.result()
+
+    def flush(self):
+        """Espera a fila de gravação esvaziar."""
+        self._queue.join()
+
+    def _loop(self):
+        while True:
+            items = [self._queue.get()]
+            while len(items) < self.batch:
+                try: items.append(self._queue.get_nowait())
+                except queue.Empty: break
+            try:
+                with span("db.commit"), _session() as s:
+                    runs = [Run(**meta) for meta, _, _ in items]
+                    s.add_all(runs); s.flush()   # ids atribuídos (insert em lote)
+                    s.add_all([RunPayload(run_id=r.id, codec="zlib", data=blob) for r, (_, blob, _) in zip(runs, items)])
+                    s.commit()
+                count("db.runs_written", len(items)); count("db.commits")
+                for r, (_, _, fut) in zip(runs, items): fut.set_result(r.id)
+            except Exception as e:
+                for _, _, fut in items: fut.set_exception(e)
+            finally:
+                for _ in items: self._queue.task_done()
+
+    def list(self, limit: int = 20, before: Optional[int] = None, feeder: Optional[str] = None,
+             event_type: Optional[str] = None, target: Optional[str] = None,
+             since: Optional[datetime] = None, until: Optional[datetime] = None) -> List[Run]:
+        """Mais recentes primeiro; paginação por chave (before = menor id da página anterior)."""
+        with _session() as s:
+            q = s.query(Run)
+            if before is not None: q = q.filter(Run.id < before)
+            if feeder: q = q.filter(Run.feeder == feeder)
+            if event_type: q = q.filter(Run.event_type == event_type)
+            if target: q = q.filter(Run.target == target)
+            if since: q = q.filter(Run.created_at >= since)
+            if until: q = q.filter(Run.created_at < until)
+            return q.order_by(Run.id.desc()).limit(limit).all()
+
+    def find(self, content_hash: str) -> Optional[Tuple[int, Dict[str, Any]]]:
+        """Run mais recente com este conteúdo: (id, payload), ou None."""
+        with _session() as s:
+            r = (s.query(Run.id).filter(Run.content_hash == content_hash)
+                 .order_by(Run.id.desc()).first())
+        if r is None:
+            return None
+        payload = self.load(r.id)
+        return None if payload is None else (r.id, payload)
+
+    def invalidate(self, model_version: Optional[str] = None, feeder: Optional[str] = None) -> int:
+        """Tira do reaproveitamento os runs do filtro (o histórico continua); devolve quantos."""
+        self.flush()
+        stmt = update(Run).where(Run.content_hash.is_not(None))
+        if model_version is not None: stmt = stmt.where(Run.model_version == model_version)
+        if feeder is not None: stmt = stmt.where(Run.feeder == feeder)
+        with _session() as s:
+            n = s.execute(stmt.values(content_hash=None)).rowcount
+            s.commit()
+        return n
+
+    def load(self, run_id: int) -> Optional[Dict[str, Any]]:
+        with _session() as s:
+            p = s.get(RunPayload, run_id)
+            if p is not None:
+                return decode_payload(p.codec, p.data)
+            r = s.get(Run, run_id)
+            return None if r is None else r.result_json
+
+RUNS = RunStore()
@@ -0,0 +1,243 @@
+import heapq
+import os
+from dataclasses import dataclass, field
+from typing import Iterable, List, Optional, Set, Tuple
+
+import numpy as np
+
+from .events import Event, parse_target
+from .model import customers_from_mw
+from .ops import StepCallback, apply_switching, energized_mask, load_index, run_powerflow
+from .planner import isolation_zones, plan_restoration
+from .profiling import count, span
+from .radial import energized_after
+from .topology import name_index
+
+# ------------------------------------------------------------------
+#  Motor de eventos discretos: uma fila de prioridade (heapq) com os
+#  eventos da requisição (defeitos, indisponibilidades, reparos, manobras
+#  manuais) e os que eles geram (religamento, reparo agendado, manobras
+#  do plano de recomposição). O estado só muda nas fronteiras dos
+#  eventos; energização (e fluxo, com limites) só é recalculada quando a
+#  topologia muda, e clientes·min / MW·min são integrados exatamente
+#  entre uma fronteira e a próxima.
+#  Replanejamento: a partir da configuração de referência (chaves NA +
+#  manobras manuais), com todos os defeitos isolados e os dispositivos
+#  indisponíveis travados; o plano vira manobras espaçadas de step_min
+#  e um plano novo cancela as manobras pendentes do anterior. Eventos
+#  dentro do mesmo step_min compartilham um único replanejamento.
+#   SIM_ENGINE_STEP_MIN      : minutos por manobra (e até o replanejamento)
+#   SIM_ENGINE_PLAN_BUDGET_S : orçamento de busca de cada replanejamento
+# ------------------------------------------------------------------
+STEP_MIN = float(os.getenv("SIM_ENGINE_STEP_MIN", "1.0"))
+PLAN_BUDGET_S = float(os.getenv("SIM_ENGINE_PLAN_BUDGET_S", "0.25"))
+TEMPORARY_MIN = 2.0             # religamento de falha temporária sem duration_min
+
+# no mesmo instante: mudanças de estado, depois manobras, depois o replanejamento
+_STATE, _OP, _REPLAN = 0, 1, 2
+
+@dataclass
+class EngineResult:
+    timeline: List[dict]
+    horizon_min: float
+    customer_min: float
+    mw_min: float
+    interruptions: int              # clientes que perderam energia (cada queda conta)
+    peak_customers: int
+    final_customers: int
+    curve: List[list]               # [t, clientes sem energia, MW sem energia] a cada mudança
+    phases: List[Tuple[float, np.ndarray]] = field(default_factory=list)  # (min, cargas desligadas)
+    events: int = 0
+    replans: int = 0
+    solves: int = 0
+    notes: List[str] = field(default_factory=list)
+
+class Engine:
+    def __init__(self, net, normally_open: Iterable[str], limits: Optional[dict] = None,
+                 step_min: float = STEP_MIN, plan_budget_s: float = PLAN_BUDGET_S,
+                 on_step: Optional[StepCallback] = None, track_phases: bool = False):
+        self.net = net; self.limits = limits; self.on_step = on_step
+        self.step_min = max(0.0, step_min); self.plan_budget_s = plan_budget_s
+        self.base_open: Set[str] = set(normally_open)     # referência: NA + manobras manuais
+        self.faulted: Set[str] = set(); self.tripped: Set[str] = set(); self.out: Set[str] = set()
+        self._heap: list = []; self._seq = 0; self._gen = 0; self._replan_pending = False
+        self._pos = name_index(net).line_pos
+        self._bus_pos = load_index(net).bus_pos
+        self._p = net.load.p_mw.values.astype(float)
+        # cargas já sem fonte na configuração inicial não contam como interrupção
+        self._base_off = ~self._mask()[self._bus_pos]
+        self._off = np.zeros(len(self._p), dtype=bool)
+        self._c_off = 0; self._p_off = 0.0
+        self.t = 0.0; self._track = track_phases
+        self.res = EngineResult([], 0.0, 0.0, 0.0, 0, 0, 0, [[0.0, 0, 0.0]])
+
+    # ---------- fila ----------
+    def _push(self, t: float, order: int, action: str, arg=None):
+        heapq.heappush(self._heap, (t, order, self._seq, action, arg)); self._seq += 1
+
+    def schedule(self, events: Iterable[Event]):
+        for ev in events:
+            self._push(float(ev.t0_min), _STATE, "event", ev)
+
+    def run(self, horizon_min: Optional[float] = None) -> EngineResult:
+        """Processa a fila até esvaziar (ou até horizon_min) e integra até o horizonte."""
+        with span("engine.run"):
+            while self._heap:
+                t = self._heap[0][0]
+                if horizon_min is not None and t > horizon_min: break
+                self._advance(t)
+                changed = False
+                while self._heap and self._heap[0][0] == t:
+                    _, _, _, action, arg = heapq.heappop(self._heap)
+                    changed |= getattr(self, "_do_" + action)(t, arg)
+                if changed: self._settle(t)
+            self._advance(self.t if horizon_min is None else max(self.t, horizon_min))
+        res = self.res
+        res.horizon_min = self.t; res.final_customers = self._c_off
+        res.customer_min = float(res.customer_min); res.mw_min = float(res.mw_min)
+        return res
+
+    # ---------- integração ----------
+    def _mask(self) -> np.ndarray:
+        on = energized_after(self.net)         # índice radial; None se malhada
+        return energized_mask(self.net) if on is None else on
+
+    def _advance(self, t: float):
+        dt = t - self.t
+        if dt <= 0: return
+        self.res.customer_min += self._c_off * dt; self.res.mw_min += self._p_off * dt
+        if self._track:
+            ph = self.res.phases
+            if ph and ph[-1][1] is self._off: ph[-1] = (ph[-1][0] + dt, self._off)
+            else: ph.append((dt, self._off))
+        self.t = t
+
+    def _settle(self, t: float):
+        """Topologia mudou no instante t: recalcula o que está sem energia (e o fluxo, com limites)."""
+        off = ~self._mask()[self._bus_pos] & ~self._base_off
+        new = off & ~self._off
+        if new.any():
+            self.res.interruptions += customers_from_mw(float(self._p[new].sum()))
+        self._off = off
+        self._p_off = float(self._p[off].sum()); self._c_off = customers_from_mw(self._p_off)
+        self.res.peak_customers = max(self.res.peak_customers, self._c_off)
+        if self.res.curve[-1][1:] != [self._c_off, round(self._p_off, 6)]:
+            self.res.curve.append([round(t, 4), self._c_off, round(self._p_off, 6)])
+        if self.limits:
+            ok, err = run_powerflow(self.net, warm=True); self.res.solves += 1
+            if not ok: self._log(t, f"fluxo falhou: {err}")
+
+    # ---------- estado ----------
+    def _log(self, t: float, op: str):
+        entry = {"t": round(t, 4), "op": op}
+        self.res.timeline.append(entry)
+        if self.on_step: self.on_step(entry, self.net)
+
+    def _set(self, t: float, name: str, closed: bool, op: str) -> bool:
+        pos = self._pos.get(name)
+        if pos is None:
+            self.res.notes.append(f"{name}: linha desconhecida"); return False
+        col = self.net.line["in_service"].values
+        changed = bool(col[pos]) != closed
+        if changed:
+            col = col.astype(bool); col[pos] = closed; self.net.line["in_service"] = col
+        self._log(t, op)
+        return changed
+
+    def _locked(self) -> Set[str]:
+        return self.faulted | self.tripped | self.out
+
+    def _request_replan(self, t: float):
+        if not self._replan_pending:
+            self._replan_pending = True
+            self._push(t + self.step_min, _REPLAN, "replan")
+
+    def _do_event(self, t: float, ev: Event) -> bool:
+        kind, name = parse_target(ev.target)
+        self.res.events += 1; count("engine.events")
+        if kind != "line":
+            self.res.notes.append(f"{ev.target}: alvo não suportado"); return False
+        dur = ev.duration_min
+        if ev.type == "fault_permanent":
+            self.faulted.add(name)
+            if dur > 0: self._push(t + dur, _STATE, "event", Event("repair", ev.target, t + dur))
+            self._request_replan(t)
+            return self._set(t, name, False, f"abrir {name} (defeito permanente)")
+        if ev.type == "fault_temporary":
+            self.tripped.add(name)
+            self._push(t + (dur or TEMPORARY_MIN), _STATE, "reclose", name)
+            return self._set(t, name, False, f"abrir {name} (falha temporária)")
+        if ev.type == "device_out":
+            self.out.add(name)
+            if dur > 0: self._push(t + dur, _STATE, "back", name)
+            self._request_replan(t)
+            return self._set(t, name, False, f"indisponibilidade: {name}")
+        if ev.type == "repair":
+            self.faulted.discard(name)
+            self._log(t, f"reparo concluído: {name}")
+            self._request_replan(t)
+            return False
+        if ev.type == "switch_open":
+            self.base_open.add(name)
+            return self._set(t, name, False, f"abrir {name} (manual)")
+        if ev.type == "switch_close":
+            self.base_open.discard(name)
+            if name in self._locked():
+                self._log(t, f"fechar {name} recusado: em defeito/indisponível"); return False
+            return self._set(t, name, True, f"fechar {name} (manual)")
+        self.res.notes.append(f"{ev.type}: tipo não suportado"); return False
+
+    def _do_reclose(self, t: float, name: str) -> bool:
+        self.tripped.discard(name)
+        if name in self.faulted or name in self.out or name in self.base_open: return False
+        return self._set(t, name, True, f"religar {name} (após falha temporária)")
+
+    def _do_back(self, t: float, name: str) -> bool:
+        self.out.discard(name)
+        self._log(t, f"{name} disponível")
+        self._request_replan(t)
+        return False
+
+    def _do_op(self, t: float, arg) -> bool:
+        gen, closed, name = arg
+        if gen != self._gen: return False                  # plano substituído por outro
+        if closed and name in self._locked(): return False
+        return self._set(t, name, closed, f"{'fechar' if closed else 'abrir'} {name}")
+
+    def _do_replan(self, t: float, _arg=None) -> bool:
+        """Configuração-alvo a partir da referência; vira manobras a cada step_min a partir de t."""
+        self._replan_pending = False
+        self._gen += 1; self.res.replans += 1; count("engine.replans")
+        net = self.net
+        current = net.line.in_service.values.astype(bool)
+        locked = self._locked()
+        with span("engine.replan"):
+            net.line["in_service"] = True
+            apply_switching(net, open_names=self.base_open | locked)
+            boundary = set(isolation_zones(net, self.faulted)[1])
+            apply_switching(net, open_names=boundary)
+            plan = plan_restoration(net, None, locked=locked | boundary, limits=self.limits,
+                                    budget_s=self.plan_budget_s, workers=0)
+            target = net.line.in_service.values.astype(bool)
+            net.line["in_service"] = current
+        if not plan.complete:
+            self.res.notes.append(f"t={round(t, 4)}: busca de recomposição interrompida pelo orçamento")
+        names = net.line.name.tolist()
+        # aberturas antes dos fechamentos: cada estado intermediário é subconjunto do alvo (radial)
+        opens = [names[i] for i in np.flatnonzero(current & ~target).tolist()]
+        planned = [n for op, n in plan.steps if op == "fechar"]
+        closes = {names[i] for i in np.flatnonzero(~current & target).tolist()}
+        # volta da referência primeiro; os fechamentos do plano na ordem em que foram escolhidos
+        closes = sorted(closes - set(planned)) + [n for n in planned if n in closes]
+        k = 0
+        for closed, batch in ((False, opens), (True, closes)):
+            for name in batch:
+                self._push(t + k * self.step_min, _OP, "op", (self._gen, closed, name)); k += 1
+        return False
+
+def run_events(net, normally_open: Iterable[str], events: Iterable[Event], horizon_min: Optional[float] = None,
+               **kw) -> EngineResult:
+    """Atalho: agenda os eventos numa rede na configuração normal e roda até o horizonte."""
+    eng = Engine(net, normally_open, **kw)
+    eng.schedule(events)
+    return eng.run(horizon_min)
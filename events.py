@@ -1,7 +1,14 @@
-from dataclasses import dataclass
-from typing import Optional, Literal
+from dataclasses import dataclass, fields
+from typing import Any, List, Optional, Literal, get_args
 
-EventType = Literal["fault_permanent", "fault_temporary", "device_out"]
+# fault_permanent: duration_min > 0 agenda o reparo; fault_temporary: religamento após duration_min;
+# device_out: duration_min > 0 agenda a volta do dispositivo; repair: fim de um defeito permanente;
+# switch_open/switch_close: manobra manual (muda a configuração de referência)
+EventType = Literal["fault_permanent", "fault_temporary", "device_out", "repair", "switch_open", "switch_close"]
+EVENT_TYPES = get_args(EventType)
+
+class EventError(ValueError):
+    """Evento inválido na requisição; a API responde 400."""
 
 @dataclass
 class Event:
@@ -14,3 +21,26 @@ class Event:
 def parse_target(target: str):
     kind, name = target.split(":", 1)
     return kind, name
+
+def parse_events(items: Any) -> List[Event]:
+    """Lista de dicts da requisição -> eventos validados (ordem da lista preservada)."""
+    if not isinstance(items, list) or not items:
+        raise EventError("events deve ser uma lista não vazia")
+    known = {f.name for f in fields(Event)}
+    out = []
+    for i, item in enumerate(items):
+        if not isinstance(item, dict) or not set(item) <= known:
+            raise EventError(f"events[{i}]: campos aceitos: {', '.join(sorted(known))}")
+        if item.get("type") not in EVENT_TYPES:
+            raise EventError(f"events[{i}]: type deve ser um de {', '.join(EVENT_TYPES)}")
+        if not isinstance(item.get("target"), str) or ":" not in item["target"]:
+            raise EventError(f"events[{i}]: target no formato 'line:<nome>'")
+        try:
+            ev = Event(**{**item, "t0_min": float(item.get("t0_min", 0.0)),
+                          "duration_min": float(item.get("duration_min", 0.0))})
+        except (TypeError, ValueError):
+            raise EventError(f"events[{i}]: t0_min/duration_min numéricos")
+        if ev.t0_min < 0 or ev.duration_min < 0:
+            raise EventError(f"events[{i}]: t0_min/duration_min não podem ser negativos")
+        out.append(ev)
+    return out
@@ -0,0 +1,439 @@
+import copy
+import gzip
+import hashlib
+import json
+import os
+import struct
+from collections import OrderedDict
+from dataclasses import dataclass
+from pathlib import Path
+from threading import Lock
+from typing import Any, Callable, Dict, FrozenSet, List, Optional, Tuple
+
+import numpy as np
+
+try:
+    import brotli   # opcional: sem ele o unifilar sai só em gzip
+except ImportError:
+    brotli = None
+
+from .model import is_switch
+from .synthetic import GENERATOR_VERSION, build_synthetic, params_for
+from .topology import connectivity, share_indices
+
+# ------------------------------------------------------------------
+#  Registro de alimentadores: além do W0321P3 (montado em código), cada
+#  arquivo em SIM_FEEDER_DIR é um alimentador, carregado só no primeiro
+#  uso e mantido num LRU de templates:
+#   <id>.json          rede pandapower (pp.to_json); coordenadas de
+#                      net.bus.geo ou de <id>.layout.json
+#   <id>/              formato tabular compacto: buses.csv, lines.csv,
+#                      trafos.csv (opcional), loads.csv
+#  Com SIM_SYNTHETIC=1 (bench e testes), ids SYN-<barras> geram
+#  alimentadores sintéticos (synthetic.py).
+#  Linhas fora de serviço no arquivo são as chaves normalmente abertas;
+#  o template guarda todas em serviço (igual ao W0321P3). Chaves do
+#  pandapower (net.switch) viram linhas na carga; trafo3w é recusado (422).
+#   SIM_FEEDER_DIR     : diretório dos arquivos
+#   SIM_FEEDER_CACHE   : templates mantidos em memória
+#   SIM_DEFAULT_FEEDER : alimentador das chamadas sem "feeder"
+#   SIM_LAYOUT_CACHE   : diretório do unifilar já codificado, por id + versão
+#                        do alimentador ("" desliga); com ele, /api/topology
+#                        de um processo novo não monta o template
+#   SIM_SYNTHETIC      : 1 habilita a família SYN-<barras> (padrão 0)
+#   SIM_SYNTHETIC_MAX  : maior SYN-<barras> aceito
+# ------------------------------------------------------------------
+FEEDER_DIR = Path(os.getenv("SIM_FEEDER_DIR", "feeders"))
+MAX_TEMPLATES = int(os.getenv("SIM_FEEDER_CACHE", "16"))
+DEFAULT_FEEDER = os.getenv("SIM_DEFAULT_FEEDER", "W0321P3")
+LAYOUT_CACHE = os.getenv("SIM_LAYOUT_CACHE", "layout-cache")
+SYNTHETIC = os.getenv("SIM_SYNTHETIC", "0") == "1"
+SYNTHETIC_MAX = int(os.getenv("SIM_SYNTHETIC_MAX", "20000"))
+
+class UnknownFeeder(KeyError):
+    """Alimentador inexistente; a API responde 404."""
+
+class InvalidFeeder(ValueError):
+    """Arquivo de alimentador com elementos que o simulador não modela; a API responde 422."""
+
+class Feeder:
+    """Alimentador carregado: template pristino (somente leitura), chaves NA e layout."""
+    def __init__(self, feeder_id: str, version: Callable[[], str], template: Callable[[], Any],
+                 normally_open: FrozenSet[str], layout: Callable[[Any], dict], stamp: Any = None):
+        self.id = feeder_id
+        self._version = version; self._template = template; self._layout_fn = layout
+        self.normally_open = normally_open
+        self.stamp = stamp          # identifica a versão do arquivo de origem
+        self._layout: Optional[dict] = None
+        self._encoded: Dict[str, "EncodedLayout"] = {}
+        self._lock = Lock()
+
+    @property
+    def version(self) -> str:
+        return self._version()
+
+    def template(self):
+        return self._template()
+
+    def new_network(self):
+        """Cópia independente do template, pronta para manobras e runpp."""
+        tpl = self.template()
+        net = copy.deepcopy(tpl)
+        share_indices(tpl, net)
+        return net
+
+    def layout(self) -> dict:
+        """Geometria do unifilar + `index`: nomes na ordem das posições usadas pelo estado compacto."""
+        with self._lock:
+            if self._layout is None:
+                tpl = self.template()
+                self._layout = {**self._layout_fn(tpl),
+                                "index": {"buses": tpl.bus.name.astype(str).tolist(), "lines": tpl.line.name.tolist()}}
+            return self._layout
+
+    def encoded_layout(self, fmt: str = "json") -> "EncodedLayout":
+        """Layout serializado e comprimido uma única vez por formato ("json" ou "bin")."""
+        with self._lock:
+            enc = self._encoded.get(fmt)
+        if enc is None:
+            enc = _read_layout_cache(self.id, self.version, fmt)
+            if enc is None:
+                enc = encode_layout(self.layout(), fmt)
+                _write_layout_cache(self.id, self.version, fmt, enc)
+            with self._lock:
+                enc = self._encoded.setdefault(fmt, enc)
+        return enc
+
+# ---------- unifilar serializado ----------
+# "bin" (little-endian): b"TOP1", u32 n_bus, n_line, n_trafo, n_names; float32 (x, y) por barra
+# na ordem de index.buses (NaN sem coordenada); u32 (de, para) por linha e por trafo, em
+# posições de barra; e um JSON utf-8 com os nomes {buses, lines, trafos[, index_lines]}.
+LAYOUT_MEDIA = {"json": "application/json", "bin": "application/octet-stream"}
+
+@dataclass
+class EncodedLayout:
+    etag: str
+    media_type: str
+    bodies: Dict[str, bytes]    # content-encoding ("identity", "gzip", "br") -> bytes
+
+def pack_layout(layout: dict) -> bytes:
+    buses = layout["index"]["buses"]
+    pos = {n: i for i, n in enumerate(buses)}
+    nan = [float("nan")] * 2
+    xy = np.array([layout["buses"].get(n, nan) for n in buses], dtype="<f4").reshape(-1, 2)
+    def edges(items):  # barra desconhecida -> 0xFFFFFFFF
+        return np.array([(pos.get(a, -1), pos.get(b, -1)) for _, a, b in items], dtype=np.int64).reshape(-1, 2).astype("<u4")
+    names = {"buses": buses, "lines": [n for n, _, _ in layout["lines"]], "trafos": [n for n, _, _ in layout["trafos"]]}
+    if names["lines"] != layout["index"]["lines"]:
+        names["index_lines"] = layout["index"]["lines"]
+    blob = json.dumps(names, separators=(",", ":")).encode()
+    head = b"TOP1" + struct.pack("<4I", len(buses), len(layout["lines"]), len(layout["trafos"]), len(blob))
+    return head + xy.tobytes() + edges(layout["lines"]).tobytes() + edges(layout["trafos"]).tobytes() + blob
+
+def encode_layout(layout: dict, fmt: str = "json") -> EncodedLayout:
+    if fmt not in LAYOUT_MEDIA:
+        raise ValueError(f"formato de topologia desconhecido: {fmt}")
+    raw = pack_layout(layout) if fmt == "bin" else json.dumps(layout, separators=(",", ":")).encode()
+    bodies = {"identity": raw, "gzip": gzip.compress(raw, compresslevel=9, mtime=0)}
+    if brotli is not None:
+        bodies["br"] = brotli.compress(raw)
+    return EncodedLayout(f'"{hashlib.sha256(raw).hexdigest()[:32]}"', LAYOUT_MEDIA[fmt], bodies)
+
+# ---------- cache em disco ----------
+# <id>-<hash da versão>.<fmt>[.gz|.br]: o corpo sem compressão define o ETag, as variantes
+# comprimidas que faltarem são refeitas. Mudou o unifilar, muda a versão (MODEL_VERSION etc.).
+_CACHE_FORMAT = "1"
+
+def _layout_cache_path(feeder_id: str, version: str, fmt: str) -> Optional[Path]:
+    if not LAYOUT_CACHE: return None
+    key = hashlib.sha1(f"{_CACHE_FORMAT}:{feeder_id}:{version}".encode()).hexdigest()[:16]
+    safe = "".join(c if c.isalnum() or c in "-_" else "_" for c in feeder_id)
+    return Path(LAYOUT_CACHE) / f"{safe}-{key}.{fmt}"
+
+def _read_layout_cache(feeder_id: str, version: str, fmt: str) -> Optional[EncodedLayout]:
+    path = _layout_cache_path(feeder_id, version, fmt)
+    if path is None or not path.is_file(): return None
+    try:
+        raw = path.read_bytes()
+        bodies = {"identity": raw}
+        for coding, ext in (("gzip", ".gz"), ("br", ".br")):
+            alt = path.with_name(path.name + ext)
+            if alt.is_file(): bodies[coding] = alt.read_bytes()
+    except OSError:
+        return None
+    if "gzip" not in bodies: bodies["gzip"] = gzip.compress(raw, compresslevel=9, mtime=0)
+    if brotli is not None and "br" not in bodies: bodies["br"] = brotli.compress(raw)
+    return EncodedLayout(f'"{hashlib.sha256(raw).hexdigest()[:32]}"', LAYOUT_MEDIA[fmt], bodies)
+
+def _write_layout_cache(feeder_id: str, version: str, fmt: str, enc: EncodedLayout):
+    path = _layout_cache_path(feeder_id, version, fmt)
+    if path is None: return
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        for coding, ext in (("identity", ""), ("gzip", ".gz"), ("br", ".br")):
+            if coding not in enc.bodies: continue
+            tmp = path.with_name(f"{path.name}{ext}.{os.getpid()}.tmp")
+            tmp.write_bytes(enc.bodies[coding]); os.replace(tmp, path.with_name(path.name + ext))
+    except OSError:
+        pass   # cache é só otimização: disco somente leitura não impede servir
+
+# ---------- formatos de arquivo ----------
+def _split_open(net) -> FrozenSet[str]:
+    """Linhas fora de serviço no arquivo viram as chaves NA; o template fica com todas fechadas."""
+    mask = ~net.line.in_service.values.astype(bool)
+    normally_open = frozenset(n for n in net.line.name.values[mask].tolist() if n)
+    net.line["in_service"] = True
+    return normally_open
+
+def _fold_switches(net, source: str):
+    """
+    O simulador manobra linhas (chaves são linhas RCL-*/CH-*/tie) e a conectividade só
+    conhece net.line e net.trafo; as chaves do pandapower viram isso:
+     et="l"/"t" : chave aberta tira a linha/trafo de serviço (linha aberta -> chave NA)
+     et="b"     : linha curta CH-<nome da chave> (aberta se a chave estiver aberta)
+    trafo3w é recusado: conectividade, varredura e layout só tratam trafos de 2 enrolamentos.
+    """
+    import pandapower as pp
+    if "trafo3w" in net and len(net.trafo3w):
+        raise InvalidFeeder(f"{source}: trafo3w não suportado")
+    if "switch" not in net or not len(net.switch):
+        return
+    sw = net.switch
+    closed = sw.closed.values.astype(bool)
+    names = [n if isinstance(n, str) and n else f"SW{k}" for k, n in zip(sw.index.tolist(), sw.name.tolist())]
+    for et, table in (("l", "line"), ("t", "trafo")):
+        cut = sw.element.values[(sw.et.values == et) & ~closed]
+        if len(cut): net[table].loc[cut, "in_service"] = False
+    for i in np.flatnonzero((sw.et.values == "l") & ~closed).tolist():
+        line = sw.element.values[i]                         # sem nome a chave NA se perderia em _split_open
+        cur = net.line.at[line, "name"]
+        if not (isinstance(cur, str) and cur): net.line.at[line, "name"] = f"CH-{names[i]}"
+    for i in np.flatnonzero(sw.et.values == "b").tolist():
+        row = sw.iloc[i]
+        z = float(row.get("z_ohm", 0.0) or 0.0) or 1e-4     # impedância mínima: NR não aceita ramo nulo
+        name = names[i] if is_switch(names[i]) else f"CH-{names[i]}"
+        pp.create_line_from_parameters(net, int(row.bus), int(row.element), length_km=1.0, r_ohm_per_km=z,
+                                       x_ohm_per_km=z, c_nf_per_km=0.0, max_i_ka=10.0, name=name,
+                                       in_service=bool(closed[i]))
+    net.switch = sw.iloc[0:0]
+
+def _read_pandapower(path: Path):
+    import pandapower as pp  # import tardio: o servidor sobe sem a pilha do pandapower
+    net = pp.from_json(str(path))
+    _fold_switches(net, path.name)
+    coords = {}
+    if "geo" in net.bus:
+        for name, geo in zip(net.bus.name.tolist(), net.bus.geo.tolist()):
+            if isinstance(geo, str) and geo:
+                xy = json.loads(geo).get("coordinates")
+                if xy: coords[name] = [float(xy[0]), float(xy[1])]
+    side = path.with_name(path.stem + ".layout.json")
+    if side.is_file():
+        coords.update(json.loads(side.read_text(encoding="utf-8")).get("buses", {}))
+    return net, coords
+
+def _read_tabular(path: Path):
+    """
+    buses.csv : name, vn_kv[, x, y, slack]  (slack=1 na barra da fonte)
+    lines.csv : name, from, to, length_km, r_ohm_per_km, x_ohm_per_km, c_nf_per_km, max_i_ka[, in_service]
+    trafos.csv: name, hv, lv, sn_mva, vn_hv_kv, vn_lv_kv, vk_percent, vkr_percent[, pfe_kw, i0_percent]
+    loads.csv : name, bus, p_mw[, q_mvar]
+    """
+    import pandas as pd
+    import pandapower as pp  # import tardio: o servidor sobe sem a pilha do pandapower
+    buses = pd.read_csv(path / "buses.csv")
+    lines = pd.read_csv(path / "lines.csv")
+    loads = pd.read_csv(path / "loads.csv")
+    trafos = pd.read_csv(path / "trafos.csv") if (path / "trafos.csv").is_file() else None
+
+    net = pp.create_empty_network(sn_mva=100.)
+    idx = pp.create_buses(net, len(buses), vn_kv=buses.vn_kv.values, name=buses.name.astype(str).values)
+    bus_of = dict(zip(buses.name.astype(str).tolist(), idx.tolist()))
+    def at(col): return [bus_of[str(n)] for n in col]
+
+    pp.create_lines_from_parameters(
+        net, at(lines["from"]), at(lines["to"]), lines.length_km.values, lines.r_ohm_per_km.values,
+        lines.x_ohm_per_km.values, lines.c_nf_per_km.values, lines.max_i_ka.values,
+        name=lines.name.astype(str).values,
+        in_service=lines.in_service.astype(bool).values if "in_service" in lines else True)
+    if trafos is not None and len(trafos):
+        pp.create_transformers_from_parameters(
+            net, at(trafos.hv), at(trafos.lv), trafos.sn_mva.values, trafos.vn_hv_kv.values,
+            trafos.vn_lv_kv.values, trafos.vkr_percent.values, trafos.vk_percent.values,
+            trafos.pfe_kw.values if "pfe_kw" in trafos else 0.0,
+            trafos.i0_percent.values if "i0_percent" in trafos else 0.0,
+            name=trafos.name.astype(str).values)
+    pp.create_loads(net, at(loads.bus), p_mw=loads.p_mw.values,
+                    q_mvar=loads.q_mvar.values if "q_mvar" in loads else 0.0,
+                    name=loads.name.astype(str).values)
+    slack = buses.slack.astype(bool).values if "slack" in buses else (buses.index == 0)
+    for b in idx[slack].tolist():
+        pp.create_ext_grid(net, b, vm_pu=1.0)
+
+    coords = {}
+    if {"x", "y"} <= set(buses.columns):
+        ok = buses.x.notna() & buses.y.notna()
+        coords = {str(n): [float(x), float(y)] for n, x, y in
+                  zip(buses.name[ok], buses.x[ok], buses.y[ok])}
+    return net, coords
+
+def _auto_coords(net, coords: Dict[str, List[float]]) -> Dict[str, List[float]]:
+    """
+    Barras sem coordenada: x pela distância (em ramos) até a fonte, y pela
+    ordem em cada nível, abaixo das barras já posicionadas.
+    """
+    conn = connectivity(net)
+    names = net.bus.name.astype(str).tolist()
+    depth = [-1] * conn.n_bus
+    frontier = net.bus.index.get_indexer(net.ext_grid.bus.values).tolist()
+    for s in frontier: depth[s] = 0
+    while frontier:
+        nxt = []
+        for u in frontier:
+            for v, _ in conn.adj[u]:
+                if depth[v] < 0:
+                    depth[v] = depth[u] + 1; nxt.append(v)
+        frontier = nxt
+    rows: Dict[int, int] = {}
+    out = dict(coords)
+    y0 = min((xy[1] for xy in coords.values()), default=10.0) - 10.0
+    for p, name in enumerate(names):
+        if name in out: continue
+        d = max(depth[p], 0); rows[d] = rows.get(d, 0) + 1
+        out[name] = [20.0 * d, y0 - 10.0 * (rows[d] - 1)]
+    return out
+
+def _layout_from_net(coords: Dict[str, List[float]]) -> Callable[[Any], dict]:
+    def build(net) -> dict:
+        names = net.bus.name.astype(str).tolist()
+        pos = net.bus.index
+        f = pos.get_indexer(net.line.from_bus.values).tolist(); t = pos.get_indexer(net.line.to_bus.values).tolist()
+        hv = pos.get_indexer(net.trafo.hv_bus.values).tolist(); lv = pos.get_indexer(net.trafo.lv_bus.values).tolist()
+        return {"buses": _auto_coords(net, coords),
+                "lines": [(n, names[a], names[b]) for n, a, b in zip(net.line.name.tolist(), f, t)],
+                "trafos": [(n, names[a], names[b]) for n, a, b in zip(net.trafo.name.tolist(), hv, lv)]}
+    return build
+
+def _source_stamp(path: Path) -> Tuple[Tuple[str, int, int], ...]:
+    files = sorted(path.iterdir()) if path.is_dir() else [path, path.with_name(path.stem + ".layout.json")]
+    return tuple((f.name, f.stat().st_mtime_ns, f.stat().st_size) for f in files if f.is_file())
+
+def _load_file(feeder_id: str, path: Path, stamp) -> Feeder:
+    net, coords = _read_tabular(path) if path.is_dir() else _read_pandapower(path)
+    normally_open = _split_open(net)
+    version = f"{feeder_id}-{hashlib.sha1(repr(stamp).encode()).hexdigest()[:12]}"
+    return Feeder(feeder_id, lambda: version, lambda: net, normally_open, _layout_from_net(coords), stamp)
+
+# ---------- registro ----------
+class FeederRegistry:
+    def __init__(self, root: Path = FEEDER_DIR, max_loaded: int = MAX_TEMPLATES):
+        self.root = Path(root); self.max_loaded = max(1, max_loaded)
+        self._builtin: Dict[str, Callable[[], Feeder]] = {}
+        self._families: Dict[str, Callable[[str], Optional[Callable[[], Feeder]]]] = {}
+        self._loaded: "OrderedDict[str, Feeder]" = OrderedDict()
+        self._lock = Lock()
+        self._loading: Dict[str, Lock] = {}
+
+    def register(self, feeder_id: str, factory: Callable[[], Feeder]):
+        """Alimentador montado em código (não passa pelo LRU de arquivos)."""
+        self._builtin[feeder_id] = factory
+
+    def register_family(self, prefix: str, resolve: Callable[[str], Optional[Callable[[], Feeder]]]):
+        """Família de alimentadores gerados por id (ex.: SYN-2000): resolve(id) -> fábrica ou None."""
+        self._families[prefix] = resolve
+
+    def _factory(self, feeder_id: str) -> Optional[Callable[[], Feeder]]:
+        if feeder_id in self._builtin:
+            return self._builtin[feeder_id]
+        for prefix, resolve in self._families.items():
+            if feeder_id.startswith(prefix):
+                return resolve(feeder_id)
+        return None
+
+    def _path(self, feeder_id: str) -> Optional[Path]:
+        if not feeder_id or "/" in feeder_id or "\\" in feeder_id or feeder_id.startswith("."):
+            return None
+        for p in (self.root / f"{feeder_id}.json", self.root / feeder_id):
+            if p.is_file() or (p.is_dir() and (p / "buses.csv").is_file()):
+                return p
+        return None
+
+    def exists(self, feeder_id: str) -> bool:
+        """Se get(feeder_id) resolveria o id (inclui famílias geradas), sem carregar nada."""
+        return self._factory(feeder_id) is not None or self._path(feeder_id) is not None
+
+    def ids(self) -> List[str]:
+        found = set(self._builtin)
+        if self.root.is_dir():
+            for p in self.root.iterdir():
+                if p.suffix == ".json" and not p.name.endswith(".layout.json"): found.add(p.stem)
+                elif p.is_dir() and (p / "buses.csv").is_file(): found.add(p.name)
+        return sorted(found)
+
+    def loaded(self) -> List[str]:
+        with self._lock:
+            return list(self._loaded)
+
+    def get(self, feeder_id: Optional[str] = None) -> Feeder:
+        """Alimentador pelo id; arquivos alterados desde a carga são relidos."""
+        feeder_id = feeder_id or DEFAULT_FEEDER
+        factory = self._factory(feeder_id)
+        path = None if factory else self._path(feeder_id)
+        if factory is None and path is None:
+            raise UnknownFeeder(feeder_id)
+        stamp = None if factory else _source_stamp(path)
+        with self._lock:
+            hit = self._loaded.get(feeder_id)
+            if hit is not None and hit.stamp == stamp:
+                self._loaded.move_to_end(feeder_id)
+                return hit
+            slot = self._loading.setdefault(feeder_id, Lock())
+        # carga fora do lock global: um alimentador grande não bloqueia os demais
+        with slot:
+            try:
+                with self._lock:
+                    hit = self._loaded.get(feeder_id)
+                if hit is not None and hit.stamp == stamp:
+                    return hit
+                feeder = factory() if factory else _load_file(feeder_id, path, stamp)
+                with self._lock:
+                    self._loaded[feeder_id] = feeder
+                    self._loaded.move_to_end(feeder_id)
+                    while len(self._loaded) > self.max_loaded:
+                        self._loaded.popitem(last=False)
+                return feeder
+            finally:
+                # o slot só existe durante a carga: ids pedidos uma vez (SYN-<n>) não acumulam locks.
+                # Quem já esperava neste slot encontra o alimentador em _loaded.
+                with self._lock:
+                    if self._loading.get(feeder_id) is slot:
+                        del self._loading[feeder_id]
+
+    def invalidate(self, feeder_id: Optional[str] = None):
+        with self._lock:
+            if feeder_id is None: self._loaded.clear()
+            else: self._loaded.pop(feeder_id, None)
+
+def _w0321p3() -> Feeder:
+    from . import model
+    from .geo import build_w0321p3_layout
+    # template e versão continuam sob model (get_template/invalidate_template)
+    return Feeder("W0321P3", lambda: model.MODEL_VERSION, model.get_template,
+                  frozenset(model.NORMALLY_OPEN), lambda _net: build_w0321p3_layout())
+
+def _synthetic(feeder_id: str) -> Optional[Callable[[], Feeder]]:
+    """SYN-<barras>: alimentador sintético com ~<barras> barras (ver synthetic.py)."""
+    size = feeder_id[len("SYN-"):]
+    # forma canônica (sem zeros à esquerda): SYN-0200 não vira um segundo template de SYN-200
+    if not size.isdigit() or str(int(size)) != size or not 50 <= int(size) <= SYNTHETIC_MAX:
+        return None
+    def build() -> Feeder:
+        net, normally_open, layout = build_synthetic(params_for(int(size)))
+        return Feeder(feeder_id, lambda: f"{GENERATOR_VERSION}-{size}", lambda: net, normally_open,
+                      lambda _net: layout)
+    return build
+
+FEEDERS = FeederRegistry()
+FEEDERS.register("W0321P3", _w0321p3)
+if SYNTHETIC:
+    FEEDERS.register_family("SYN-", _synthetic)
@@ -0,0 +1,146 @@
+import os
+import queue
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterator, List, Optional
+
+from app.sim.ops import customers_interrupted, energized_buses
+from app.scenario import simulate
+
+# ------------------------------------------------------------------
+#  Jobs assíncronos de cenário: POST devolve um id, a execução acontece
+#  em threads dedicadas e cada passo da timeline (mais um snapshot da
+#  energização) é publicado para quem acompanha via SSE.
+#   SIM_JOB_QUEUE   : máximo de jobs aguardando execução
+#   SIM_JOB_WORKERS : threads executando jobs
+#   SIM_JOB_KEEP    : jobs finalizados mantidos em memória
+# ------------------------------------------------------------------
+MAX_QUEUED = int(os.getenv("SIM_JOB_QUEUE", "16"))
+JOB_WORKERS = int(os.getenv("SIM_JOB_WORKERS", "1"))
+MAX_KEPT = int(os.getenv("SIM_JOB_KEEP", "256"))
+
+TERMINAL = ("done", "error", "cancelled")
+
+class QueueFull(Exception):
+    """Fila de jobs cheia; a API responde 429."""
+
+class JobCancelled(Exception):
+    pass
+
+@dataclass
+class Job:
+    id: str
+    req: dict
+    status: str = "queued"
+    result: Optional[dict] = None
+    error: Optional[str] = None
+    created_at: float = field(default_factory=time.time)
+    events: List[dict] = field(default_factory=list)
+    cancel_flag: threading.Event = field(default_factory=threading.Event)
+    cond: threading.Condition = field(default_factory=threading.Condition)
+
+    def push(self, event: str, data: Any):
+        with self.cond:
+            self.events.append({"seq": len(self.events), "event": event, "data": data})
+            self.cond.notify_all()
+
+    def start(self) -> bool:
+        """queued -> running sob o lock do job; False se foi cancelado antes de começar."""
+        with self.cond:
+            if self.status != "queued": return False
+            self.status = "running"; self.push("status", {"status": "running"})
+            return True
+
+    def summary(self) -> Dict[str, Any]:
+        out = {"job_id": self.id, "status": self.status, "n_events": len(self.events)}
+        if self.result is not None: out["result"] = self.result
+        if self.error is not None: out["error"] = self.error
+        return out
+
+class JobManager:
+    def __init__(self, max_queued: int = MAX_QUEUED, workers: int = JOB_WORKERS):
+        self._queue: "queue.Queue[Job]" = queue.Queue(maxsize=max_queued)
+        self._jobs: "OrderedDict[str, Job]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._workers = workers
+        self._threads: List[threading.Thread] = []
+
+    def _ensure_threads(self):
+        with self._lock:
+            while len(self._threads) < self._workers:
+                th = threading.Thread(target=self._loop, name=f"sim-job-{len(self._threads)}", daemon=True)
+                th.start(); self._threads.append(th)
+
+    def submit(self, req: dict) -> Job:
+        job = Job(id=uuid.uuid4().hex, req=req)
+        try:
+            self._queue.put_nowait(job)
+        except queue.Full:
+            raise QueueFull()
+        with self._lock:
+            self._jobs[job.id] = job
+            self._prune()
+        job.push("status", {"status": "queued"})
+        self._ensure_threads()
+        return job
+
+    def _prune(self):
+        finished = [j.id for j in self._jobs.values() if j.status in TERMINAL]
+        for jid in finished[:max(0, len(finished) - MAX_KEPT)]:
+            del self._jobs[jid]
+
+    def get(self, job_id: str) -> Optional[Job]:
+        with self._lock: return self._jobs.get(job_id)
+
+    def cancel(self, job_id: str) -> Optional[Job]:
+        job = self.get(job_id)
+        if job is None: return job
+        with job.cond:  # mesmo lock de Job.start: ou o worker descarta, ou o job já está rodando
+            if job.status in TERMINAL: return job
+            job.cancel_flag.set()
+            if job.status == "queued":  # ainda não começou: o worker só descarta
+                job.status = "cancelled"; job.push("cancelled", {})
+        return job
+
+    def _loop(self):
+        while True:
+            job = self._queue.get()
+            try:
+                if job.start(): self._run(job)
+            finally:
+                self._queue.task_done()
+
+    def _run(self, job: Job):
+        def on_step(entry: dict, net):
+            if job.cancel_flag.is_set(): raise JobCancelled()
+            job.push("step", entry)
+            energ = energized_buses(net)
+            job.push("snapshot", {"t": entry["t"], "energized_buses_indices": sorted(energ),
+                                  "clients_interrupted": customers_interrupted(net, energ)})
+        try:
+            job.result = simulate(job.req, on_step=on_step)
+            job.status = "done"; job.push("done", job.result)
+        except JobCancelled:
+            job.status = "cancelled"; job.push("cancelled", {})
+        except Exception as e:
+            job.error = str(e); job.status = "error"; job.push("error", {"error": job.error})
+
+    def stream(self, job: Job, since: int = 0, keepalive_s: float = 15.0) -> Iterator[Optional[dict]]:
+        """Eventos do job a partir de `since`; None sinaliza keepalive. Termina no evento final."""
+        i = since
+        while True:
+            with job.cond:
+                if i >= len(job.events):
+                    job.cond.wait(timeout=keepalive_s)
+                pending = job.events[i:]
+            if not pending:
+                yield None; continue
+            for ev in pending:
+                i += 1
+                yield ev
+                if ev["event"] in TERMINAL: return
+
+JOBS = JobManager()
@@ -13,11 +13,20 @@ def compute_kpis(customers_total: int,
                  clients_initial: int,
                  clients_after: int,
                  interruption_min: float,
-                 p_not_supplied_mw: float = 2.0):
+                 ens_mwh: float):
+    # ens_mwh: energia não suprida integrada pelo chamador (MW desligados x tempo, ou série temporal)
     if clients_initial <= 0 or customers_total <= 0:
         return KPIResult(0, 0, 0, 0, 0, 0)
     saifi = 1.0
     saidi_h = (clients_initial * (interruption_min/60.0)) / customers_total
     caidi_h = saidi_h / saifi
-    ens_mwh = p_not_supplied_mw * (interruption_min/60.0)
     return KPIResult(saidi_h, saifi, caidi_h, ens_mwh, clients_initial, clients_after)
+
+def kpis_from_minutes(customers_total: int, customer_min: float, interruptions: int, ens_mwh: float,
+                      peak: int, final: int) -> KPIResult:
+    # integração exata (motor de eventos): cliente·min e nº de interrupções somados entre eventos
+    if customers_total <= 0 or interruptions <= 0:
+        return KPIResult(0, 0, 0, 0, 0, 0)
+    saidi_h = customer_min / 60.0 / customers_total
+    saifi = interruptions / customers_total
+    return KPIResult(saidi_h, saifi, saidi_h / saifi, ens_mwh, peak, final)
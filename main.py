@@ -1,18 +1,32 @@
+import json
+import time
+_T0 = time.perf_counter()  # tempo de import do app (etapa startup.import)
+from datetime import datetime
 from pathlib import Path
+from typing import Iterator, Optional
+
 from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse, HTMLResponse
+from fastapi.responses import JSONResponse, HTMLResponse, PlainTextResponse, Response, StreamingResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
 
-from app.sim.model import build_w0321p3, customers_from_mw
-from app.sim.events import Event
-from app.sim.ops import apply_event_and_operate, run_powerflow, energized_buses
-from app.sim.kpis import compute_kpis
-from app.sim.geo import BUS_COORDS, LINES, TRAFOS
+from app.sim.events import EventError, parse_events
+from app.sim.feeders import FEEDERS, LAYOUT_MEDIA, InvalidFeeder, UnknownFeeder
+from app.sim.ops import apply_switching, run_powerflow
+from app.sim.contingency import default_targets, iter_contingencies, rank_contingencies
+from app.sim.parallel import MAX_WORKERS
+from app.sim.reliability import monte_carlo
+from app.sim import profiling
 
-from app.db import init_db, SessionLocal, Run
-from app.state import get_state, set_switch, set_fault, reset_state
+from app.db import RUNS
+from app.state import (SESSION_RE, STATE_FORMATS, StateConflict, drop_session, etag, get_state, impact,
+                       set_switch, set_fault, reset_state, state_version)
+from app.scenario import ProfileError, ScenarioError, simulate, timeseries
+from app.jobs import JOBS, QueueFull
+from app.compute import COMPUTE, Overloaded
+from app.cache import SOLUTIONS
+from app.startup import WARMUP
 
 BASE_DIR = Path(__file__).resolve().parents[2]
 TEMPLATES_DIR = BASE_DIR / "frontend" / "templates"
@@ -28,89 +42,372 @@ app.add_middleware(
 app.mount("/static", StaticFiles(directory=str(STATIC_DIR)), name="static")
 templates = Jinja2Templates(directory=str(TEMPLATES_DIR))
 
-init_db()
+_IMPORT_S = time.perf_counter() - _T0
+
+@app.on_event("startup")
+def warmup():
+    # banco, pilha do solver e alimentador padrão: conforme SIM_STARTUP (ver app/startup.py)
+    WARMUP.record("import", _IMPORT_S)
+    WARMUP.start()
+
+if profiling.ENABLED:
+    # X-Sim-Debug: 1 -> tempos por etapa deste request no header Server-Timing
+    @app.middleware("http")
+    async def debug_timing(request: Request, call_next):
+        if not request.headers.get("x-sim-debug"):
+            return await call_next(request)
+        tr, token = profiling.start_trace()
+        try:
+            response = await call_next(request)
+        finally:
+            profiling.end_trace(token)
+        response.headers["Server-Timing"] = profiling.server_timing(tr)
+        return response
+
+@app.exception_handler(UnknownFeeder)
+def unknown_feeder(request: Request, exc: UnknownFeeder):
+    return JSONResponse({"error": f"alimentador não encontrado: {exc.args[0]}"}, status_code=404)
+
+@app.exception_handler(InvalidFeeder)
+def invalid_feeder(request: Request, exc: InvalidFeeder):
+    return JSONResponse({"error": str(exc)}, status_code=422)
+
+@app.exception_handler(Overloaded)
+def overloaded(request: Request, exc: Overloaded):
+    return JSONResponse({"error": "servidor ocupado, tente novamente"}, status_code=429,
+                        headers={"Retry-After": "1"})
+
+@app.exception_handler(StateConflict)
+def state_conflict(request: Request, exc: StateConflict):
+    return JSONResponse({"error": "estado mudou desde a versão informada", "version": exc.version},
+                        status_code=409)
+
+def _valid_session(session: Optional[str]) -> bool:
+    return not session or SESSION_RE.fullmatch(session) is not None
 
 @app.get("/health")
 def health():
-    return {"ok": True, "service": "w0321p3-sim"}
+    return {"ok": True, "service": "w0321p3-sim", "warm": WARMUP.status()["ready"]}
+
+@app.get("/api/startup")
+def startup_status():
+    return WARMUP.status()
 
 @app.get("/", response_class=HTMLResponse)
 def index(request: Request):
     return templates.TemplateResponse("index.html", {"request": request})
 
+# ===== Alimentadores =====
+# toda chamada aceita "feeder" (query no GET, corpo no POST); sem ele vale SIM_DEFAULT_FEEDER
+@app.get("/api/feeders")
+def list_feeders():
+    loaded = set(FEEDERS.loaded())
+    return [{"id": f, "loaded": f in loaded} for f in FEEDERS.ids()]
+
 # ===== Topologia/estado para o unifilar =====
+# Serializada e comprimida uma vez por alimentador (format=json|bin). ETag forte = hash do conteúdo
+# (+ -gz/-br conforme o Content-Encoding escolhido); com ?v=<etag> a resposta é imutável (cache longo), sem ele o navegador revalida a cada carga.
 @app.get("/api/topology")
-def topology():
-    return {"buses": BUS_COORDS, "lines": LINES, "trafos": TRAFOS}
+async def topology(request: Request, feeder: Optional[str] = None, format: str = "json", v: Optional[str] = None):
+    if format not in LAYOUT_MEDIA:
+        return JSONResponse({"error": f"format deve ser um de {', '.join(LAYOUT_MEDIA)}"}, status_code=400)
+    # a primeira consulta de um alimentador pode carregar o arquivo: roda no executor
+    enc = await COMPUTE.run(lambda: FEEDERS.get(feeder).encoded_layout(format))
+    coding = _pick_coding(request.headers.get("accept-encoding"), enc.bodies)
+    tag = _coding_etag(enc.etag, coding)
+    headers = {"ETag": tag, "Vary": "Accept-Encoding",
+               "Cache-Control": "public, max-age=31536000, immutable" if v in (enc.etag.strip('"'), tag.strip('"')) else "no-cache"}
+    if _etag_matches(request.headers.get("if-none-match"), tag):
+        return Response(status_code=304, headers=headers)
+    if coding != "identity": headers["Content-Encoding"] = coding
+    return Response(enc.bodies[coding], media_type=enc.media_type, headers=headers)
 
+_CODING_PREF = ("br", "gzip", "identity")   # desempate entre q iguais
+_CODING_SUFFIX = {"br": "-br", "gzip": "-gz", "identity": ""}
+
+def _pick_coding(accept: Optional[str], available) -> str:
+    """Content-coding pelo Accept-Encoding (RFC 9110 §12.5.3): q-values, q=0 recusa, `*` = as não listadas."""
+    if not accept:
+        return "identity"
+    q = {}
+    for part in accept.split(","):
+        name, _, params = part.strip().partition(";")
+        name = name.strip().lower()
+        if not name: continue
+        weight = 1.0
+        for p in params.split(";"):
+            k, _, val = p.strip().partition("=")
+            if k.strip().lower() == "q":
+                try: weight = float(val)
+                except ValueError: weight = 0.0
+        q[name] = weight
+    star = q.get("*")
+    def weight(c):
+        if c in q: return q[c]
+        if star is not None: return star
+        return 1.0 if c == "identity" else 0.0   # identity é aceitável se não for recusada
+    return max((c for c in _CODING_PREF if c in available and weight(c) > 0),
+               key=lambda c: (weight(c), -_CODING_PREF.index(c)), default="identity")
+
+def _coding_etag(etag: str, coding: str) -> str:
+    # representações diferentes (cada content-coding) precisam de ETags fortes diferentes
+    return etag[:-1] + _CODING_SUFFIX[coding] + '"'
+
+def _etag_matches(if_none_match: Optional[str], tag: str) -> bool:
+    if not if_none_match: return False
+    # If-None-Match usa comparação fraca: W/"x" casa com "x"
+    tags = [t.strip() for t in if_none_match.split(",")]
+    return any(t == "*" or t.removeprefix("W/") == tag for t in tags)
+
+# format=compact: bitsets por posição (nomes em topology.index); since=<versão>: só o que mudou.
+# ETag = alimentador + registro + versão do estado; If-None-Match igual responde 304 sem montar o estado.
+# session=<id>: sessão de treino (cópia própria a partir da primeira manobra).
 @app.get("/api/state")
-def api_state():
-    return get_state()
+async def api_state(request: Request, feeder: Optional[str] = None, format: str = "full",
+                    since: Optional[int] = None, session: str = ""):
+    if format not in STATE_FORMATS:
+        return JSONResponse({"error": f"format deve ser um de {', '.join(STATE_FORMATS)}"}, status_code=400)
+    if not _valid_session(session):
+        return JSONResponse({"error": "session inválida"}, status_code=400)
+    inm = request.headers.get("if-none-match")
+
+    def run():
+        if inm:
+            tag = etag(*state_version(feeder, session), format, since)
+            if _etag_matches(inm, tag): return tag
+        return get_state(feeder, format, since, session)
+    body = await COMPUTE.run(run)
+    if isinstance(body, str):
+        return Response(status_code=304, headers={"ETag": body})
+    return JSONResponse(body, headers={"ETag": etag(body["tag"], body["version"], format, since)})
+
+def _workers(req: dict) -> Optional[int]:
+    """"workers" do corpo: inteiro >= 0, limitado a SIM_MAX_WORKERS (ValueError se inválido)."""
+    w = req.get("workers")
+    if w is None: return None
+    try:
+        n = int(w) if isinstance(w, (int, str)) and not isinstance(w, bool) else -1
+    except ValueError:
+        n = -1
+    if n < 0: raise ValueError("workers deve ser um inteiro >= 0")
+    return min(n, MAX_WORKERS)
+
+# if_version: a manobra só vale se o estado ainda estiver nessa versão (senão 409 com a versão atual)
+def _state_opts(body: dict):
+    fmt = body.get("format", "full"); since = body.get("since")
+    session = body.get("session") or ""; if_version = body.get("if_version")
+    if (fmt not in STATE_FORMATS or not (since is None or isinstance(since, int))
+            or not (if_version is None or isinstance(if_version, int))
+            or not isinstance(session, str) or not _valid_session(session)):
+        return None
+    return {"feeder": body.get("feeder"), "fmt": fmt, "since": since, "session": session, "if_version": if_version}
 
 @app.post("/api/switch")
-def api_switch(body: dict):
+async def api_switch(body: dict):
     name = body.get("name"); action = body.get("action", "open")
     if not name: return JSONResponse({"error": "name obrigatório"}, status_code=400)
-    return set_switch(name, action)
+    opts = _state_opts(body)
+    if opts is None: return JSONResponse({"error": "format/since/session/if_version inválidos"}, status_code=400)
+    return await COMPUTE.run(set_switch, name, action, diff=bool(body.get("diff", False)), **opts)
 
 @app.post("/api/fault")
-def api_fault(body: dict):
+async def api_fault(body: dict):
     name = body.get("name"); action = body.get("action", "apply")
     if not name: return JSONResponse({"error": "name obrigatório"}, status_code=400)
-    return set_fault(name, action)
+    opts = _state_opts(body)
+    if opts is None: return JSONResponse({"error": "format/since/session/if_version inválidos"}, status_code=400)
+    return await COMPUTE.run(set_fault, name, action, diff=bool(body.get("diff", False)), **opts)
 
 @app.post("/api/reset")
-def api_reset():
-    return reset_state()
+async def api_reset(body: Optional[dict] = None):
+    opts = _state_opts(body or {})
+    if opts is None: return JSONResponse({"error": "format/since/session/if_version inválidos"}, status_code=400)
+    return await COMPUTE.run(reset_state, **opts)
+
+# Impacto de abrir a linha / de um defeito nela, no estado atual (índice radial, sem fluxo)
+@app.get("/api/impact")
+async def api_impact(line: str, feeder: Optional[str] = None, session: str = ""):
+    if not _valid_session(session):
+        return JSONResponse({"error": "session inválida"}, status_code=400)
+    try:
+        return await COMPUTE.run(impact, line, feeder, session)
+    except UnknownFeeder:
+        raise
+    except KeyError:
+        return JSONResponse({"error": f"linha desconhecida: {line}"}, status_code=404)
+
+# Descarta a cópia da sessão de treino: ela volta a ver o estado compartilhado
+@app.delete("/api/sessions/{session}")
+async def api_drop_session(session: str):
+    if not _valid_session(session):
+        return JSONResponse({"error": "session inválida"}, status_code=400)
+    return {"session": session, "dropped": await COMPUTE.run(drop_session, session)}
 
 # ===== Simulação por cenário (continua) =====
 @app.post("/api/run")
 async def run_scenario(req: dict):
-    event = req.get("event", {"type":"fault_permanent","target":"line:R3B-B3","t0_min":0})
+    try:
+        return await COMPUTE.run(simulate, req)
+    except (ProfileError, EventError) as e:
+        return JSONResponse({"error": str(e)}, status_code=400)
+    except ScenarioError as e:
+        return JSONResponse({"error": str(e)}, status_code=500)
+
+# ===== Série temporal (perfis de carga de 15 min) =====
+@app.post("/api/timeseries")
+async def run_timeseries(req: dict):
+    try:
+        return await COMPUTE.run(timeseries, req)
+    except ProfileError as e:
+        return JSONResponse({"error": str(e)}, status_code=400)
+    except ScenarioError as e:
+        return JSONResponse({"error": str(e)}, status_code=500)
+
+# ===== Jobs assíncronos (timeline via SSE) =====
+@app.post("/api/jobs")
+def submit_job(req: dict):
+    if req.get("feeder") is not None and not FEEDERS.exists(req["feeder"]):
+        raise UnknownFeeder(req["feeder"])
+    try:
+        if "events" in req: parse_events(req["events"])   # erro de formato responde já, não no job
+    except EventError as e:
+        return JSONResponse({"error": str(e)}, status_code=400)
+    try:
+        job = JOBS.submit(req)
+    except QueueFull:
+        return JSONResponse({"error": "fila de jobs cheia"}, status_code=429)
+    return JSONResponse({"job_id": job.id, "status": job.status}, status_code=202)
+
+@app.get("/api/jobs/{job_id}")
+def get_job(job_id: str):
+    job = JOBS.get(job_id)
+    if not job: return JSONResponse({"error": "job não encontrado"}, status_code=404)
+    return job.summary()
+
+@app.delete("/api/jobs/{job_id}")
+def cancel_job(job_id: str):
+    job = JOBS.cancel(job_id)
+    if not job: return JSONResponse({"error": "job não encontrado"}, status_code=404)
+    return job.summary()
+
+@app.get("/api/jobs/{job_id}/events")
+def job_events(job_id: str, request: Request, since: int = 0):
+    job = JOBS.get(job_id)
+    if not job: return JSONResponse({"error": "job não encontrado"}, status_code=404)
+    last = request.headers.get("last-event-id")
+    if last is not None and last.isdigit(): since = int(last) + 1
+
+    def sse():
+        for ev in JOBS.stream(job, since):
+            if ev is None: yield ": keepalive\n\n"; continue
+            yield f"id: {ev['seq']}\nevent: {ev['event']}\ndata: {json.dumps(ev['data'])}\n\n"
+    return StreamingResponse(sse(), media_type="text/event-stream")
+
+# ===== Varredura N-1 =====
+@app.post("/api/contingency-sweep")
+async def contingency_sweep(req: dict):
+    # no modo stream o caso base roda numa tarefa e cada linha do NDJSON em outra, sempre no executor
+    res = await COMPUTE.run(_contingency_sweep, req)
+    if isinstance(res, Iterator):
+        return StreamingResponse(COMPUTE.stream(res), media_type="application/x-ndjson")
+    return res
+
+def _contingency_sweep(req: dict):
+    event_type = req.get("event_type", "fault_permanent")
     interruption_min = float(req.get("interruption_min", 20))
     limits = req.get("limits", None)
+    try:
+        workers = _workers(req)
+    except ValueError as e:
+        return JSONResponse({"error": str(e)}, status_code=400)
 
-    net = build_w0321p3()
+    feeder = FEEDERS.get(req.get("feeder"))
+    net = feeder.new_network()
+    apply_switching(net, open_names=feeder.normally_open)
     ok, err = run_powerflow(net)
     if not ok: return JSONResponse({"error": f"Fluxo normal falhou: {err}"}, status_code=500)
 
-    p_total = net.load.p_mw.sum()
-    customers_total = customers_from_mw(p_total)
-
-    ev = Event(**event)
-    timeline, clients_initial, clients_after, _ = apply_event_and_operate(net, ev, limits=limits)
-
-    kpis = compute_kpis(customers_total, clients_initial, clients_after, interruption_min)
-    run_powerflow(net)
-    buses_on = list(energized_buses(net))
-
-    payload = {
-        "feeder": "W0321P3",
-        "timeline": timeline,
-        "customers_total": customers_total,
-        "clients_initial": clients_initial,
-        "clients_after_reconfig": clients_after,
-        "kpis": kpis.__dict__,
-        "energized_buses_indices": buses_on
-    }
-
-    with SessionLocal() as s:
-        r = Run(feeder="W0321P3", event_type=ev.type, target=ev.target,
-                interruption_min=interruption_min, result_json=payload)
-        s.add(r); s.commit(); payload["run_id"] = r.id
-    return payload
+    targets = req.get("targets") or default_targets(net, event_type, req.get("match"))
+    rows = iter_contingencies(net, event_type, targets, interruption_min=interruption_min,
+                              limits=limits, workers=workers)
+    if not req.get("stream"):
+        return {"feeder": feeder.id, "event_type": event_type, "results": rank_contingencies(list(rows))}
+
+    def ndjson():
+        done = []
+        for row in rows:
+            done.append(row)
+            yield json.dumps({"done": len(done), "total": len(targets), "result": row}) + "\n"
+        yield json.dumps({"done": len(done), "total": len(targets), "results": rank_contingencies(done)}) + "\n"
+    return ndjson()
+
+# ===== Confiabilidade (Monte Carlo) =====
+@app.post("/api/reliability")
+async def reliability(req: dict):
+    return await COMPUTE.run(_reliability, req)
 
+def _reliability(req: dict):
+    years = int(req.get("years", 10_000))
+    if not 0 < years <= 1_000_000:
+        return JSONResponse({"error": "years deve estar entre 1 e 1.000.000"}, status_code=400)
+    try:
+        workers = _workers(req)
+    except ValueError as e:
+        return JSONResponse({"error": str(e)}, status_code=400)
+    feeder = FEEDERS.get(req.get("feeder"))
+    net = feeder.new_network()
+    apply_switching(net, open_names=feeder.normally_open)
+    ok, err = run_powerflow(net)
+    if not ok: return JSONResponse({"error": f"Fluxo normal falhou: {err}"}, status_code=500)
+    kw = {k: req[k] for k in ("lambda_per_km", "repair_h", "switch_h") if k in req}
+    res = monte_carlo(net, years=years, seed=req.get("seed"), rates=req.get("rates"),
+                      limits=req.get("limits"), workers=workers, **kw)
+    return {"feeder": feeder.id, **res.__dict__}
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def metrics():
+    gauges = {f"sim_compute_{k}": v for k, v in COMPUTE.metrics().items() if isinstance(v, (int, float))}
+    gauges.update({f"sim_cache_{k}": v for k, v in SOLUTIONS.stats().items() if isinstance(v, (int, float))})
+    gauges["sim_startup_ready"] = int(WARMUP.status()["ready"])
+    return PlainTextResponse(profiling.render_prometheus(gauges), media_type="text/plain; version=0.0.4")
+
+@app.get("/api/metrics/compute")
+def compute_metrics():
+    return COMPUTE.metrics()
+
+@app.get("/api/cache")
+def cache_stats():
+    return SOLUTIONS.stats()
+
+@app.delete("/api/cache")
+def cache_clear():
+    SOLUTIONS.clear()
+    return SOLUTIONS.stats()
+
+# paginação por chave: a próxima página é ?before=<X-Next-Before> (menor id desta página)
 @app.get("/api/runs")
-def list_runs(limit: int = 20):
-    with SessionLocal() as s:
-        rows = s.query(Run).order_by(Run.id.desc()).limit(limit).all()
-        return [{"id": r.id, "created_at": r.created_at.isoformat(), "feeder": r.feeder,
-                 "event_type": r.event_type, "target": r.target,
-                 "interruption_min": r.interruption_min} for r in rows]
+async def list_runs(limit: int = 20, before: Optional[int] = None, feeder: Optional[str] = None,
+                    event_type: Optional[str] = None, target: Optional[str] = None,
+                    since: Optional[datetime] = None, until: Optional[datetime] = None):
+    limit = max(1, min(limit, 1000))
+    rows = await COMPUTE.run(RUNS.list, limit, before, feeder, event_type, target, since, until)
+    headers = {"X-Next-Before": str(rows[-1].id)} if len(rows) == limit else {}
+    return JSONResponse([{"id": r.id, "created_at": r.created_at.isoformat(), "feeder": r.feeder,
+                          "event_type": r.event_type, "target": r.target, "model_version": r.model_version,
+                          "interruption_min": r.interruption_min} for r in rows], headers=headers)
+
+# runs deixam de ser reaproveitados por /api/run (continuam no histórico)
+@app.post("/api/admin/runs/invalidate")
+async def invalidate_runs(body: dict):
+    model_version = body.get("model_version"); feeder = body.get("feeder")
+    if model_version is None and feeder is None and not body.get("all"):
+        return JSONResponse({"error": "informe model_version, feeder ou all=true"}, status_code=400)
+    n = await COMPUTE.run(RUNS.invalidate, model_version, feeder)
+    SOLUTIONS.clear()   # o cache em memória também guarda runs reaproveitáveis
+    return {"invalidated": n}
 
 @app.get("/api/runs/{run_id}")
-def get_run(run_id: int):
-    with SessionLocal() as s:
-        r = s.query(Run).get(run_id)
-        if not r: return JSONResponse({"error": "run não encontrado"}, status_code=404)
-        return r.result_json
+async def get_run(run_id: int):
+    payload = await COMPUTE.run(RUNS.load, run_id)
+    if payload is None: return JSONResponse({"error": "run não encontrado"}, status_code=404)
+    return payload
@@ -1,41 +1,141 @@
-from typing import Tuple, List, Optional
-import pandapower as pp
+import logging
+import os
+from typing import Callable, Iterable, Tuple, List, Optional
+import numpy as np
 
 from .model import customers_from_mw
 from .events import Event, parse_target
+from .parallel import DEFAULT_WORKERS, read_shared, run_parallel, shared
+from .profiling import count, span, timed
+from .sweep import solve_radial
+from .topology import connectivity, energized_buses_topo, name_index, per_net
+
+log = logging.getLogger(__name__)
+
+def line_index(net, name) -> Optional[int]:
+    return name_index(net).line.get(name)
 
 def open_line_by_name(net, name):
-    idx = net.line[net.line.name == name].index
-    if len(idx):
-        net.line.at[idx[0], "in_service"] = False
-        return idx[0]
-    return None
+    idx = line_index(net, name)
+    if idx is not None:
+        net.line.at[idx, "in_service"] = False
+    return idx
 
 def close_line_by_name(net, name):
-    idx = net.line[net.line.name == name].index
-    if len(idx):
-        net.line.at[idx[0], "in_service"] = True
-        return idx[0]
-    return None
+    idx = line_index(net, name)
+    if idx is not None:
+        net.line.at[idx, "in_service"] = True
+    return idx
+
+def apply_switching(net, open_names: Iterable[str] = (), close_names: Iterable[str] = ()) -> List[str]:
+    """
+    Aplica um lote de manobras com uma única atribuição de in_service.
+    Se um nome aparece nos dois lotes, prevalece a abertura.
+    Retorna os nomes não encontrados em net.line.
+    """
+    pos = name_index(net).line_pos
+    open_names = list(open_names); close_names = list(close_names)
+    missing = [n for n in close_names + open_names if n not in pos]
+    col = net.line.in_service.values.astype(bool)  # cópia
+    col[[pos[n] for n in close_names if n in pos]] = True
+    col[[pos[n] for n in open_names if n in pos]] = False
+    net.line["in_service"] = col
+    return missing
+
+def _runpp(net, **kw):
+    import pandapower as pp  # import tardio: o servidor sobe sem a pilha do pandapower
+    with span("runpp"):
+        try:
+            pp.runpp(net, **kw)
+        except Exception:
+            count("runpp_failed"); raise
+    count("runpp_calls"); count("runpp_iterations", net._ppc.get("iterations") or 0)
+
+# Solvers de fluxo: "pp" = pp.runpp (Newton-Raphson); "sweep" = varredura radial
+# (sweep.py), que cai no runpp se a rede estiver malhada (tie fechada) ou não for suportada.
+#   SIM_SOLVER : solver padrão de run_powerflow
+DEFAULT_SOLVER = os.getenv("SIM_SOLVER", "sweep")
+SOLVERS: dict = {}
+
+def register_solver(name: str, solve: Callable[[object], bool]):
+    """solve(net) -> True se resolveu (res_* gravados); False para cair no runpp."""
+    SOLVERS[name] = solve
+
+register_solver("pp", lambda net: False)
+register_solver("sweep", solve_radial)
 
-def run_powerflow(net):
+# falhas numéricas esperadas de um solver (divergência, matriz singular): caem no runpp.
+# Qualquer outra exceção é bug do solver: vai para o log e sobe.
+_SOLVER_ERRORS = (ArithmeticError, np.linalg.LinAlgError)
+
+def run_powerflow(net, warm: bool = False, solver: Optional[str] = None):
+    """
+    Fluxo de potência com o solver escolhido (padrão SIM_SOLVER). No runpp,
+    warm=True parte da solução anterior (init="results"); se falhar, refaz do zero.
+    """
+    solver = solver or DEFAULT_SOLVER
+    if solver not in SOLVERS:
+        raise ValueError(f"solver desconhecido: {solver}")
+    if solver != "pp":
+        try:
+            if SOLVERS[solver](net):
+                return True, None
+        except _SOLVER_ERRORS:
+            count("solver_failed")
+        except Exception:
+            count("solver_errors")
+            log.exception("solver %s falhou com erro inesperado", solver)
+            raise
+    if warm and not net.res_bus.empty and net.res_bus.vm_pu.notna().any():
+        try:
+            _runpp(net, init="results")
+            return True, None
+        except Exception:
+            pass
     try:
-        pp.runpp(net)
+        _runpp(net)
         return True, None
     except Exception as e:
         return False, str(e)
 
+@timed("energize")
 def energized_buses(net):
-    if net.res_bus.empty:
-        return set()
-    return set(net.res_bus[net.res_bus.vm_pu.notna()].index)
+    # conectividade pura (linhas/trafos em serviço até a ext_grid): não depende de runpp
+    return energized_buses_topo(net)
+
+@timed("energize")
+def energized_mask(net) -> np.ndarray:
+    """Como energized_buses, mas máscara booleana posicional em net.bus."""
+    return connectivity(net).energized_mask(net)
+
+class LoadIndex:
+    """Arrays fixos das cargas: posição da barra em net.bus e peso de prioridade."""
+    def __init__(self, net):
+        self.bus = net.load.bus.values.astype(np.int64)
+        self.bus_pos = net.bus.index.get_indexer(self.bus)
+        self.prio = np.array([_priority_of(n or "") for n in net.load.name.tolist()], dtype=np.int64)
+
+def load_index(net) -> LoadIndex:
+    return per_net(net, "loads", LoadIndex)
+
+@timed("load_accounting")
+def load_accounting(net, energized) -> Tuple[float, int, int]:
+    """
+    Contabilidade das cargas numa passada só.
+    energized: conjunto de índices de barra ou máscara booleana posicional em net.bus.
+    Retorna (MW interrompidos, clientes interrompidos, score de prioridade atendida).
+    """
+    li = load_index(net)
+    if isinstance(energized, np.ndarray) and energized.dtype == bool:
+        on = energized[li.bus_pos]
+    else:
+        on = np.isin(li.bus, np.fromiter(energized, dtype=np.int64, count=len(energized)))
+    p = net.load.p_mw.values
+    p_off = float(p[~on].sum())
+    return p_off, customers_from_mw(p_off), int(li.prio[on].sum())
 
 def customers_interrupted(net, energized_bus_indices):
-    p_total = 0.0
-    for _, load in net.load.iterrows():
-        if load.bus not in energized_bus_indices:
-            p_total += load.p_mw
-    return customers_from_mw(p_total)
+    return load_accounting(net, energized_bus_indices)[1]
 
 def _fail_line(net, line_name: str):   open_line_by_name(net, line_name)
 def _restore_line(net, line_name: str): close_line_by_name(net, line_name)
@@ -47,10 +147,7 @@ def _priority_of(name: str) -> int:
     return 1
 
 def _priority_score_served(net, energized):
-    score = 0
-    for _, load in net.load.iterrows():
-        if load.bus in energized: score += _priority_of(load.name or "")
-    return score
+    return load_accounting(net, energized)[2]
 
 def _violates_limits(net, limits) -> bool:
     if not limits: return False
@@ -62,56 +159,118 @@ def _violates_limits(net, limits) -> bool:
         if (net.res_line.loading_percent > imax_percent).any(): return True
     return False
 
-def isolate_and_reconfigure(net, target_line_name: str, limits=None) -> Tuple[List[dict], int, int]:
-    timeline = []
-    _fail_line(net, target_line_name); timeline.append({"t": 1, "op": f"abrir {target_line_name}"})
-    open_line_by_name(net, "R1B-B1"); timeline.append({"t": 5, "op": "abrir R1B-B1"})
-    ok, err = run_powerflow(net)
-    if not ok: timeline.append({"t": 6, "op": f"fluxo falhou: {err}"})
-    clients_iso = customers_interrupted(net, energized_buses(net))
-
-    candidates = ["R4B-B2 (tie)", "R5B-B3 (tie)"]
-    best = None
-    for tie in candidates:
-        close_line_by_name(net, tie)
-        ok2, err2 = run_powerflow(net)
-        if not ok2 or _violates_limits(net, limits):
-            open_line_by_name(net, tie); continue
-        energized = energized_buses(net)
-        c_after = customers_interrupted(net, energized)
-        prio = _priority_score_served(net, energized)
-        key = (prio, -c_after)
+def _evaluate_tie(net, tie: str, limits=None):
+    """Fecha a tie, avalia e reabre. Retorna ((prio, -clientes), clientes) ou None se inviável."""
+    close_line_by_name(net, tie)
+    try:
+        if limits:
+            # candidatos diferem por uma tie: a solução anterior é bom ponto de partida
+            ok, _ = run_powerflow(net, warm=True)
+            if not ok or _violates_limits(net, limits): return None
+        _, c_after, prio = load_accounting(net, energized_mask(net))
+        return (prio, -c_after), c_after
+    finally:
         open_line_by_name(net, tie)
-        if best is None or key > best[0]:
-            best = (key, tie, c_after)
-    if best:
-        _, best_tie, _ = best
-        close_line_by_name(net, best_tie)
-        timeline.append({"t": 7, "op": f"fechar {best_tie}"})
-        run_powerflow(net)
-    clients_after = customers_interrupted(net, energized_buses(net))
-    return timeline, clients_iso, clients_after
-
-def apply_event_and_operate(net, event: Event, limits: Optional[dict] = None) -> Tuple[List[dict], int, int, List[dict]]:
+
+# cópia da rede mantida por cada processo do pool, trocada quando muda o lote
+_WORKER_NET = {"key": None, "net": None}
+
+def _evaluate_tie_worker(key: str, path: str, tie: str, limits=None):
+    if _WORKER_NET["key"] != key:
+        _WORKER_NET["net"] = read_shared(path); _WORKER_NET["key"] = key
+    return _evaluate_tie(_WORKER_NET["net"], tie, limits)
+
+@timed("tie_search")
+def _evaluate_ties(net, candidates: List[str], limits=None, workers: Optional[int] = None,
+                   timeout_s: Optional[float] = None):
+    count("ties_evaluated", len(candidates))
+    workers = DEFAULT_WORKERS if workers is None else workers
+    # sem limites cada candidato é só conectividade: mais barato que serializar a rede para o pool
+    if workers <= 1 or len(candidates) <= 1 or not limits:
+        return [_evaluate_tie(net, tie, limits) for tie in candidates]
+    with shared(net) as (key, path):
+        return run_parallel(_evaluate_tie_worker, [(key, path, tie, limits) for tie in candidates],
+                            workers, timeout_s)
+
+# on_step(entrada, net): chamado a cada entrada da timeline, com a rede já manobrada
+StepCallback = Callable[[dict, object], None]
+
+class _Timeline:
+    """Timeline que repassa cada entrada a on_step no momento em que é executada."""
+    def __init__(self, net, on_step: Optional[StepCallback] = None):
+        self.net = net; self.on_step = on_step; self.entries: List[dict] = []
+
+    def add(self, op: str, t: Optional[int] = None) -> dict:
+        if t is None: t = self.entries[-1]["t"] + 1 if self.entries else 1
+        entry = {"t": t, "op": op}
+        self.entries.append(entry)
+        if self.on_step: self.on_step(entry, self.net)
+        return entry
+
+class OffTracker:
+    """
+    on_step que guarda o pior conjunto de cargas desligadas visto na timeline
+    (o estado isolado, antes da recomposição) e repassa a entrada a on_step.
+    """
+    def __init__(self, on_step: Optional[StepCallback] = None):
+        self.on_step = on_step; self.p_off = 0.0; self.off: Optional[np.ndarray] = None
+
+    def __call__(self, entry: dict, net):
+        off = ~energized_mask(net)[load_index(net).bus_pos]
+        p_off = float(net.load.p_mw.values[off].sum())
+        if self.off is None or p_off > self.p_off:
+            self.p_off = p_off; self.off = off
+        if self.on_step: self.on_step(entry, net)
+
+@timed("isolate_and_reconfigure")
+def isolate_and_reconfigure(net, target_line_name: str, limits=None, workers: Optional[int] = None,
+                            timeout_s: Optional[float] = None, locked: Iterable[str] = (),
+                            on_step: Optional[StepCallback] = None) -> Tuple[List[dict], int, int]:
+    from .planner import plan_restoration  # import tardio: planner depende deste módulo
+    tl = _Timeline(net, on_step)
+    _fail_line(net, target_line_name); tl.add(f"abrir {target_line_name}")
+    plan = plan_restoration(net, target_line_name, locked=locked, limits=limits,
+                            workers=workers, timeout_s=timeout_s, on_op=tl.add)
+    return tl.entries, plan.clients_isolated, plan.clients_after
+
+def restore_after_outage(net, device_name: str, limits=None, workers: Optional[int] = None,
+                         timeout_s: Optional[float] = None, on_step: Optional[StepCallback] = None,
+                         timeline: Optional[_Timeline] = None) -> Tuple[List[dict], int, int]:
+    """Dispositivo indisponível (aberto e travado): recompõe o que ficou sem fonte."""
+    from .planner import plan_restoration
+    tl = timeline or _Timeline(net, on_step)
+    _device_out_switch(net, device_name); tl.add(f"indisponibilidade: {device_name}")
+    plan = plan_restoration(net, None, locked={device_name}, limits=limits,
+                            workers=workers, timeout_s=timeout_s, on_op=tl.add)
+    return tl.entries, plan.clients_isolated, plan.clients_after
+
+def apply_event_and_operate(net, event: Event, limits: Optional[dict] = None, workers: Optional[int] = None,
+                            timeout_s: Optional[float] = None,
+                            on_step: Optional[StepCallback] = None) -> Tuple[List[dict], int, int, List[dict]]:
     ops_extra: List[dict] = []
     kind, name = parse_target(event.target)
     if event.type == "fault_permanent":
-        timeline, c_ini, c_pos = isolate_and_reconfigure(net, name, limits=limits)
+        timeline, c_ini, c_pos = isolate_and_reconfigure(net, name, limits=limits, workers=workers,
+                                                         timeout_s=timeout_s, on_step=on_step)
         return timeline, c_ini, c_pos, ops_extra
     if event.type == "fault_temporary":
+        from .radial import energized_after  # import tardio: radial depende deste módulo
+        tl = _Timeline(net, on_step)
+        on = energized_after(net, name)         # índice radial; None se malhada
         _fail_line(net, name); t = 1
-        ops = [{"t": t, "op": f"abrir {name} (falha temporária)"}]
-        run_powerflow(net)
-        clients_initial = customers_interrupted(net, energized_buses(net))
+        tl.add(f"abrir {name} (falha temporária)", t)
+        clients_initial = customers_interrupted(net, energized_mask(net) if on is None else on)
         t += max(1, int(event.duration_min or 2))
         _restore_line(net, name)
-        ops.append({"t": t, "op": f"religar {name} (após falha temporária)"})
-        ok2, err2 = run_powerflow(net)
-        if not ok2: ops.append({"t": t+1, "op": f"religamento falhou: {err2}"})
-        clients_after = customers_interrupted(net, energized_buses(net))
-        return ops, clients_initial, clients_after, ops_extra
+        tl.add(f"religar {name} (após falha temporária)", t)
+        if limits:
+            ok2, err2 = run_powerflow(net)
+            if not ok2: tl.add(f"religamento falhou: {err2}", t+1)
+        clients_after = customers_interrupted(net, energized_mask(net))
+        return tl.entries, clients_initial, clients_after, ops_extra
     if event.type == "device_out":
-        _device_out_switch(net, name); ops_extra.append({"t": 1, "op": f"indisponibilidade: {name}"})
-        timeline, c_ini, c_pos = isolate_and_reconfigure(net, "R3B-B3", limits=limits)
-        return ops_extra + timeline, c_ini, c_pos, ops_extra
+        timeline, c_ini, c_pos = restore_after_outage(net, name, limits=limits, workers=workers,
+                                                      timeout_s=timeout_s, on_step=on_step)
+        ops_extra.append(timeline[0])
+        return timeline, c_ini, c_pos, ops_extra
     return [], 0, 0, ops_extra
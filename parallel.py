@@ -0,0 +1,116 @@
+import hashlib
+import os
+import pickle
+import tempfile
+import time
+from contextlib import contextmanager
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from threading import Lock
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+# ------------------------------------------------------------------
+#  Pools de processos compartilhados pelas avaliações em lote (candidatos
+#  de tie etc.), um por nº de workers: pedidos com tamanhos diferentes
+#  não derrubam o pool um do outro. Cada worker mantém sua própria cópia
+#  da rede: o lote grava a rede uma vez (shared) e as tarefas levam só a
+#  chave e o caminho; cada worker lê o arquivo uma vez por lote.
+#   SIM_WORKERS    : nº de processos (0/1 = execução sequencial)
+#   SIM_TIMEOUT_S  : tempo máximo por tarefa, contado da submissão
+#   SIM_MAX_WORKERS: teto de processos por pool (e do nº de pools)
+# ------------------------------------------------------------------
+DEFAULT_WORKERS = int(os.getenv("SIM_WORKERS", "0"))
+DEFAULT_TIMEOUT_S = float(os.getenv("SIM_TIMEOUT_S", "30"))
+MAX_WORKERS = max(1, int(os.getenv("SIM_MAX_WORKERS", str(max(8, os.cpu_count() or 1)))))
+
+_POOLS: Dict[int, ProcessPoolExecutor] = {}
+_POOL_LOCK = Lock()
+
+# arquivos do lote em memória (tmpfs) quando houver
+_SHARED_DIR = "/dev/shm" if os.path.isdir("/dev/shm") else None
+
+@contextmanager
+def shared(obj) -> Iterator[Tuple[str, str]]:
+    """Grava obj uma vez para os workers do lote; produz (chave, caminho), apagado na saída."""
+    blob = pickle.dumps(obj, protocol=pickle.HIGHEST_PROTOCOL)
+    fd, path = tempfile.mkstemp(prefix="sim-", suffix=".pkl", dir=_SHARED_DIR)
+    try:
+        with os.fdopen(fd, "wb") as f: f.write(blob)
+        yield hashlib.sha1(blob).hexdigest(), path
+    finally:
+        os.unlink(path)
+
+def read_shared(path: str) -> Any:
+    """No worker: lê o objeto gravado por shared()."""
+    with open(path, "rb") as f:
+        return pickle.load(f)
+
+def get_pool(workers: int) -> ProcessPoolExecutor:
+    workers = max(1, min(workers, MAX_WORKERS))
+    with _POOL_LOCK:
+        pool = _POOLS.get(workers)
+        if pool is None:
+            pool = _POOLS[workers] = ProcessPoolExecutor(max_workers=workers)
+        return pool
+
+def _discard_pool(pool: ProcessPoolExecutor):
+    """Pool quebrado (worker morreu): sai do registro; o próximo pedido cria outro."""
+    with _POOL_LOCK:
+        for k, p in list(_POOLS.items()):
+            if p is pool: del _POOLS[k]
+    pool.shutdown(wait=False, cancel_futures=True)
+
+def _result(fut: Future, pool: ProcessPoolExecutor) -> Optional[Any]:
+    try:
+        return fut.result(timeout=0)
+    except BrokenProcessPool:
+        _discard_pool(pool); return None
+    except Exception:
+        return None
+
+def iter_parallel(fn: Callable[..., Any], tasks: Sequence[tuple], workers: int,
+                  timeout_s: Optional[float] = None) -> Iterator[Tuple[int, Optional[Any]]]:
+    """
+    Executa fn(*task) para cada tarefa no pool e produz (posição, resultado)
+    na ordem das tarefas, à medida que ficam prontos. No máximo `workers`
+    tarefas ficam submetidas por vez e cada uma tem seu prazo, timeout_s a
+    partir da própria submissão: n tarefas lentas custam ~n/workers prazos,
+    não n. Tarefas que estouram o prazo ou falham produzem None. Uma tarefa
+    em execução não é interrompida: o resultado é apenas descartado.
+    """
+    timeout_s = DEFAULT_TIMEOUT_S if timeout_s is None else timeout_s
+    pool = get_pool(workers)
+    window = pool._max_workers
+    todo = iter(enumerate(tasks))
+    running: Dict[Future, Tuple[int, float]] = {}
+    ready: Dict[int, Optional[Any]] = {}
+    nxt = 0
+
+    def fill():
+        while len(running) < window:
+            item = next(todo, None)
+            if item is None: return
+            try:
+                running[pool.submit(fn, *item[1])] = (item[0], time.monotonic() + timeout_s)
+            except (BrokenProcessPool, RuntimeError):   # pool quebrado/encerrado por outro pedido
+                _discard_pool(pool); ready[item[0]] = None
+
+    fill()
+    while running or nxt in ready:
+        if running:
+            first = min(d for _, d in running.values())
+            done, _ = wait(running, timeout=max(0.0, first - time.monotonic()), return_when=FIRST_COMPLETED)
+            now = time.monotonic()
+            for fut, (i, deadline) in list(running.items()):
+                if fut in done: ready[i] = _result(fut, pool)
+                elif now >= deadline: fut.cancel(); ready[i] = None
+                else: continue
+                del running[fut]
+            fill()
+        while nxt in ready:
+            yield nxt, ready.pop(nxt); nxt += 1
+
+def run_parallel(fn: Callable[..., Any], tasks: Sequence[tuple], workers: int,
+                 timeout_s: Optional[float] = None) -> List[Optional[Any]]:
+    """Como iter_parallel, mas devolve a lista completa de resultados."""
+    return [res for _, res in iter_parallel(fn, tasks, workers, timeout_s)]
@@ -0,0 +1,191 @@
+import os
+import time
+from dataclasses import dataclass, field
+from typing import Callable, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from .model import customers_from_mw, is_switch
+from .ops import (_evaluate_ties, apply_switching, close_line_by_name, energized_mask,
+                  load_accounting, load_index, open_line_by_name, run_powerflow)
+from .topology import connectivity, name_index, per_net
+
+# ------------------------------------------------------------------
+#  Planejador de recomposição:
+#   1) isola o trecho sob defeito abrindo as chaves da sua fronteira;
+#   2) busca em profundidade (branch-and-bound) sequências de manobras
+#      em chaves manobráveis (RCL-*, CH-*, ties) que reenergizam trechos
+#      sãos, mantendo a rede radial e dentro dos limites.
+#  A busca para ao esgotar o orçamento de tempo e devolve o melhor plano.
+# ------------------------------------------------------------------
+DEFAULT_BUDGET_S = float(os.getenv("SIM_PLAN_BUDGET_S", "2.0"))
+DEFAULT_MAX_STEPS = int(os.getenv("SIM_PLAN_MAX_STEPS", "6"))
+
+@dataclass
+class RestorationPlan:
+    isolate: List[str] = field(default_factory=list)              # chaves abertas para isolar o defeito
+    steps: List[Tuple[str, str]] = field(default_factory=list)    # ("abrir" | "fechar", chave)
+    clients_isolated: int = 0
+    clients_after: int = 0
+    prio_served: int = 0
+    explored: int = 0
+    complete: bool = True          # False se o orçamento acabou antes de esgotar a busca
+    notes: List[str] = field(default_factory=list)
+
+class SwitchIndex:
+    """Linhas manobráveis da rede (posições em net.line)."""
+    def __init__(self, net):
+        names = net.line.name.tolist()
+        self.mask = np.array([is_switch(n or "") for n in names], dtype=bool)
+        self.pos = np.flatnonzero(self.mask)
+        self.names = [names[i] for i in self.pos.tolist()]
+
+def switch_index(net) -> SwitchIndex:
+    return per_net(net, "switches", SwitchIndex)
+
+def isolation_zone(net, fault_line: str) -> Tuple[np.ndarray, List[str]]:
+    """
+    Trecho sob defeito (máscara posicional de barras), delimitado pelas chaves
+    mais próximas, e as chaves fechadas da fronteira que precisam abrir.
+    Se o defeito é na própria chave, o trecho é vazio: basta abri-la.
+    """
+    return isolation_zones(net, [fault_line])
+
+def isolation_zones(net, fault_lines: Iterable[str]) -> Tuple[np.ndarray, List[str]]:
+    """Como isolation_zone para vários defeitos simultâneos, numa busca só (união dos trechos)."""
+    conn = connectivity(net); sw = switch_index(net)
+    zone = [False] * conn.n_bus
+    pos = name_index(net).line_pos
+    faults = {pos[n] for n in fault_lines if n in pos and not sw.mask[pos[n]]}
+    if not faults:
+        return np.array(zone, dtype=bool), []
+    n_line = len(net.line)
+    closed = np.concatenate([net.line.in_service.values.astype(bool),
+                             net.trafo.in_service.values.astype(bool)]).tolist()
+    is_sw = sw.mask.tolist()
+    stack = [int(u) for p in sorted(faults) for u in (conn.f[p], conn.t[p])]
+    for u in stack: zone[u] = True
+    boundary = set()
+    while stack:
+        u = stack.pop()
+        for v, e in conn.adj[u]:
+            if e in faults or not closed[e]: continue
+            if e < n_line and is_sw[e]:
+                boundary.add(e); continue
+            if not zone[v]:
+                zone[v] = True; stack.append(v)
+    # chave da fronteira que só leva a um ramo morto (sem fonte nem carga, ex.: o trecho de tie até o
+    # religador NA) não precisa abrir: o ramo entra no trecho e as chaves já abertas além dele o delimitam
+    # (e ficam fora dos candidatos do planejador, que não fecham chaves encostadas no trecho)
+    eg = net.ext_grid.in_service.values.astype(bool)
+    live = set(net.bus.index.get_indexer(net.ext_grid.bus.values[eg]).tolist())
+    live.update(net.bus.index.get_indexer(net.load.bus.values[net.load.in_service.values.astype(bool)]).tolist())
+    for e in sorted(boundary):
+        u = int(conn.f[e]) if not zone[conn.f[e]] else int(conn.t[e])
+        if zone[u]: continue
+        seen = {u}; stack = [u]; dead = True
+        while stack and dead:
+            x = stack.pop()
+            if x in live: dead = False; break
+            for v, b in conn.adj[x]:
+                if b != e and b not in faults and closed[b] and not zone[v] and v not in seen:
+                    seen.add(v); stack.append(v)
+        if dead:
+            for x in seen: zone[x] = True
+            boundary.discard(e)
+    names = net.line.name.tolist()
+    return np.array(zone, dtype=bool), [names[e] for e in sorted(boundary)]
+
+def plan_restoration(net, fault_line: Optional[str] = None, locked: Iterable[str] = (), limits=None,
+                     budget_s: Optional[float] = None, max_steps: Optional[int] = None,
+                     workers: Optional[int] = None, timeout_s: Optional[float] = None,
+                     on_op: Optional[Callable[[str], object]] = None) -> RestorationPlan:
+    """
+    Isola fault_line (se houver) e busca a melhor recomposição. Chaves em `locked`
+    não são manobradas. Critério igual ao da avaliação de ties:
+    (prioridade atendida, -clientes interrompidos), com menos manobras no empate.
+    Ao final, `net` fica na configuração do melhor plano; on_op("abrir X" | ...)
+    é chamado a cada manobra efetivamente executada, com a rede já manobrada.
+    """
+    report = on_op or (lambda _op: None)
+    budget_s = DEFAULT_BUDGET_S if budget_s is None else budget_s
+    max_steps = DEFAULT_MAX_STEPS if max_steps is None else max_steps
+    plan = RestorationPlan()
+    forbidden = set(locked)
+    zone = np.zeros(len(net.bus), dtype=bool)
+    if fault_line:
+        zone, boundary = isolation_zone(net, fault_line)
+        apply_switching(net, open_names=[fault_line])
+        for name in boundary:
+            open_line_by_name(net, name); report(f"abrir {name}")
+        plan.isolate = boundary
+        forbidden |= set(boundary) | {fault_line}
+    if limits:
+        ok, err = run_powerflow(net)
+        if not ok:
+            plan.notes.append(f"fluxo falhou: {err}"); report(plan.notes[-1])
+
+    _, c_iso, prio = load_accounting(net, energized_mask(net))
+    plan.clients_isolated = c_iso
+
+    # limite otimista: tudo fora do trecho isolado volta a ser atendido
+    li = load_index(net)
+    in_zone = zone[li.bus_pos]
+    prio_ub = int(li.prio[~in_zone].sum())
+    c_lb = customers_from_mw(float(net.load.p_mw.values[in_zone].sum()))
+
+    conn = connectivity(net); sw = switch_index(net)
+    f = conn.f.tolist(); t = conn.t.tolist(); zone_l = zone.tolist()
+    cand = [(i, n) for i, n in zip(sw.pos.tolist(), sw.names)
+            if n not in forbidden and not zone_l[f[i]] and not zone_l[t[i]]]
+    best = [(prio, -c_iso, 0), []]
+    seen = set()
+    t_end = time.perf_counter() + budget_s
+
+    def dfs(steps: List[Tuple[str, str]], key: tuple):
+        plan.explored += 1
+        if key > best[0]:
+            best[0] = key; best[1] = list(steps)
+        if len(steps) >= max_steps or (prio_ub, -c_lb, -(len(steps) + 1)) <= best[0]:
+            return
+        if time.perf_counter() > t_end:
+            plan.complete = False; return
+
+        on = energized_mask(net).tolist()
+        in_svc = net.line.in_service.values.astype(bool).tolist()
+        # fechar só chaves entre uma barra energizada e uma ilha morta: mantém a radialidade
+        closes = [n for i, n in cand if not in_svc[i] and on[f[i]] != on[t[i]]]
+        results = _evaluate_ties(net, closes, limits, workers, timeout_s)
+        children = sorted(((r[0], n) for n, r in zip(closes, results) if r is not None), reverse=True)
+        for (c_prio, c_neg), name in children:
+            nxt = steps + [("fechar", name)]
+            sig = frozenset(nxt)
+            if sig in seen: continue
+            seen.add(sig)
+            close_line_by_name(net, name)
+            dfs(nxt, (c_prio, c_neg, -len(nxt)))
+            open_line_by_name(net, name)
+
+        # com limites violados, abrir chaves dentro de ilhas mortas permite recompor em partes
+        if limits and len(children) < len(closes):
+            for i, name in cand:
+                if not in_svc[i] or on[f[i]] or on[t[i]]: continue
+                nxt = steps + [("abrir", name)]
+                sig = frozenset(nxt)
+                if sig in seen: continue
+                seen.add(sig)
+                open_line_by_name(net, name)
+                dfs(nxt, (key[0], key[1], -len(nxt)))
+                close_line_by_name(net, name)
+
+    dfs([], best[0])
+
+    plan.steps = best[1]
+    for op, name in plan.steps:
+        if op == "abrir": open_line_by_name(net, name)
+        else: close_line_by_name(net, name)
+        report(f"{op} {name}")
+    if limits and plan.steps:
+        run_powerflow(net, warm=True)
+    _, plan.clients_after, plan.prio_served = load_accounting(net, energized_mask(net))
+    return plan
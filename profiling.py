@@ -0,0 +1,116 @@
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+from functools import wraps
+from typing import Dict, List, Optional
+
+# ------------------------------------------------------------------
+#  Instrumentação leve: spans (tempo por etapa) e contadores somados no
+#  processo, expostos em /metrics no formato texto do Prometheus. Um
+#  request com o header X-Sim-Debug recebe também o próprio detalhamento
+#  (Server-Timing), coletado numa ContextVar que segue até o executor.
+#   SIM_METRICS : "0" desliga tudo (span/count viram no-op)
+# ------------------------------------------------------------------
+ENABLED = os.getenv("SIM_METRICS", "1") != "0"
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+class _Hist:
+    __slots__ = ("count", "sum", "max", "buckets")
+    def __init__(self):
+        self.count = 0; self.sum = 0.0; self.max = 0.0; self.buckets = [0] * (len(BUCKETS) + 1)
+
+_HIST: Dict[str, _Hist] = {}
+_COUNTERS: Dict[str, float] = {}
+_LOCK = threading.Lock()
+# detalhamento do request atual: {"spans": {nome: [n, s]}, "counters": {nome: v}}
+_TRACE: ContextVar[Optional[dict]] = ContextVar("sim_trace", default=None)
+
+def observe(name: str, seconds: float):
+    if not ENABLED: return
+    with _LOCK:
+        h = _HIST.get(name)
+        if h is None: h = _HIST[name] = _Hist()
+        h.count += 1; h.sum += seconds
+        if seconds > h.max: h.max = seconds
+        h.buckets[bisect_left(BUCKETS, seconds)] += 1
+    tr = _TRACE.get()
+    if tr is not None:
+        e = tr["spans"].setdefault(name, [0, 0.0]); e[0] += 1; e[1] += seconds
+
+def count(name: str, n: float = 1):
+    if not ENABLED: return
+    with _LOCK:
+        _COUNTERS[name] = _COUNTERS.get(name, 0) + n
+    tr = _TRACE.get()
+    if tr is not None:
+        tr["counters"][name] = tr["counters"].get(name, 0) + n
+
+class _Span:
+    __slots__ = ("name", "t0")
+    def __init__(self, name: str): self.name = name
+    def __enter__(self): self.t0 = time.perf_counter(); return self
+    def __exit__(self, *exc): observe(self.name, time.perf_counter() - self.t0)
+
+class _Noop:
+    def __enter__(self): return self
+    def __exit__(self, *exc): pass
+
+_NOOP = _Noop()
+
+def span(name: str):
+    """with span("etapa"): ...  — soma o tempo em /metrics e no trace do request."""
+    return _Span(name) if ENABLED else _NOOP
+
+def timed(name: str):
+    """Decorador equivalente a span; desligado, devolve a função original."""
+    def deco(fn):
+        if not ENABLED: return fn
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            with _Span(name): return fn(*args, **kwargs)
+        return wrapper
+    return deco
+
+def start_trace():
+    """Começa o detalhamento do request atual; devolve (trace, token para end_trace)."""
+    tr = {"spans": {}, "counters": {}}
+    return tr, _TRACE.set(tr)
+
+def end_trace(token):
+    _TRACE.reset(token)
+
+def server_timing(tr: dict) -> str:
+    """Header Server-Timing: uma entrada por span (ms somados e nº de chamadas)."""
+    parts = [f'{n.replace(".", "-")};dur={s * 1000:.2f};desc="{c}x"' for n, (c, s) in tr["spans"].items()]
+    parts += [f'{n.replace(".", "-")};desc="{v:g}"' for n, v in tr["counters"].items()]
+    return ", ".join(parts)
+
+def _fmt(v: float) -> str:
+    return repr(float(v)) if v != int(v) else str(int(v))
+
+def render_prometheus(gauges: Optional[Dict[str, float]] = None) -> str:
+    with _LOCK:
+        hist = {k: (h.count, h.sum, h.max, list(h.buckets)) for k, h in _HIST.items()}
+        counters = dict(_COUNTERS)
+    out: List[str] = []
+    out += ["# HELP sim_stage_seconds Tempo por etapa do simulador", "# TYPE sim_stage_seconds histogram"]
+    for name, (n, s, _, b) in sorted(hist.items()):
+        acc = 0
+        for le, c in zip((*BUCKETS, "+Inf"), b):
+            acc += c
+            out.append(f'sim_stage_seconds_bucket{{stage="{name}",le="{le}"}} {acc}')
+        out.append(f'sim_stage_seconds_sum{{stage="{name}"}} {_fmt(s)}')
+        out.append(f'sim_stage_seconds_count{{stage="{name}"}} {n}')
+    out += ["# HELP sim_stage_seconds_max Maior duração observada por etapa", "# TYPE sim_stage_seconds_max gauge"]
+    out += [f'sim_stage_seconds_max{{stage="{name}"}} {_fmt(m)}' for name, (_, _, m, _) in sorted(hist.items())]
+    out += ["# HELP sim_events_total Contadores do simulador", "# TYPE sim_events_total counter"]
+    out += [f'sim_events_total{{name="{name}"}} {_fmt(v)}' for name, v in sorted(counters.items())]
+    for name, v in sorted((gauges or {}).items()):
+        out += [f"# TYPE {name} gauge", f"{name} {_fmt(v)}"]
+    return "\n".join(out) + "\n"
+
+def reset():
+    with _LOCK:
+        _HIST.clear(); _COUNTERS.clear()
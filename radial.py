@@ -0,0 +1,260 @@
+import threading
+from bisect import bisect_left, bisect_right
+from dataclasses import dataclass
+from typing import List, Optional
+
+import numpy as np
+
+from .model import SWITCH_PREFIXES, customers_from_mw
+from .ops import load_index
+from .profiling import count, span
+from .topology import connectivity, name_index, per_net
+
+# ------------------------------------------------------------------
+#  Índice radial da configuração: árvore a partir das barras das ext_grid
+#  numerada em pré-ordem (a subárvore de b é o intervalo [tin[b], tin[b] +
+#  size[b])), com somas de prefixo de MW e prioridade das cargas e, por
+#  barra, o dispositivo de proteção (RCL-*, CH-*) mais próximo a montante.
+#  "O que desliga se X abrir" e "quem isola um defeito em Y" viram
+#  consultas O(log n) sem percorrer a rede. Abrir/fechar um ramo da árvore
+#  só corta/devolve um intervalo; qualquer outra troca (fechar tie, rede
+#  malhada) reconstrói o índice. Em configuração malhada as consultas
+#  devolvem None e o chamador usa o caminho por energized_mask.
+# ------------------------------------------------------------------
+MAX_INCREMENTAL = 8     # acima disso (ramos trocados desde a última consulta) reconstrói
+
+@dataclass
+class Impact:
+    line: str
+    device: Optional[str]   # quem abre: o próprio ramo (abertura) ou a proteção a montante (defeito)
+    buses: np.ndarray       # posições em net.bus que perdem energia
+    p_mw: float
+    customers: int
+    prio: int               # score de prioridade que deixa de ser atendido
+
+class RadialIndex:
+    def __init__(self, net):
+        with span("radial.build"):
+            self._build(net)
+        count("radial.builds")
+
+    def _build(self, net):
+        from scipy.sparse import coo_matrix  # import tardio: scipy só na primeira consulta
+        from scipy.sparse.csgraph import depth_first_order
+        conn = connectivity(net)
+        n = self.n_bus = conn.n_bus
+        self.n_line = conn.n_line
+        self.closed = _closed(net)
+        bus_on = net.bus.in_service.values.astype(bool)
+        eg_on = net.ext_grid.in_service.values.astype(bool)
+        roots = np.unique(net.bus.index.get_indexer(net.ext_grid.bus.values[eg_on]))
+        roots = roots[bus_on[roots]]
+        e = np.flatnonzero(self.closed & bus_on[conn.f] & bus_on[conn.t])
+        # nó virtual n ligado a todas as fontes: uma DFS só cobre todos os alimentadores
+        rows = np.concatenate([conn.f[e], np.full(len(roots), n)])
+        cols = np.concatenate([conn.t[e], roots])
+        g = coo_matrix((np.ones(len(rows)), (rows, cols)), shape=(n + 1, n + 1)).tocsr()
+        order, pred = depth_first_order(g, n, directed=False, return_predecessors=True)
+        order = order[1:].astype(np.int64)
+        parent = pred[:n].astype(np.int64)
+        self.reached = np.zeros(n, dtype=bool); self.reached[order] = True
+        # árvore: ramos ligados dentro da parte alimentada == barras alimentadas - fontes
+        self.radial = int(self.reached[conn.f[e]].sum()) == len(order) - len(roots)
+
+        tin = np.full(n, -1, dtype=np.int64); tin[order] = np.arange(len(order))
+        # ramo que liga cada barra ao pai; child: ramo da árvore -> barra do lado de baixo
+        ef, et = conn.f[e], conn.t[e]
+        br = np.full(n, -1, dtype=np.int64)
+        down = parent[et] == ef; up = (parent[ef] == et) & ~down
+        br[et[down]] = e[down]; br[ef[up]] = e[up]
+        child = np.full(len(conn.f), -1, dtype=np.int64)
+        tree = np.flatnonzero(br >= 0)
+        child[br[tree]] = tree
+
+        # níveis de profundidade (pré-ordem: pai antes do filho, uma passada)
+        par = parent.tolist(); dep = [0] * n
+        for b in order.tolist():
+            dep[b] = dep[par[b]] + 1 if par[b] != n else 0
+        depth = np.array(dep, dtype=np.int64)
+        levels = [order[depth[order] == d] for d in range(1, int(depth.max(initial=0)) + 1)]
+
+        size = np.ones(n, dtype=np.int64)
+        for lvl in reversed(levels):
+            np.add.at(size, parent[lvl], size[lvl])
+        names = net.line.name.tolist()
+        is_dev = np.zeros(len(conn.f), dtype=bool)
+        is_dev[:self.n_line] = [str(x or "").startswith(SWITCH_PREFIXES) for x in names]
+        # dispositivo a montante (ramo) e fonte de cada barra, propagados da raiz para baixo
+        dev = np.full(n, -1, dtype=np.int64)
+        top = np.arange(n, dtype=np.int64)
+        for lvl in levels:
+            b = br[lvl]
+            dev[lvl] = np.where(is_dev[b], b, dev[parent[lvl]])
+            top[lvl] = top[parent[lvl]]
+
+        self.order = order; self.tin = tin; self.size = size
+        self.child = child; self.device = dev; self.top = top; self.line_names = names
+        self.f = conn.f; self.t = conn.t
+        self.cuts: List[int] = []   # tin das subárvores cortadas por ramos abertos, ordenado
+        self.refresh_loads(net)
+
+    def refresh_loads(self, net):
+        """Somas de prefixo, em pré-ordem, de MW e prioridade por barra."""
+        li = load_index(net)
+        self.p = net.load.p_mw.values.astype(float).copy()
+        ok = li.bus_pos >= 0
+        p_bus = np.zeros(self.n_bus); prio_bus = np.zeros(self.n_bus, dtype=np.int64)
+        np.add.at(p_bus, li.bus_pos[ok], self.p[ok]); np.add.at(prio_bus, li.bus_pos[ok], li.prio[ok])
+        self.cs_p = np.concatenate([[0.0], np.cumsum(p_bus[self.order])])
+        self.cs_prio = np.concatenate([[0], np.cumsum(prio_bus[self.order])])
+
+    # ---------- atualização incremental ----------
+    def toggle(self, e: int, closed: bool) -> bool:
+        """Aplica a troca de estado do ramo e; False se exigir reconstrução."""
+        c = int(self.child[e])
+        if self.radial and c < 0 and not (self.reached[self.f[e]] or self.reached[self.t[e]]):
+            # ramo entre barras fora da árvore (ilha sem fonte): não muda nada; religar a
+            # ilha exige fechar um ramo a partir da árvore, que reconstrói o índice
+            self.closed[e] = closed
+            return True
+        if not self.radial or c < 0:
+            return False
+        t = int(self.tin[c])
+        i = bisect_left(self.cuts, t)
+        has = i < len(self.cuts) and self.cuts[i] == t
+        if closed and has: del self.cuts[i]
+        elif not closed and not has: self.cuts.insert(i, t)
+        self.closed[e] = closed
+        return True
+
+    # ---------- consultas ----------
+    def _live(self, lo: int, hi: int, cuts: Optional[List[int]] = None):
+        """Trechos de [lo, hi) em pré-ordem ainda alimentados (descontados os cortes)."""
+        cuts = self.cuts if cuts is None else cuts
+        out = []; cur = lo
+        for c in cuts[bisect_left(cuts, lo):bisect_left(cuts, hi)]:
+            if c >= cur:
+                if c > cur: out.append((cur, c))
+                cur = c + int(self.size[self.order[c]])
+        if cur < hi: out.append((cur, hi))
+        return out
+
+    def _sum(self, lo: int, hi: int):
+        p = 0.0; prio = 0; parts = []
+        for a, b in self._live(lo, hi):
+            p += self.cs_p[b] - self.cs_p[a]; prio += int(self.cs_prio[b] - self.cs_prio[a])
+            parts.append(self.order[a:b])
+        return p, prio, (np.concatenate(parts) if parts else np.zeros(0, dtype=np.int64))
+
+    def energized(self, b: int) -> bool:
+        if not self.reached[b]: return False
+        t = int(self.tin[b])
+        return not any(c <= t < c + int(self.size[self.order[c]])
+                       for c in self.cuts[:bisect_right(self.cuts, t)])
+
+    def mask(self, open_pos: Optional[int] = None) -> np.ndarray:
+        """Máscara de barras alimentadas (como energized_mask), opcionalmente com a linha aberta."""
+        cuts = self.cuts
+        c = -1 if open_pos is None else int(self.child[open_pos])
+        if c >= 0 and self.closed[open_pos]:
+            t = int(self.tin[c]); cuts = list(cuts)
+            i = bisect_left(cuts, t)
+            if i == len(cuts) or cuts[i] != t: cuts.insert(i, t)
+        on = np.zeros(self.n_bus, dtype=bool)
+        for a, b in self._live(0, len(self.order), cuts):
+            on[self.order[a:b]] = True
+        return on
+
+    def _impact(self, line: str, device: Optional[str], b: Optional[int]) -> Impact:
+        if b is None or not self.energized(b):
+            return Impact(line, device, np.zeros(0, dtype=np.int64), 0.0, 0, 0)
+        t = int(self.tin[b])
+        p, prio, buses = self._sum(t, t + int(self.size[b]))
+        return Impact(line, device, buses, p, customers_from_mw(p), prio)
+
+    def open_impact(self, pos: int) -> Optional[Impact]:
+        """O que perde energia se a linha (posição em net.line) abrir; None se malhada."""
+        if not self.radial: return None
+        name = self.line_names[pos]
+        c = int(self.child[pos])
+        return self._impact(name, name, c if c >= 0 and self.closed[pos] else None)
+
+    def isolating_device(self, pos: int) -> Optional[str]:
+        """Proteção mais próxima a montante da linha (ela mesma, se for chave)."""
+        c = int(self.child[pos])
+        if c < 0 or not self.radial: return None
+        d = int(self.device[c])
+        return self.line_names[d] if d >= 0 else None
+
+    def fault_impact(self, pos: int) -> Optional[Impact]:
+        """Defeito na linha: abre a proteção a montante (ou a SE, sem chave); None se malhada."""
+        if not self.radial: return None
+        name = self.line_names[pos]
+        c = int(self.child[pos])
+        if c < 0 or not self.closed[pos]:
+            return self._impact(name, None, None)
+        d = int(self.device[c])
+        if d >= 0:
+            return self._impact(name, self.line_names[d], int(self.child[d]))
+        return self._impact(name, None, int(self.top[c]))
+
+def _closed(net) -> np.ndarray:
+    return np.concatenate([net.line.in_service.values.astype(bool), net.trafo.in_service.values.astype(bool)])
+
+def _holder(_net):
+    return {"idx": None, "lock": threading.Lock()}
+
+class _Bound:
+    """Índice sincronizado com o estado atual de net, usado sob o lock do índice."""
+    def __init__(self, net):
+        self.holder = per_net(net, "radial", _holder)
+        self.net = net
+
+    def __enter__(self) -> RadialIndex:
+        self.holder["lock"].acquire()
+        try:
+            return self._sync()
+        except BaseException:
+            self.holder["lock"].release(); raise
+
+    def __exit__(self, *exc):
+        self.holder["lock"].release()
+
+    def _sync(self) -> RadialIndex:
+        net = self.net; idx = self.holder["idx"]
+        closed = _closed(net)
+        if idx is not None:
+            changed = np.flatnonzero(idx.closed != closed).tolist()
+            if len(changed) <= MAX_INCREMENTAL and all(idx.toggle(e, bool(closed[e])) for e in changed):
+                if changed: count("radial.incremental", len(changed))
+                if not np.array_equal(idx.p, net.load.p_mw.values):
+                    idx.refresh_loads(net)
+                return idx
+        idx = self.holder["idx"] = RadialIndex(net)
+        return idx
+
+def radial_index(net) -> _Bound:
+    """with radial_index(net) as idx: ...  — índice da configuração atual (redes irmãs o compartilham)."""
+    return _Bound(net)
+
+def open_impact(net, line: str) -> Optional[Impact]:
+    pos = name_index(net).line_pos.get(line)
+    if pos is None: raise KeyError(line)
+    with span("radial.query"), radial_index(net) as idx:
+        return idx.open_impact(pos)
+
+def fault_impact(net, line: str) -> Optional[Impact]:
+    pos = name_index(net).line_pos.get(line)
+    if pos is None: raise KeyError(line)
+    with span("radial.query"), radial_index(net) as idx:
+        return idx.fault_impact(pos)
+
+def energized_after(net, line: Optional[str] = None) -> Optional[np.ndarray]:
+    """Máscara de energized_mask (com a linha aberta, se dada) sem busca no grafo.
+    None se a configuração for malhada ou a linha não existir: o chamador usa energized_mask."""
+    pos = None
+    if line is not None:
+        pos = name_index(net).line_pos.get(line)
+        if pos is None: return None
+    with span("radial.query"), radial_index(net) as idx:
+        return idx.mask(pos) if idx.radial else None
@@ -0,0 +1,179 @@
+import hashlib
+import json
+import os
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from threading import Lock
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from .contingency import default_targets, iter_contingencies
+from .model import customers_from_mw
+from .parallel import DEFAULT_WORKERS, iter_parallel
+
+# ------------------------------------------------------------------
+#  Confiabilidade por Monte Carlo: cada trecho tem taxa de falha
+#  (falhas/ano) e tempo médio de reparo. O efeito de cada falha
+#  (clientes/MW isolados e após a recomposição) vem da varredura N-1
+#  com a lógica de apply_event_and_operate, calculada uma vez por
+#  configuração; a amostragem de anos é só numpy, em blocos de tamanho
+#  fixo (resultado independe do nº de processos para a mesma semente).
+#   SIM_OUTCOMES_CACHE : configurações com tabela N-1 guardada (LRU)
+# ------------------------------------------------------------------
+DEFAULT_LAMBDA_PER_KM = 0.1     # falhas por km por ano
+DEFAULT_REPAIR_H = 4.0          # tempo médio de reparo (exponencial)
+DEFAULT_SWITCH_H = 1.0          # tempo até a recomposição por manobra
+CHUNK_YEARS = 10_000
+OUTCOMES_CACHE = int(os.getenv("SIM_OUTCOMES_CACHE", "32"))
+
+@dataclass
+class ElementModel:
+    names: List[str]
+    rate: np.ndarray        # falhas/ano
+    repair_h: np.ndarray
+    c_ini: np.ndarray       # clientes interrompidos no estado isolado
+    c_after: np.ndarray     # clientes ainda sem energia após a recomposição
+    p_ini: np.ndarray       # MW
+    p_after: np.ndarray
+
+@dataclass
+class ReliabilityResult:
+    years: int
+    seed: Optional[int]
+    customers_total: int
+    kpis: Dict[str, Dict[str, float]] = field(default_factory=dict)
+    elements: List[dict] = field(default_factory=list)    # contribuição esperada por trecho
+    errors: List[dict] = field(default_factory=list)
+    elapsed_s: float = 0.0
+
+# efeitos por contingência, por configuração (estrutura + manobras + cargas + limites)
+_OUTCOMES: "OrderedDict[str, Dict[str, dict]]" = OrderedDict()
+_OUTCOMES_LOCK = Lock()
+
+def _outcomes_key(net, limits) -> str:
+    # a rede inteira entra na chave: alimentadores diferentes podem repetir nomes
+    h = hashlib.sha1(json.dumps([net.bus.name.tolist(), net.line.name.tolist()]).encode())
+    for arr in (net.line.from_bus.values, net.line.to_bus.values, net.line.length_km.values,
+                net.trafo.hv_bus.values, net.trafo.lv_bus.values, net.load.bus.values):
+        h.update(arr.astype(float).tobytes())
+    h.update(net.line.in_service.values.astype(bool).tobytes())
+    h.update(net.trafo.in_service.values.astype(bool).tobytes())
+    h.update(net.load.p_mw.values.astype(float).tobytes())
+    h.update(json.dumps(limits, sort_keys=True).encode())
+    return h.hexdigest()
+
+def contingency_outcomes(net, limits=None, workers: Optional[int] = None,
+                         timeout_s: Optional[float] = None) -> Dict[str, dict]:
+    """Efeito de uma falha permanente em cada trecho (cache por configuração)."""
+    key = _outcomes_key(net, limits)
+    with _OUTCOMES_LOCK:
+        hit = _OUTCOMES.get(key)
+        if hit is not None: _OUTCOMES.move_to_end(key)
+    if hit is not None:
+        return hit
+    targets = default_targets(net, "fault_permanent")
+    rows = {r["target"]: r for r in iter_contingencies(net, "fault_permanent", targets, interruption_min=0.0,
+                                                       limits=limits, workers=workers, timeout_s=timeout_s)}
+    with _OUTCOMES_LOCK:
+        _OUTCOMES[key] = rows; _OUTCOMES.move_to_end(key)
+        while len(_OUTCOMES) > max(0, OUTCOMES_CACHE):
+            _OUTCOMES.popitem(last=False)
+    return rows
+
+def clear_outcomes():
+    with _OUTCOMES_LOCK:
+        _OUTCOMES.clear()
+
+def element_models(net, outcomes: Dict[str, dict], lambda_per_km: float = DEFAULT_LAMBDA_PER_KM,
+                   repair_h: float = DEFAULT_REPAIR_H, rates: Optional[Dict[str, dict]] = None) -> ElementModel:
+    """
+    Parâmetros por trecho: λ = lambda_per_km · comprimento e reparo padrão,
+    sobrescritos por rates[nome] = {"lambda_per_yr": ..., "repair_h": ...}.
+    """
+    rates = rates or {}
+    length = dict(zip(net.line.name.tolist(), net.line.length_km.values.astype(float).tolist()))
+    names = [n for n, r in outcomes.items() if "error" not in r]
+    over = [rates.get(n, {}) for n in names]
+    return ElementModel(
+        names=names,
+        rate=np.array([o.get("lambda_per_yr", lambda_per_km * length.get(n, 0.0)) for n, o in zip(names, over)]),
+        repair_h=np.array([o.get("repair_h", repair_h) for o in over], dtype=float),
+        c_ini=np.array([outcomes[n]["clients_initial"] for n in names], dtype=float),
+        c_after=np.array([outcomes[n]["clients_after"] for n in names], dtype=float),
+        p_ini=np.array([outcomes[n]["p_initial_mw"] for n in names], dtype=float),
+        p_after=np.array([outcomes[n]["p_after_mw"] for n in names], dtype=float),
+    )
+
+def _simulate_years(m: ElementModel, switch_h: float, years: int, seed) -> np.ndarray:
+    """
+    Amostra `years` anos: nº de falhas por trecho ~ Poisson(λ), reparo ~
+    exponencial. Clientes recompostos por manobra ficam min(manobra, reparo)
+    sem energia; os demais, o reparo inteiro. Retorna (3, anos):
+    clientes interrompidos, clientes·hora e MWh não supridos.
+    """
+    rng = np.random.default_rng(seed)
+    counts = rng.poisson(m.rate, size=(years, len(m.rate)))
+    year, elem = np.nonzero(counts)
+    reps = counts[year, elem]
+    year = np.repeat(year, reps); elem = np.repeat(elem, reps)
+    r = rng.exponential(m.repair_h[elem])
+    s = np.minimum(switch_h, r)
+    ci = m.c_ini[elem]
+    cmi = (m.c_ini[elem] - m.c_after[elem]) * s + m.c_after[elem] * r
+    ens = (m.p_ini[elem] - m.p_after[elem]) * s + m.p_after[elem] * r
+    return np.stack([np.bincount(year, weights=w, minlength=years) for w in (ci, cmi, ens)])
+
+def _summary(x: np.ndarray) -> Dict[str, float]:
+    n = len(x); mean = float(x.mean()); std = float(x.std(ddof=1)) if n > 1 else 0.0
+    half = 1.96 * std / np.sqrt(n) if n > 1 else 0.0
+    p5, p50, p95 = np.percentile(x, [5, 50, 95]).tolist()
+    return {"mean": mean, "std": std, "p5": p5, "p50": p50, "p95": p95,
+            "ci95_low": mean - half, "ci95_high": mean + half}
+
+def monte_carlo(net, years: int = 10_000, seed: Optional[int] = None, lambda_per_km: float = DEFAULT_LAMBDA_PER_KM,
+                repair_h: float = DEFAULT_REPAIR_H, switch_h: float = DEFAULT_SWITCH_H,
+                rates: Optional[Dict[str, dict]] = None, limits=None, workers: Optional[int] = None,
+                timeout_s: Optional[float] = None) -> ReliabilityResult:
+    """
+    Distribuições anuais de SAIFI, SAIDI (h), CAIDI (h) e ENS (MWh) para a
+    configuração de `net` (não é alterada). Mesma semente, mesmo resultado.
+    """
+    t0 = time.perf_counter()
+    workers = DEFAULT_WORKERS if workers is None else workers
+    outcomes = contingency_outcomes(net, limits, workers, timeout_s)
+    m = element_models(net, outcomes, lambda_per_km, repair_h, rates)
+    customers_total = customers_from_mw(net.load.p_mw.sum())
+
+    sizes = [min(CHUNK_YEARS, years - a) for a in range(0, years, CHUNK_YEARS)]
+    seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+    tasks = [(m, switch_h, n, s) for n, s in zip(sizes, seeds)]
+    if workers > 1 and len(tasks) > 1:
+        parts = [res if res is not None else _simulate_years(*tasks[i])
+                 for i, res in iter_parallel(_simulate_years, tasks, workers, timeout_s)]
+    else:
+        parts = [_simulate_years(*t) for t in tasks]
+    ci, cmi, ens = np.concatenate(parts, axis=1) if parts else np.zeros((3, 0))
+
+    res = ReliabilityResult(years=years, seed=seed, customers_total=customers_total,
+                            errors=[r for r in outcomes.values() if "error" in r])
+    if years and customers_total:
+        saifi = ci / customers_total; saidi = cmi / customers_total
+        hit = saifi > 0  # CAIDI só existe nos anos com interrupção
+        res.kpis = {"saifi": _summary(saifi), "saidi_h": _summary(saidi), "ens_mwh": _summary(ens)}
+        if hit.any():
+            res.kpis["caidi_h"] = _summary(saidi[hit] / saifi[hit])
+    # contribuição esperada de cada trecho ao SAIDI (valor analítico, sem amostragem)
+    s_exp = np.array([_expected_min(switch_h, r) for r in m.repair_h])
+    cmi_exp = m.rate * ((m.c_ini - m.c_after) * s_exp + m.c_after * m.repair_h)
+    order = np.argsort(-cmi_exp)
+    res.elements = [{"target": m.names[i], "lambda_per_yr": float(m.rate[i]), "repair_h": float(m.repair_h[i]),
+                     "saidi_h": float(cmi_exp[i] / customers_total) if customers_total else 0.0}
+                    for i in order.tolist() if cmi_exp[i] > 0]
+    res.elapsed_s = time.perf_counter() - t0
+    return res
+
+def _expected_min(s: float, mean_r: float) -> float:
+    """E[min(s, R)] com R ~ exponencial de média mean_r."""
+    return mean_r * (1.0 - np.exp(-s / mean_r)) if mean_r > 0 else 0.0
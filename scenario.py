@@ -0,0 +1,241 @@
+import copy
+import os
+from functools import lru_cache
+from pathlib import Path
+from typing import Any, Dict, Optional, Tuple
+
+import numpy as np
+
+from app.sim.model import customers_from_mw
+from app.sim.feeders import FEEDERS, Feeder
+from app.sim.engine import PLAN_BUDGET_S, STEP_MIN, run_events
+from app.sim.events import Event, parse_events
+from app.sim.ops import (OffTracker, StepCallback, apply_event_and_operate, apply_switching, run_powerflow,
+                         energized_buses, energized_mask, load_index)
+from app.sim.kpis import compute_kpis, kpis_from_minutes
+from app.sim.profiling import count, span
+from app.sim.timeseries import LoadProfile, energy_not_supplied, load_profile, run_timeseries
+
+from app.db import RUNS
+from app.cache import SOLUTIONS, solution_key
+
+DEFAULT_EVENT = {"type": "fault_permanent", "target": "line:R3B-B3", "t0_min": 0}
+
+# perfis de carga (CSV/Parquet) ficam neste diretório e são referenciados pelo nome
+PROFILE_DIR = Path(os.getenv("SIM_PROFILE_DIR", "profiles"))
+
+class ScenarioError(Exception):
+    """Falha do caso base; a API responde 500 com a mensagem."""
+
+class ProfileError(Exception):
+    """Perfil de carga inexistente ou inválido; a API responde 400."""
+
+@lru_cache(maxsize=4)
+def _read_profile(feeder_id: str, version: str, path: str, mtime: float, unit: str) -> LoadProfile:
+    return load_profile(FEEDERS.get(feeder_id).template(), path, unit)
+
+def get_profile(spec, feeder: Feeder) -> Tuple[LoadProfile, Dict[str, Any]]:
+    """spec: nome do arquivo em SIM_PROFILE_DIR ou {"name": ..., "unit": "pu" | "mw"}."""
+    if isinstance(spec, str): spec = {"name": spec}
+    if not isinstance(spec, dict) or not spec.get("name"):
+        raise ProfileError("profile.name obrigatório")
+    base = PROFILE_DIR.resolve()
+    path = (base / spec["name"]).resolve()
+    if base not in path.parents or not path.is_file():
+        raise ProfileError(f"perfil não encontrado: {spec['name']}")
+    unit = spec.get("unit", "pu")
+    try:
+        profile = _read_profile(feeder.id, feeder.version, str(path), path.stat().st_mtime, unit)
+    except (ValueError, KeyError, ImportError) as e:
+        raise ProfileError(f"perfil inválido: {e}")
+    meta = {"name": spec["name"], "unit": unit, "mtime": path.stat().st_mtime}
+    return profile, meta
+
+def simulate(req: dict, on_step: Optional[StepCallback] = None) -> Dict[str, Any]:
+    """
+    Executa um cenário de /api/run (evento + recomposição + KPIs) e grava o Run.
+    Com "events" (lista), roda o motor de eventos discretos em vez do evento único.
+    Cenários repetidos devolvem o run já gravado (cache de soluções e, se
+    não estiver lá, o banco pelo content_hash), com o mesmo run_id e
+    "reused": true. force=true recalcula e grava um run novo; on_step também
+    recalcula, porque precisa acompanhar a execução passo a passo.
+    """
+    feeder = FEEDERS.get(req.get("feeder"))
+    if "events" in req:
+        return _simulate_events(req, feeder, on_step)
+    event = req.get("event", DEFAULT_EVENT)
+    interruption_min = float(req.get("interruption_min", 20))
+    limits = req.get("limits", None)
+    profile, profile_meta = get_profile(req["profile"], feeder) if req.get("profile") else (None, None)
+    # minutos até a recomposição: antes dela vale o estado isolado, depois o recomposto
+    restore_min = min(max(float(req.get("restore_min", interruption_min)), 0.0), interruption_min)
+
+    key = solution_key("run", feeder=feeder.id, model=feeder.version, normally_open=feeder.normally_open, event=event,
+                       interruption_min=interruption_min, limits=limits,
+                       profile=profile_meta, restore_min=restore_min)
+    ev = Event(**event)
+    if on_step is None and not req.get("force"):
+        cached = _reused(key)
+        if cached is not None: return cached
+    with span("run.compute"):
+        payload = _compute(feeder, ev, interruption_min, limits, on_step, profile, restore_min)
+    if profile is not None:
+        payload["profile"].update(profile_meta)
+    return _finish(key, payload, feeder, ev.type, ev.target, interruption_min)
+
+def _reused(key: str) -> Optional[Dict[str, Any]]:
+    cached = SOLUTIONS.get(key)
+    if cached is None:
+        found = RUNS.find(key.split(":", 1)[1])
+        if found is not None:
+            cached = {**found[1], "run_id": found[0]}
+            SOLUTIONS.put(key, copy.deepcopy(cached))
+    if cached is None:
+        return None
+    count("run.reused")
+    return {**copy.deepcopy(cached), "reused": True}
+
+def _finish(key: str, payload: Dict[str, Any], feeder: Feeder, event_type: str, target: str,
+            interruption_min: float) -> Dict[str, Any]:
+    payload = _store_run(payload, feeder, event_type, target, interruption_min, key.split(":", 1)[1])
+    SOLUTIONS.put(key, copy.deepcopy(payload))
+    return payload
+
+def _simulate_events(req: dict, feeder: Feeder, on_step: Optional[StepCallback]) -> Dict[str, Any]:
+    """
+    Vários eventos com tempo (t0_min, duration_min) num horizonte: KPIs pela
+    integração exata de clientes·min entre eventos. horizon_min padrão: fim
+    do último evento (t0 + duração) ou da última manobra, o que vier depois.
+    """
+    events = parse_events(req["events"])
+    limits = req.get("limits", None)
+    step_min = float(req.get("step_min", STEP_MIN))
+    budget_s = float(req.get("plan_budget_s", PLAN_BUDGET_S))
+    horizon = req.get("horizon_min")
+    horizon = max(ev.t0_min + ev.duration_min for ev in events) if horizon is None else float(horizon)
+    profile, profile_meta = get_profile(req["profile"], feeder) if req.get("profile") else (None, None)
+    key = solution_key("run-events", feeder=feeder.id, model=feeder.version, normally_open=feeder.normally_open,
+                       events=[ev.__dict__ for ev in events], horizon_min=horizon, limits=limits,
+                       step_min=step_min, plan_budget_s=budget_s, profile=profile_meta)
+    if on_step is None and not req.get("force"):
+        cached = _reused(key)
+        if cached is not None: return cached
+
+    with span("run.compute"):
+        net = feeder.new_network()
+        apply_switching(net, open_names=feeder.normally_open)
+        ok, err = run_powerflow(net)
+        if not ok: raise ScenarioError(f"Fluxo normal falhou: {err}")
+        customers_total = customers_from_mw(net.load.p_mw.sum())
+        res = run_events(net, feeder.normally_open, events, horizon, limits=limits, step_min=step_min,
+                         plan_budget_s=budget_s, on_step=on_step, track_phases=profile is not None)
+        ens = res.mw_min / 60.0 if profile is None else energy_not_supplied(profile, res.phases)
+        kpis = kpis_from_minutes(customers_total, res.customer_min, res.interruptions, ens,
+                                 res.peak_customers, res.final_customers)
+        payload = {
+            "feeder": feeder.id,
+            "mode": "events",
+            "events": len(events),
+            "horizon_min": res.horizon_min,
+            "timeline": res.timeline,
+            "customers_total": customers_total,
+            "clients_initial": res.peak_customers,
+            "clients_after_reconfig": res.final_customers,
+            "customer_minutes": round(res.customer_min, 4),
+            "interruptions": res.interruptions,
+            "kpis": kpis.__dict__,
+            "curve": res.curve,
+            "engine": {"replans": res.replans, "solves": res.solves, "events_processed": res.events},
+            "energized_buses_indices": list(energized_buses(net)),
+        }
+        if res.notes: payload["notes"] = res.notes
+        if profile is not None:
+            payload["profile"] = {**profile_meta, "steps": profile.n_steps, "step_min": profile.step_min,
+                                  "ens_mwh": ens}
+    return _finish(key, payload, feeder, "events", f"{len(events)} eventos", res.horizon_min)
+
+def _compute(feeder: Feeder, ev: Event, interruption_min: float, limits, on_step: Optional[StepCallback],
+             profile: Optional[LoadProfile] = None, restore_min: float = 0.0) -> Dict[str, Any]:
+    net = feeder.new_network()
+    apply_switching(net, open_names=feeder.normally_open)  # configuração normal: ties abertas
+    ok, err = run_powerflow(net)
+    if not ok: raise ScenarioError(f"Fluxo normal falhou: {err}")
+
+    p_total = net.load.p_mw.sum()
+    customers_total = customers_from_mw(p_total)
+
+    # o tracker guarda as cargas desligadas no estado isolado (antes da recomposição)
+    track = OffTracker(on_step)
+    timeline, clients_initial, clients_after, _ = apply_event_and_operate(net, ev, limits=limits, on_step=track)
+
+    off_after = ~energized_mask(net)[load_index(net).bus_pos]
+    off_ini = track.off if track.off is not None else off_after
+    if profile is not None:
+        ens = energy_not_supplied(profile, [(restore_min, off_ini), (interruption_min - restore_min, off_after)],
+                                  t0_min=ev.t0_min)
+    else:
+        p = net.load.p_mw.values
+        ens = float(p[off_ini].sum() * restore_min + p[off_after].sum() * (interruption_min - restore_min)) / 60.0
+    kpis = compute_kpis(customers_total, clients_initial, clients_after, interruption_min, ens_mwh=ens)
+    buses_on = list(energized_buses(net))
+
+    payload = {
+        "feeder": feeder.id,
+        "timeline": timeline,
+        "customers_total": customers_total,
+        "clients_initial": clients_initial,
+        "clients_after_reconfig": clients_after,
+        "kpis": kpis.__dict__,
+        "energized_buses_indices": buses_on
+    }
+    if profile is not None:
+        payload["profile"] = {"steps": profile.n_steps, "step_min": profile.step_min, "t0_min": ev.t0_min,
+                              "restore_min": restore_min, "ens_mwh": ens}
+    return payload
+
+def _store_run(payload: Dict[str, Any], feeder: Feeder, event_type: str, target: str, interruption_min: float,
+               content_hash: Optional[str] = None) -> Dict[str, Any]:
+    payload["run_id"] = RUNS.add(payload, feeder=feeder.id, event_type=event_type, target=target,
+                                 interruption_min=interruption_min, model_version=feeder.version,
+                                 content_hash=content_hash)
+    return payload
+
+def timeseries(req: dict) -> Dict[str, Any]:
+    """
+    Fluxo de potência em série temporal na configuração normal (mais as
+    chaves em req["open"]). Devolve o resumo e, com series=true, as séries
+    de tensão mínima e carga atendida por passo.
+    """
+    feeder = FEEDERS.get(req.get("feeder"))
+    profile, meta = get_profile(req.get("profile"), feeder)
+    vmin = float((req.get("limits") or {}).get("vmin_pu", 0.93))
+    net = feeder.new_network()
+    apply_switching(net, open_names=set(feeder.normally_open) | set(req.get("open", [])))
+    try:
+        res = run_timeseries(net, profile)
+    except Exception as e:
+        raise ScenarioError(f"Série temporal falhou: {e}")
+
+    bus_ok = ~np.isnan(res.vm_pu).all(axis=0)
+    vm_step = res.vm_pu[:, bus_ok].min(axis=1) if bus_ok.any() else np.full(profile.n_steps, np.nan)
+    vm_bus = res.vm_pu[:, bus_ok].min(axis=0)
+    bus_names = np.array(net.bus.name.tolist(), dtype=object)[bus_ok].tolist()
+    out = {
+        "feeder": feeder.id,
+        "profile": meta,
+        "steps": profile.n_steps,
+        "step_min": profile.step_min,
+        "elapsed_s": round(res.elapsed_s, 3),
+        "iterations": res.iterations,
+        "converged": bool(res.converged.all()),
+        "fallback_steps": len(res.fallback_steps),
+        "energy_mwh": float(res.p_load_mw.sum() * profile.step_min / 60.0),
+        "p_peak_mw": float(res.p_load_mw.max()) if profile.n_steps else 0.0,
+        "vm_min_pu": float(np.nanmin(vm_step)) if profile.n_steps else None,
+        "steps_below_vmin": int((vm_step < vmin).sum()),
+        "bus_vm_min_pu": {n: round(float(v), 5) for n, v in zip(bus_names, vm_bus.tolist())},
+    }
+    if req.get("series"):
+        out["series"] = {"vm_min_pu": np.round(vm_step, 5).tolist(),
+                         "p_load_mw": np.round(res.p_load_mw, 5).tolist()}
+    return out
@@ -0,0 +1,123 @@
+import argparse
+import importlib
+import os
+import re
+import subprocess
+import sys
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+from app.sim.profiling import observe
+
+# ------------------------------------------------------------------
+#  Partida do servidor. Importar app.main não carrega pandapower, pandas
+#  nem scipy, não abre o banco e não monta templates: /health responde
+#  logo e /api/topology sai do cache de layout em disco. O resto (banco,
+#  pilha do solver, template e unifilar do alimentador padrão) é
+#  aquecido conforme SIM_STARTUP:
+#   eager      : antes de aceitar requests
+#   background : numa thread, com o servidor já atendendo (padrão)
+#   lazy       : nada; cada parte carrega no primeiro uso
+#  Cada etapa vira startup.<etapa> em /metrics e em GET /api/startup.
+#  python -m app.startup mostra o custo de import por pacote num processo
+#  novo (python -X importtime); com --warm também grava o cache de layout
+#  (para rodar no build da imagem).
+# ------------------------------------------------------------------
+STARTUP_MODES = ("eager", "background", "lazy")
+MODE = os.getenv("SIM_STARTUP", "background")
+# na ordem: cada um paga só o que os anteriores ainda não importaram
+SOLVER_MODULES = ("numpy", "scipy.sparse", "pandas", "pandapower")
+
+class Warmup:
+    def __init__(self):
+        self.mode: Optional[str] = None
+        self.stages: Dict[str, float] = {}
+        self.error: Optional[str] = None
+        self._done = threading.Event()
+        self._lock = threading.Lock()
+
+    def record(self, stage: str, seconds: float):
+        self.stages[stage] = seconds
+        observe(f"startup.{stage}", seconds)
+
+    def _stage(self, stage: str, fn):
+        t0 = time.perf_counter(); fn()
+        self.record(stage, time.perf_counter() - t0)
+
+    def run(self):
+        from app.db import init_db
+        from app.sim.feeders import FEEDERS, LAYOUT_MEDIA
+        try:
+            self._stage("db", init_db)
+            for mod in SOLVER_MODULES:
+                self._stage(f"import.{mod}", lambda m=mod: importlib.import_module(m))
+            feeder = FEEDERS.get()
+            self._stage("template", feeder.template)
+            self._stage("layout", lambda: [feeder.encoded_layout(fmt) for fmt in LAYOUT_MEDIA])
+        except Exception as e:
+            self.error = f"{type(e).__name__}: {e}"
+        finally:
+            self._done.set()
+
+    def start(self, mode: str = MODE):
+        """Uma vez por processo; modo desconhecido vale como background."""
+        with self._lock:
+            if self.mode is not None: return
+            self.mode = mode if mode in STARTUP_MODES else "background"
+        if self.mode == "eager":
+            self.run()
+        elif self.mode == "background":
+            threading.Thread(target=self.run, name="sim-warmup", daemon=True).start()
+        else:
+            self._done.set()
+
+    def status(self) -> dict:
+        return {"mode": self.mode, "ready": self._done.is_set(), "error": self.error,
+                "stages_s": {k: round(v, 4) for k, v in self.stages.items()}}
+
+WARMUP = Warmup()
+
+_IMPORTTIME = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \|(\s*)(\S+)")
+
+def import_report(module: str = "app.main") -> Tuple[float, List[Tuple[str, float]]]:
+    """
+    Importa `module` num processo novo (SIM_STARTUP=lazy) com -X importtime.
+    Retorna (tempo total em s, [(pacote, s próprios somados)]), maiores primeiro.
+    """
+    env = {**os.environ, "SIM_STARTUP": "lazy",
+           "PYTHONPATH": os.pathsep.join(p for p in sys.path if p)}
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                          env=env, capture_output=True, text=True)
+    if proc.returncode != 0:
+        raise RuntimeError(proc.stderr.strip().splitlines()[-1] if proc.stderr.strip() else "import falhou")
+    total = 0.0; by_pkg: Dict[str, float] = {}
+    for line in proc.stderr.splitlines():
+        m = _IMPORTTIME.match(line)
+        if not m: continue
+        name = m.group(4)
+        if name == module: total = int(m.group(2)) / 1e6
+        pkg = ".".join(name.split(".")[:2]) if name.startswith("app.") else name.split(".")[0]
+        by_pkg[pkg] = by_pkg.get(pkg, 0.0) + int(m.group(1)) / 1e6
+    return total, sorted(by_pkg.items(), key=lambda kv: -kv[1])
+
+def main(argv: Optional[List[str]] = None):
+    ap = argparse.ArgumentParser(description="Custo de import do servidor e aquecimento do cache de layout")
+    ap.add_argument("--module", default="app.main")
+    ap.add_argument("--top", type=int, default=20)
+    ap.add_argument("--warm", action="store_true", help="aquece como no servidor (grava o cache de layout)")
+    args = ap.parse_args(argv)
+    total, rows = import_report(args.module)
+    print(f"import {args.module}: {total * 1000:.0f} ms")
+    for pkg, s in rows[:args.top]:
+        print(f"  {s * 1000:8.1f} ms  {pkg}")
+    if args.warm:
+        WARMUP.start("eager")
+        st = WARMUP.status()
+        for stage, s in st["stages_s"].items():
+            print(f"  {s * 1000:8.1f} ms  warm:{stage}")
+        if st["error"]:
+            print(f"erro no aquecimento: {st['error']}"); sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -1,57 +1,362 @@
+import base64
+import hashlib
+import os
+import re
+import time
+from collections import OrderedDict
 from threading import Lock
-from typing import Dict, Any
+from typing import Callable, Dict, Any, Optional, Set, Tuple
 
-from app.sim.model import build_w0321p3
-from app.sim.ops import open_line_by_name, run_powerflow, energized_buses
+import numpy as np
 
-# Ties normalmente abertas (religadores centrais das interligações)
-DEFAULT_OPEN = {"RCL-04", "RCL-05"}
+from app.sim.feeders import FEEDERS, MAX_TEMPLATES
+from app.sim.model import customers_from_mw
+from app.sim.ops import apply_switching, close_line_by_name, energized_mask, load_accounting, open_line_by_name
+from app.sim.profiling import ENABLED as PROFILING, count, observe, span
+from app.sim.radial import Impact, fault_impact, open_impact
+from app.sim.topology import connectivity
+from app.cache import SOLUTIONS, solution_key
+from app.statestore import SwitchRecord, make_store, new_record
 
-_STATE = {"open": set(DEFAULT_OPEN), "fault": set()}
-_LOCK = Lock()
+# ------------------------------------------------------------------
+#  Formatos de resposta do estado:
+#   full    : dict por barra/linha com nomes (formato original)
+#   compact : bitsets em base64 (bit i = posição i em topology.index)
+#  Cada estado tem um nº de versão que sobe a cada mudança; com `since`
+#  a resposta traz só o que mudou desde aquela versão (se ainda estiver
+#  no histórico deste processo). SIM_STATE_HISTORY: versões guardadas
+#  por estado.
+#  O registro de manobras (abertas, defeitos, versão) fica no
+#  SIM_STATE_BACKEND (app/statestore.py), compartilhado entre workers;
+#  cada processo mantém só a rede viva e os snapshots, realinhados ao
+#  registro a cada request. Manobras gravam por compare-and-set: com
+#  if_version, versão diferente da atual é recusada (409); sem, o
+#  conflito com outro worker é refeito sobre o registro novo.
+#  Sessões de treino (session=<id>): cópia do estado compartilhado feita
+#  na primeira manobra; até lá a sessão lê o estado compartilhado. Cada
+#  estado tem seu lock, então sessões não disputam entre si.
+#  A sessão guarda só o id do alimentador (o Feeder vem de FEEDERS a cada
+#  request): o LRU de templates continua valendo.
+#   SIM_STATE_LIVE     : redes vivas mantidas por processo (LRU)
+#   SIM_STATE_SESSIONS : cópias locais mantidas por processo (LRU; o
+#                        registro continua no STORE)
+# ------------------------------------------------------------------
+STATE_FORMATS = ("full", "compact")
+STATE_HISTORY = int(os.getenv("SIM_STATE_HISTORY", "32"))
+STATE_LIVE = int(os.getenv("SIM_STATE_LIVE", str(MAX_TEMPLATES)))
+STATE_SESSIONS = int(os.getenv("SIM_STATE_SESSIONS", "1024"))
+SESSION_RE = re.compile(r"[A-Za-z0-9_.-]{1,64}")
+CAS_RETRIES = 8
+_MASKS = ("bus_on", "line_open", "line_fault", "line_on")
 
-def _solve() -> Dict[str, Any]:
-    net = build_w0321p3()
-    to_open = set(_STATE["open"]) | set(_STATE["fault"])
-    for name in to_open:
-        open_line_by_name(net, name)
+STORE = make_store()
 
-    ok, err = run_powerflow(net)
-    if not ok:
-        return {"error": f"runpp falhou: {err}"}
+class StateConflict(Exception):
+    """Versão esperada (if_version) diferente da atual; a API responde 409."""
+    def __init__(self, version: int):
+        super().__init__(version)
+        self.version = version
 
-    bus_idx2name = net.bus["name"].to_dict()
-    line_rows = net.line[["from_bus", "to_bus", "name", "in_service"]]
-    energ = energized_buses(net)
+class _Session:
+    """
+    Cópia local de um estado de manobras (alimentador, sessão de treino) e
+    a rede "viva" que o espelha: cada registro novo aplica só as manobras
+    que mudaram, e o último snapshot permite responder apenas o que mudou.
+    """
+    def __init__(self, feeder_id: str, sid: str):
+        self.feeder_id = feeder_id; self.sid = sid
+        self.model: Optional[str] = None    # versão do modelo da rede viva/snapshots
+        self.rec: Optional[SwitchRecord] = None
+        self.open: Set[str] = set(); self.fault: Set[str] = set()
+        self.net = None; self.snap = None
+        self.history: "OrderedDict[int, Dict[str, np.ndarray]]" = OrderedDict()  # versão -> snapshot
+        self.lock = Lock()
 
-    buses = {bus_idx2name[i]: {"energized": bool(i in energ)} for i in net.bus.index}
+    @property
+    def version(self) -> int:
+        return self.rec.version
+
+    @property
+    def tag(self) -> str:
+        return _tag(self.feeder_id, self.model, self.rec, self.sid)
+
+_SESSIONS: "OrderedDict[Tuple[str, str], _Session]" = OrderedDict()   # LRU
+_LIVE: "OrderedDict[Tuple[str, str], _Session]" = OrderedDict()   # sessões com rede viva, LRU
+_REG = Lock()   # só o dicionário de sessões e a LRU; o trabalho é feito sob o lock de cada sessão
+
+class _Locked:
+    """with _locked(lock): igual a with lock, medindo a espera (state.lock_wait em /metrics)."""
+    def __init__(self, lock: Lock):
+        self.lock = lock
+    def __enter__(self):
+        t0 = time.perf_counter(); self.lock.acquire()
+        observe("state.lock_wait", time.perf_counter() - t0)
+    def __exit__(self, *exc):
+        self.lock.release()
+
+_locked = _Locked if PROFILING else (lambda lock: lock)
+
+def _tag(feeder_id: str, model: str, rec: SwitchRecord, sid: str) -> str:
+    # versões só se comparam dentro do mesmo modelo e da mesma linhagem do registro
+    h = hashlib.sha1(model.encode()).hexdigest()[:8]
+    return f"{feeder_id}.{h}.{rec.token}" + (f".{sid}" if sid else "")
+
+def _session(feeder, sid: str = "") -> _Session:
+    key = (feeder.id, sid)
+    with _REG:
+        ses = _SESSIONS.get(key)
+        if ses is None:
+            ses = _SESSIONS[key] = _Session(feeder.id, sid)
+        _SESSIONS.move_to_end(key)
+        for k, old in list(_SESSIONS.items()):
+            if len(_SESSIONS) <= max(1, STATE_SESSIONS): break
+            # em uso por outra thread: fica para a próxima
+            if old is ses or not old.lock.acquire(blocking=False): continue
+            try: del _SESSIONS[k]; _LIVE.pop(k, None)
+            finally: old.lock.release()
+    return ses
+
+def _base_record(feeder) -> SwitchRecord:
+    """Registro compartilhado do alimentador; criado (chaves NA) no primeiro uso."""
+    rec = STORE.get(feeder.id)
+    while rec is None:
+        if STORE.put(feeder.id, "", new_record(feeder.normally_open), None): count("state.records_created")
+        rec = STORE.get(feeder.id)
+    return rec
+
+def _refresh(ses: _Session, feeder, rec: SwitchRecord):
+    """Alinha a cópia local ao registro (e ao arquivo do alimentador). Sob ses.lock."""
+    if ses.model != feeder.version:
+        ses.model = feeder.version; ses.net = None; ses.snap = None  # arquivo do alimentador mudou
+        ses.history.clear()                                           # posições antigas não valem mais
+    cur = ses.rec
+    if cur is not None and cur.token == rec.token and cur.version >= rec.version:
+        return                      # outra thread já aplicou este registro (ou um mais novo)
+    if cur is not None and cur.token != rec.token:
+        ses.history.clear()
+    if ses.net is not None:
+        old, new = ses.open | ses.fault, rec.open | rec.fault
+        apply_switching(ses.net, open_names=new - old, close_names=old - new)
+    ses.open = set(rec.open); ses.fault = set(rec.fault); ses.rec = rec
+
+def _live_net(ses: _Session, feeder):
+    if ses.net is None:
+        net = feeder.new_network()
+        apply_switching(net, open_names=ses.open | ses.fault)
+        ses.net = net; ses.snap = None
+    key = (ses.feeder_id, ses.sid)
+    with _REG:
+        _LIVE[key] = ses; _LIVE.move_to_end(key)
+        for k, old in list(_LIVE.items()):
+            if len(_LIVE) <= STATE_LIVE: break
+            # em uso por outra thread: fica para a próxima
+            if old is ses or not old.lock.acquire(blocking=False): continue
+            try: old.net = None; old.snap = None  # o registro continua no STORE
+            finally: old.lock.release()
+            del _LIVE[k]
+    return ses.net
+
+def _read(feeder: Optional[str], sid: str, fn: Callable[[_Session, Any], Any]):
+    """fn(sessão) sob o lock da sessão, alinhada ao registro; sessão sem cópia lê o estado compartilhado."""
+    fd = FEEDERS.get(feeder)
+    if sid and STORE.get(fd.id, sid) is None: sid = ""
+    ses = _session(fd, sid)
+    with _locked(ses.lock):
+        rec = STORE.get(fd.id, sid) if sid else _base_record(fd)
+        _refresh(ses, fd, rec)
+        return fn(ses, fd)
+
+def _snapshot(net, ses: _Session) -> Dict[str, np.ndarray]:
+    # o unifilar só precisa de conectividade: nenhum fluxo de potência aqui
+    conn = connectivity(net)
+    n_line = len(net.line)
+    bus_on = energized_mask(net)
+    line_open = ~net.line.in_service.values.astype(bool)
+    line_fault = np.array([n in ses.fault for n in net.line.name.tolist()], dtype=bool)
+    line_on = ~line_open & bus_on[conn.f[:n_line]] & bus_on[conn.t[:n_line]]
+    return {"bus_on": bus_on, "line_open": line_open, "line_fault": line_fault, "line_on": line_on,
+            "open": sorted(ses.open), "fault": sorted(ses.fault)}
+
+def _cached_snapshot(net, ses: _Session) -> Dict[str, np.ndarray]:
+    # o snapshot depende só de (alimentador, abertas, defeitos): configurações repetidas vêm do cache
+    key = solution_key("state", feeder=ses.feeder_id, model=ses.model, open=ses.open, fault=ses.fault)
+    snap = SOLUTIONS.get(key)
+    if snap is None:
+        with span("state.snapshot"): snap = _snapshot(net, ses)
+        SOLUTIONS.put(key, snap)
+    return snap
+
+def _render(net, snap, bus_sel: Optional[np.ndarray] = None, line_sel: Optional[np.ndarray] = None) -> Dict[str, Any]:
+    conn = connectivity(net)
+    n_line = len(net.line)
+    bus_names = net.bus.name.tolist()
+    line_names = net.line.name.tolist()
+    bus_pos = range(len(bus_names)) if bus_sel is None else np.flatnonzero(bus_sel).tolist()
+    line_pos = range(n_line) if line_sel is None else np.flatnonzero(line_sel).tolist()
+    bus_on = snap["bus_on"].tolist()
+    line_open = snap["line_open"].tolist(); line_fault = snap["line_fault"].tolist(); line_on = snap["line_on"].tolist()
+    f = conn.f[:n_line].tolist(); t = conn.t[:n_line].tolist()
+
+    buses = {bus_names[i]: {"energized": bus_on[i]} for i in bus_pos}
     lines = {}
-    for _, row in line_rows.iterrows():
-        name = row["name"]; f = int(row["from_bus"]); t = int(row["to_bus"])
-        is_open = not bool(row["in_service"])
-        energized = (not is_open) and (f in energ and t in energ)
-        lines[name] = {
-            "open": is_open, "fault": name in _STATE["fault"], "energized": bool(energized),
-            "from": bus_idx2name[f], "to": bus_idx2name[t]
+    for i in line_pos:
+        lines[line_names[i]] = {
+            "open": line_open[i], "fault": line_fault[i], "energized": line_on[i],
+            "from": bus_names[f[i]], "to": bus_names[t[i]]
         }
-    return {"buses": buses, "lines": lines, "open": sorted(_STATE["open"]), "fault": sorted(_STATE["fault"])}
-
-def get_state():
-    with _LOCK: return _solve()
-
-def set_switch(name: str, action: str):
-    with _LOCK:
-        if action == "open": _STATE["open"].add(name)
-        elif action == "close": _STATE["open"].discard(name)
-        return _solve()
-
-def set_fault(name: str, action: str):
-    with _LOCK:
-        if action in ("apply", "set"): _STATE["fault"].add(name)
-        elif action in ("clear", "remove"): _STATE["fault"].discard(name)
-        return _solve()
-
-def reset_state():
-    with _LOCK:
-        _STATE["open"] = set(DEFAULT_OPEN); _STATE["fault"] = set()
-        return _solve()
+    return {"buses": buses, "lines": lines, "open": snap["open"], "fault": snap["fault"]}
+
+def _bits(mask: np.ndarray) -> str:
+    return base64.b64encode(np.packbits(mask, bitorder="little").tobytes()).decode("ascii")
+
+def _compact(snap, base=None) -> Dict[str, Any]:
+    if base is None:
+        out = {m: _bits(snap[m]) for m in _MASKS}
+        out.update(n_bus=len(snap["bus_on"]), n_line=len(snap["line_on"]))
+    else:
+        # flags são booleanos: basta listar as posições que inverteram
+        out = {"flip": {m: np.flatnonzero(base[m] != snap[m]).tolist() for m in _MASKS}}
+    return out
+
+def etag(tag: str, version: int, fmt: str = "full", since: Optional[int] = None) -> str:
+    return f'"{tag}.{version}.{fmt}' + ("" if since is None else f".{since}") + '"'
+
+# Sob o lock da sessão só se aplica a manobra e se tira o snapshot (arrays imutáveis);
+# a serialização em dicts acontece fora do lock.
+def _solve(ses: _Session, feeder, since: Optional[int] = None):
+    net = _live_net(ses, feeder)
+    prev = ses.snap
+    snap = _cached_snapshot(net, ses); ses.snap = snap
+    ses.history[ses.version] = snap; ses.history.move_to_end(ses.version)
+    while len(ses.history) > STATE_HISTORY:
+        ses.history.popitem(last=False)
+    base = ses.history.get(since) if since is not None else None
+    return net, prev, snap, base, (ses.feeder_id, ses.sid, ses.tag), ses.version
+
+def _respond(net, prev, snap, base, ident: Tuple[str, str, str], version: int, diff: bool = False,
+             fmt: str = "full", since: Optional[int] = None) -> Dict[str, Any]:
+    with span("state.render"):
+        return _respond_body(net, prev, snap, base, ident, version, diff, fmt, since)
+
+def _respond_body(net, prev, snap, base, ident, version, diff, fmt, since) -> Dict[str, Any]:
+    # `since` tem precedência sobre `diff` (que compara com a última resposta da sessão)
+    ref = base if base is not None else (prev if diff else None)
+    if fmt == "compact":
+        out = _compact(snap, ref)
+        out.update(open=snap["open"], fault=snap["fault"])
+    elif ref is None:
+        out = _render(net, snap)
+    else:
+        # só barras/linhas cujos flags mudaram desde a referência
+        bus_sel = ref["bus_on"] != snap["bus_on"]
+        line_sel = ((ref["line_open"] != snap["line_open"]) | (ref["line_fault"] != snap["line_fault"])
+                    | (ref["line_on"] != snap["line_on"]))
+        out = _render(net, snap, bus_sel, line_sel)
+    if diff and base is None:
+        out["diff"] = True
+    feeder_id, sid, tag = ident
+    out.update(feeder=feeder_id, version=version, format=fmt, tag=tag)
+    if sid: out["session"] = sid
+    if base is not None:
+        out["since"] = since   # sem "since" na resposta = estado completo (versão fora do histórico)
+    return out
+
+def state_version(feeder: Optional[str] = None, session: str = ""):
+    """(tag, versão) atuais, sem montar o estado (para ETag/304)."""
+    fd = FEEDERS.get(feeder)
+    rec = STORE.get(fd.id, session) if session else None
+    if rec is None:
+        session = ""; rec = _base_record(fd)
+    return _tag(fd.id, fd.version, rec, session), rec.version
+
+# o alimentador é resolvido (e carregado, se preciso) antes de tomar o lock da sessão
+def get_state(feeder: Optional[str] = None, fmt: str = "full", since: Optional[int] = None, session: str = ""):
+    solved = _read(feeder, session, lambda ses, fd: _solve(ses, fd, since))
+    return _respond(*solved, fmt=fmt, since=since)
+
+def _apply(feeder, sid: str, since, if_version: Optional[int], change: Callable[[Set[str], Set[str]], None]):
+    fd = FEEDERS.get(feeder)
+    ses = _session(fd, sid)
+    with _locked(ses.lock):
+        for _ in range(CAS_RETRIES):
+            rec = STORE.get(fd.id, sid) if sid else _base_record(fd)
+            fork = rec is None              # sessão de treino sem cópia: parte do compartilhado
+            if fork: rec = _base_record(fd)
+            _refresh(ses, fd, rec)
+            if if_version is not None and ses.version != if_version:
+                raise StateConflict(ses.version)
+            open_, fault = set(ses.open), set(ses.fault)
+            change(open_, fault)
+            if (open_, fault) == (ses.open, ses.fault):
+                break
+            # a cópia nasce com linhagem própria: versões da sessão não se confundem com as do compartilhado
+            new = new_record(open_, fault, rec.version + 1) if fork else rec.replace(open_, fault)
+            if STORE.put(fd.id, sid, new, None if fork else rec.version):
+                _refresh(ses, fd, new)
+                if fork: count("state.sandboxes")
+                break
+        else:
+            raise StateConflict((STORE.get(fd.id, sid) or _base_record(fd)).version)
+        return _solve(ses, fd, since)
+
+def set_switch(name: str, action: str, diff: bool = False, feeder: Optional[str] = None,
+               fmt: str = "full", since: Optional[int] = None, session: str = "",
+               if_version: Optional[int] = None):
+    def change(open_, fault):
+        if action == "open": open_.add(name)
+        elif action == "close": open_.discard(name)
+    return _respond(*_apply(feeder, session, since, if_version, change), diff=diff, fmt=fmt, since=since)
+
+def set_fault(name: str, action: str, diff: bool = False, feeder: Optional[str] = None,
+              fmt: str = "full", since: Optional[int] = None, session: str = "",
+              if_version: Optional[int] = None):
+    def change(open_, fault):
+        if action in ("apply", "set"): fault.add(name)
+        elif action in ("clear", "remove"): fault.discard(name)
+    return _respond(*_apply(feeder, session, since, if_version, change), diff=diff, fmt=fmt, since=since)
+
+def reset_state(feeder: Optional[str] = None, fmt: str = "full", since: Optional[int] = None,
+                session: str = "", if_version: Optional[int] = None):
+    def change(open_, fault):
+        open_.clear(); open_.update(FEEDERS.get(feeder).normally_open); fault.clear()
+    return _respond(*_apply(feeder, session, since, if_version, change), fmt=fmt, since=since)
+
+def drop_session(session: str) -> int:
+    """Descarta as cópias da sessão de treino (ela volta a ler o estado compartilhado)."""
+    n = STORE.drop(session)
+    with _REG:
+        for key in [k for k in _SESSIONS if k[1] == session]:
+            _SESSIONS.pop(key); _LIVE.pop(key, None)
+    return n
+
+def _impact_body(net, imp: Impact) -> Dict[str, Any]:
+    names = net.bus.name.astype(str).values
+    return {"device": imp.device, "p_mw": round(imp.p_mw, 6), "customers": imp.customers,
+            "prio": imp.prio, "buses": names[imp.buses].tolist()}
+
+def _open_impact_slow(net, name: str) -> Impact:
+    # configuração malhada: abre de verdade, compara as máscaras e desfaz
+    before = energized_mask(net)
+    was = not bool(net.line.in_service.values[net.line.name.values == name][0])
+    open_line_by_name(net, name); after = energized_mask(net)
+    if not was: close_line_by_name(net, name)
+    lost = np.flatnonzero(before & ~after)
+    (p0, _, prio0), (p1, _, prio1) = load_accounting(net, before), load_accounting(net, after)
+    return Impact(name, name, lost, p1 - p0, customers_from_mw(p1 - p0), prio0 - prio1)
+
+def impact(name: str, feeder: Optional[str] = None, session: str = "") -> Dict[str, Any]:
+    """
+    O que perde energia, no estado atual da sessão, se a linha abrir e se
+    houver defeito nela (abre a proteção a montante). Respondido pelo índice
+    radial; em configuração malhada "open" vem da busca e "fault" é null.
+    KeyError se a linha não existir.
+    """
+    def run(ses, fd):
+        net = _live_net(ses, fd)
+        op = open_impact(net, name)
+        radial = op is not None
+        flt = fault_impact(net, name) if radial else None
+        if op is None: op = _open_impact_slow(net, name)
+        return {"feeder": ses.feeder_id, "version": ses.version, "line": name, "radial": radial,
+                "open": _impact_body(net, op), "fault": None if flt is None else _impact_body(net, flt)}
+    return _read(feeder, session, run)
@@ -0,0 +1,105 @@
+import os
+import threading
+import uuid
+from dataclasses import dataclass
+from typing import Dict, FrozenSet, Iterable, Optional, Tuple
+
+from app.sim.profiling import count, span
+
+# ------------------------------------------------------------------
+#  Onde mora o estado de manobras do unifilar (chaves abertas e defeitos
+#  por alimentador, e por sessão de treino). Cada registro tem uma versão
+#  e só é gravado se a versão lida ainda for a atual (compare-and-set):
+#  duas manobras simultâneas, em workers ou máquinas diferentes, nunca se
+#  sobrescrevem. A rede viva e os snapshots continuam locais a cada
+#  processo; o registro é a referência que todos seguem.
+#   SIM_STATE_BACKEND : memory (um processo, padrão) ou db (tabela
+#                       switch_state no banco de SIM_DB_URL; vale entre
+#                       workers e, com um banco de rede, entre máquinas)
+# ------------------------------------------------------------------
+STATE_BACKENDS = ("memory", "db")
+STATE_BACKEND = os.getenv("SIM_STATE_BACKEND", "memory")
+
+@dataclass(frozen=True)
+class SwitchRecord:
+    version: int
+    open: FrozenSet[str]
+    fault: FrozenSet[str]
+    token: str              # linhagem: muda se o registro for recriado (ETag não reaproveita versões)
+
+    def replace(self, open: Iterable[str], fault: Iterable[str]) -> "SwitchRecord":
+        return SwitchRecord(self.version + 1, frozenset(open), frozenset(fault), self.token)
+
+def new_record(open: Iterable[str], fault: Iterable[str] = (), version: int = 1) -> SwitchRecord:
+    return SwitchRecord(version, frozenset(open), frozenset(fault), uuid.uuid4().hex[:12])
+
+class MemoryStateStore:
+    """Registros num dict do processo: cada worker tem o seu."""
+    name = "memory"
+
+    def __init__(self):
+        self._recs: Dict[Tuple[str, str], SwitchRecord] = {}
+        self._lock = threading.Lock()
+
+    def get(self, feeder: str, session: str = "") -> Optional[SwitchRecord]:
+        return self._recs.get((feeder, session))
+
+    def put(self, feeder: str, session: str, rec: SwitchRecord, expect: Optional[int]) -> bool:
+        """Grava se a versão atual for `expect` (None: só se ainda não existir)."""
+        with self._lock:
+            cur = self._recs.get((feeder, session))
+            if (cur is None) != (expect is None) or (cur is not None and cur.version != expect):
+                count("state.cas_conflicts"); return False
+            self._recs[(feeder, session)] = rec
+            return True
+
+    def drop(self, session: str) -> int:
+        """Apaga os registros da sessão de treino (todos os alimentadores)."""
+        with self._lock:
+            keys = [k for k in self._recs if k[1] == session]
+            for k in keys: del self._recs[k]
+        return len(keys)
+
+class DbStateStore:
+    """Registros na tabela switch_state; o CAS é um UPDATE ... WHERE version = esperada."""
+    name = "db"
+
+    def get(self, feeder: str, session: str = "") -> Optional[SwitchRecord]:
+        from app.db import SwitchState, db_session
+        with span("state.store_get"), db_session() as s:
+            r = s.get(SwitchState, (feeder, session))
+            if r is None: return None
+            return SwitchRecord(r.version, frozenset(r.open or ()), frozenset(r.fault or ()), r.token)
+
+    def put(self, feeder: str, session: str, rec: SwitchRecord, expect: Optional[int]) -> bool:
+        from sqlalchemy import update
+        from sqlalchemy.exc import IntegrityError
+        from app.db import SwitchState, db_session
+        values = {"version": rec.version, "token": rec.token, "open": sorted(rec.open), "fault": sorted(rec.fault)}
+        with span("state.store_put"), db_session() as s:
+            if expect is None:
+                s.add(SwitchState(feeder=feeder, session=session, **values))
+                try:
+                    s.commit(); return True
+                except IntegrityError:
+                    s.rollback(); count("state.cas_conflicts"); return False
+            n = s.execute(update(SwitchState)
+                          .where(SwitchState.feeder == feeder, SwitchState.session == session,
+                                 SwitchState.version == expect)
+                          .values(**values)).rowcount
+            s.commit()
+        if n != 1: count("state.cas_conflicts")
+        return n == 1
+
+    def drop(self, session: str) -> int:
+        from sqlalchemy import delete
+        from app.db import SwitchState, db_session
+        with db_session() as s:
+            n = s.execute(delete(SwitchState).where(SwitchState.session == session)).rowcount
+            s.commit()
+        return n
+
+def make_store(backend: str = STATE_BACKEND):
+    if backend == "memory": return MemoryStateStore()
+    if backend == "db": return DbStateStore()
+    raise ValueError(f"SIM_STATE_BACKEND deve ser um de {', '.join(STATE_BACKENDS)}: {backend}")
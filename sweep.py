@@ -0,0 +1,294 @@
+from typing import Optional, Tuple
+
+import numpy as np
+
+from .profiling import count, span
+from .topology import per_net
+
+# ------------------------------------------------------------------
+#  Fluxo de potência por varredura (backward/forward sweep) para redes
+#  radiais: correntes acumuladas das folhas para a fonte, tensões da
+#  fonte para as folhas, nível a nível da árvore (vetorizado com numpy).
+#  Mesmo modelo do pandapower: linha π, trafo T (convertido em π) com
+#  relação de tensões nominais, cargas de potência constante. Rede
+#  malhada, elemento não suportado ou falta de convergência -> False, e
+#  quem chamou cai no pp.runpp. Os parâmetros elétricos são lidos uma
+#  vez por rede (per_net); a cada chamada só in_service e as cargas.
+# ------------------------------------------------------------------
+# elementos que a varredura não modela: se houver algum em serviço, usa-se o runpp
+_UNSUPPORTED = ("gen", "shunt", "ward", "xward", "impedance", "dcline", "storage", "motor", "switch", "trafo3w",
+                "asymmetric_load", "asymmetric_sgen", "svc", "tcsc", "ssc", "vsc")
+
+class SweepModel:
+    """Ramos (linhas e depois trafos) em pu na base do sistema, fixos por rede."""
+    def __init__(self, net):
+        sn = float(net.sn_mva)
+        pos = net.bus.index
+        vn = net.bus.vn_kv.values.astype(float)
+        self.n_bus = len(pos); self.n_line = len(net.line)
+        self.vn = vn
+        self.i_base = sn / (np.sqrt(3) * vn)          # kA por pu de corrente, por barra
+
+        ln = net.line
+        lf = pos.get_indexer(ln.from_bus.values); lt = pos.get_indexer(ln.to_bus.values)
+        par = ln.parallel.values.astype(float); km = ln.length_km.values.astype(float)
+        zb = vn[lf] ** 2 / sn
+        z_line = (ln.r_ohm_per_km.values + 1j * ln.x_ohm_per_km.values) * km / par / zb
+        y_line = (ln.g_us_per_km.values * 1e-6 + 2j * np.pi * float(net.f_hz) * ln.c_nf_per_km.values * 1e-9) \
+            * km * par * zb
+        self.line_imax = ln.max_i_ka.values.astype(float) * ln.df.values.astype(float) * par
+
+        tr = net.trafo
+        hv = pos.get_indexer(tr.hv_bus.values); lv = pos.get_indexer(tr.lv_bus.values)
+        tsn = tr.sn_mva.values.astype(float); tpar = tr.parallel.values.astype(float)
+        # relação fora da nominal (vn do trafo x vn das barras) e tap, do lado de AT
+        ratio = (tr.vn_hv_kv.values / vn[hv]) / (tr.vn_lv_kv.values / vn[lv])
+        step = tr.tap_step_percent.values.astype(float) if len(tr) else np.zeros(0)
+        tap = (tr.tap_pos.values.astype(float) - tr.tap_neutral.values.astype(float)) * step / 100.0 \
+            if len(tr) else np.zeros(0)
+        tap = np.nan_to_num(tap)
+        side = tr.tap_side.values if len(tr) else np.zeros(0, dtype=object)
+        ratio = ratio * np.where(side == "lv", 1.0 / (1.0 + tap), 1.0 + tap)
+        lv_scale = (tr.vn_lv_kv.values / vn[lv]) ** 2
+        zk = tr.vk_percent.values / 100.0 * sn / tsn * lv_scale
+        rk = tr.vkr_percent.values / 100.0 * sn / tsn * lv_scale
+        z_sc = (rk + 1j * np.sqrt(np.maximum(zk ** 2 - rk ** 2, 0.0))) / tpar
+        g_m = tr.pfe_kw.values / 1000.0 / sn / lv_scale
+        y_abs = tr.i0_percent.values / 100.0 * tsn / sn / lv_scale
+        y_m = (g_m - 1j * np.sqrt(np.maximum(y_abs ** 2 - g_m ** 2, 0.0))) * tpar
+        # T (metade da impedância de cada lado, magnetização no meio) -> π equivalente
+        za = zb_ = z_sc / 2
+        with np.errstate(divide="ignore", invalid="ignore"):
+            zc = np.where(y_m != 0, 1.0 / np.where(y_m != 0, y_m, 1.0), np.inf)
+            total = za * zb_ + za * zc + zb_ * zc
+            z_tr = np.where(np.isfinite(zc), total / zc, z_sc)
+            y_hv = np.where(np.isfinite(zc), zb_ / total, 0.0)
+            y_lv = np.where(np.isfinite(zc), za / total, 0.0)
+        self.trafo_sn = tsn * tpar
+        self.hv_pos = hv; self.lv_pos = lv
+
+        # ramos: linhas e depois trafos (mesma ordem de topology.Connectivity)
+        self.f = np.concatenate([lf, hv]); self.t = np.concatenate([lt, lv])
+        self.z = np.concatenate([z_line, z_tr])
+        self.y_f = np.concatenate([y_line / 2, y_hv]); self.y_t = np.concatenate([y_line / 2, y_lv])
+        self.ratio = np.concatenate([np.ones(self.n_line), ratio]).astype(float)   # ideal no lado "f"
+        self.load_pos = pos.get_indexer(net.load.bus.values)
+        self.sgen_pos = pos.get_indexer(net.sgen.bus.values) if "sgen" in net else np.zeros(0, dtype=np.int64)
+        self.eg_pos = pos.get_indexer(net.ext_grid.bus.values)
+        self.sn = sn
+
+def _model(net) -> SweepModel:
+    return per_net(net, "sweep", SweepModel)
+
+def supported(net) -> bool:
+    for kind in _UNSUPPORTED:
+        df = net[kind] if kind in net else None
+        if df is not None and len(df) and ("in_service" not in df or df.in_service.values.astype(bool).any()):
+            return False
+    tr = net.trafo   # defasamento (ex.: Dyn1) muda os ângulos, que a varredura não modela
+    if len(tr) and "shift_degree" in tr and np.any((np.nan_to_num(tr.shift_degree.values.astype(float)) != 0)
+                                                   & tr.in_service.values.astype(bool)):
+        return False
+    ld = net.load
+    if len(ld) and (np.any(ld.const_z_percent.values != 0) or np.any(ld.const_i_percent.values != 0)):
+        return False
+    return True
+
+class _Tree:
+    """Árvore da configuração atual: pai, ramo do pai e níveis (raízes = barras das ext_grid)."""
+    def __init__(self, m: SweepModel, closed: np.ndarray, bus_on: np.ndarray, roots: np.ndarray):
+        from scipy.sparse import coo_matrix  # import tardio: scipy só no primeiro fluxo
+        from scipy.sparse.csgraph import shortest_path
+        n = m.n_bus
+        on = closed & bus_on[m.f] & bus_on[m.t]
+        e = np.flatnonzero(on)
+        # nó virtual n ligado às raízes: uma BFS cobre todas as fontes
+        rows = np.concatenate([m.f[e], np.full(len(roots), n)])
+        cols = np.concatenate([m.t[e], roots])
+        g = coo_matrix((np.ones(len(rows)), (rows, cols)), shape=(n + 1, n + 1)).tocsr()
+        dist, pred = shortest_path(g, directed=False, unweighted=True, indices=n, return_predecessors=True)
+        dist = dist[:n]
+        reached = np.isfinite(dist)
+        # radial <=> ramos fechados dentro da área alimentada = barras - fontes
+        inside = on & reached[m.f]
+        self.radial = int(inside.sum()) == int(reached.sum()) - len(roots)
+        self.reached = reached; self.on = inside
+        if not self.radial: return
+        parent = pred[:n].astype(np.int64)
+        # ramo que liga cada barra ao pai, e se a barra está no lado "t" do ramo
+        e = np.flatnonzero(inside)
+        br = np.full(n, -1, dtype=np.int64); child_is_t = np.zeros(n, dtype=bool)
+        ef = m.f[e]; et = m.t[e]
+        down = parent[et] == ef
+        br[et[down]] = e[down]; child_is_t[et[down]] = True
+        br[ef[~down]] = e[~down]
+        self.parent = parent; self.branch = br; self.child_is_t = child_is_t
+        # profundidade 1 = raízes (ligadas ao nó virtual); níveis a partir das filhas das raízes
+        depth = np.where(reached, dist, 0).astype(np.int64)
+        nonroot = np.flatnonzero(reached & (depth > 1))
+        nonroot = nonroot[np.argsort(depth[nonroot], kind="stable")]
+        cuts = np.flatnonzero(np.diff(depth[nonroot])) + 1
+        self.levels = np.split(nonroot, cuts) if len(nonroot) else []
+
+def solve_radial(net, tol: float = 1e-9, max_iter: int = 50) -> bool:
+    """
+    Resolve a rede por varredura e grava res_bus/res_line/res_trafo/res_load/res_ext_grid.
+    Retorna False (sem alterar resultados) se a rede não for radial, tiver
+    elemento não suportado ou não convergir.
+    """
+    if not supported(net):
+        count("sweep.unsupported"); return False
+    with span("sweep"):
+        m = _model(net)
+        closed = np.concatenate([net.line.in_service.values.astype(bool), net.trafo.in_service.values.astype(bool)])
+        bus_on = net.bus.in_service.values.astype(bool)
+        eg = net.ext_grid
+        eg_on = eg.in_service.values.astype(bool) & bus_on[m.eg_pos]
+        roots = m.eg_pos[eg_on]
+        if len(np.unique(roots)) != len(roots):
+            count("sweep.meshed"); return False
+        tree = _Tree(m, closed, bus_on, roots)
+        if not tree.radial:
+            count("sweep.meshed"); return False
+        out = _iterate(net, m, tree, roots, eg, eg_on, tol, max_iter)
+        if out is None:
+            count("sweep.not_converged"); return False
+        _write_results(net, m, tree, *out)
+        net["converged"] = True
+        count("sweep.solved")
+        return True
+
+def _injections(net, m: SweepModel, n: int) -> np.ndarray:
+    """Potência consumida por barra (pu), cargas menos geração estática."""
+    s = np.zeros(n, dtype=complex)
+    ld = net.load
+    on = ld.in_service.values.astype(bool)
+    w = ld.scaling.values.astype(float) * on
+    np.add.at(s, m.load_pos, (ld.p_mw.values * w + 1j * ld.q_mvar.values * w) / m.sn)
+    if "sgen" in net and len(net.sgen):
+        sg = net.sgen
+        w = sg.scaling.values.astype(float) * sg.in_service.values.astype(bool)
+        np.add.at(s, m.sgen_pos, -(sg.p_mw.values * w + 1j * sg.q_mvar.values * w) / m.sn)
+    return s
+
+def _iterate(net, m: SweepModel, tree: _Tree, roots, eg, eg_on, tol: float, max_iter: int):
+    n = m.n_bus
+    s = _injections(net, m, n)
+    parent, br = tree.parent, tree.branch
+    # shunts de ramo vistos de cada barra (lado com relação ideal: y / t²)
+    y_bus = np.zeros(n, dtype=complex)
+    e = np.flatnonzero(tree.on)
+    np.add.at(y_bus, m.f[e], m.y_f[e] / m.ratio[e] ** 2)
+    np.add.at(y_bus, m.t[e], m.y_t[e])
+    # relação ideal vista da barra filha: V_filha = V_pai / a - z·J  (a = t se o pai está no lado "f")
+    nonroot = np.concatenate(tree.levels) if tree.levels else np.zeros(0, dtype=np.int64)
+    a = np.ones(n); a_ok = np.ones(n, dtype=bool)
+    a[nonroot] = np.where(tree.child_is_t[nonroot], m.ratio[br[nonroot]], 1.0 / m.ratio[br[nonroot]])
+    # com o lado "f" no filho, a corrente do ramo (em J) fica do lado errado da relação: não suportado
+    a_ok[nonroot] = tree.child_is_t[nonroot] | (m.ratio[br[nonroot]] == 1.0)
+    if not a_ok.all():
+        return None
+    z = np.zeros(n, dtype=complex); z[nonroot] = m.z[br[nonroot]]
+
+    v = np.full(n, np.nan, dtype=complex)
+    v_src = eg.vm_pu.values[eg_on] * np.exp(1j * np.deg2rad(eg.va_degree.values[eg_on]))
+    v[roots] = v_src
+    # partida plana: fonte dividida pelas relações ao longo do caminho
+    for lvl in tree.levels:
+        v[lvl] = v[parent[lvl]] / a[lvl]
+    reached = tree.reached
+    for it in range(1, max_iter + 1):
+        i_node = np.zeros(n, dtype=complex)
+        i_node[reached] = np.conj(s[reached] / v[reached]) + y_bus[reached] * v[reached]
+        j = i_node.copy()
+        for lvl in reversed(tree.levels):
+            np.add.at(j, parent[lvl], j[lvl] / a[lvl])
+        v_old = v.copy()
+        for lvl in tree.levels:
+            v[lvl] = v[parent[lvl]] / a[lvl] - z[lvl] * j[lvl]
+        if np.nanmax(np.abs(v - v_old), initial=0.0) < tol:
+            count("sweep.iterations", it)
+            return v, j, s
+    return None
+
+def _write_results(net, m: SweepModel, tree: _Tree, v: np.ndarray, j: np.ndarray, s: np.ndarray):
+    n = m.n_bus; nl = m.n_line
+    reached = tree.reached
+    vm = np.where(reached, np.abs(v), np.nan); va = np.where(reached, np.rad2deg(np.angle(v)), np.nan)
+
+    # fluxos nos extremos de cada ramo: corrente que entra no ramo em f e em t (pu)
+    n_br = len(m.f)
+    i_f = np.zeros(n_br, dtype=complex); i_t = np.zeros(n_br, dtype=complex)
+    nonroot = np.concatenate(tree.levels) if tree.levels else np.zeros(0, dtype=np.int64)
+    e = tree.branch[nonroot]
+    c_t = tree.child_is_t[nonroot]
+    # J = corrente série do ramo no sentido pai -> filho (lado interno da relação ideal)
+    jj = j[nonroot]
+    vf = v[m.f[e]] / m.ratio[e]; vt = v[m.t[e]]
+    i_series_ft = np.where(c_t, jj, -jj)
+    i_f[e] = (i_series_ft + m.y_f[e] * vf) / m.ratio[e]
+    i_t[e] = -i_series_ft + m.y_t[e] * vt
+    s_f = np.zeros(n_br, dtype=complex); s_t = np.zeros(n_br, dtype=complex)
+    s_f[e] = v[m.f[e]] * np.conj(i_f[e]); s_t[e] = vt * np.conj(i_t[e])
+    ia_f = np.abs(i_f) * m.i_base[m.f]; ia_t = np.abs(i_t) * m.i_base[m.t]
+    sb = m.sn
+    vmf = np.where(tree.on, vm[m.f], np.nan); vmt = np.where(tree.on, vm[m.t], np.nan)
+    vaf = np.where(tree.on, va[m.f], np.nan); vat = np.where(tree.on, va[m.t], np.nan)
+
+    # linhas
+    L = slice(0, nl)
+    i_ka = np.maximum(ia_f[L], ia_t[L])
+    with np.errstate(divide="ignore", invalid="ignore"):
+        loading = np.where(m.line_imax > 0, i_ka / m.line_imax * 100.0, 0.0)
+    net["res_line"] = _frame(net.line.index, {
+        "p_from_mw": s_f[L].real * sb, "q_from_mvar": s_f[L].imag * sb,
+        "p_to_mw": s_t[L].real * sb, "q_to_mvar": s_t[L].imag * sb,
+        "pl_mw": (s_f[L] + s_t[L]).real * sb, "ql_mvar": (s_f[L] + s_t[L]).imag * sb,
+        "i_from_ka": ia_f[L], "i_to_ka": ia_t[L], "i_ka": i_ka,
+        "vm_from_pu": vmf[L], "va_from_degree": vaf[L], "vm_to_pu": vmt[L], "va_to_degree": vat[L],
+        "loading_percent": loading})
+
+    # trafos (carregamento pela corrente nominal de cada lado, como o pandapower)
+    T = slice(nl, n_br)
+    i_hv_n = m.trafo_sn / (np.sqrt(3) * net.trafo.vn_hv_kv.values.astype(float))
+    i_lv_n = m.trafo_sn / (np.sqrt(3) * net.trafo.vn_lv_kv.values.astype(float))
+    with np.errstate(divide="ignore", invalid="ignore"):
+        t_load = np.nan_to_num(np.maximum(ia_f[T] / i_hv_n, ia_t[T] / i_lv_n) * 100.0)
+    net["res_trafo"] = _frame(net.trafo.index, {
+        "p_hv_mw": s_f[T].real * sb, "q_hv_mvar": s_f[T].imag * sb,
+        "p_lv_mw": s_t[T].real * sb, "q_lv_mvar": s_t[T].imag * sb,
+        "pl_mw": (s_f[T] + s_t[T]).real * sb, "ql_mvar": (s_f[T] + s_t[T]).imag * sb,
+        "i_hv_ka": ia_f[T], "i_lv_ka": ia_t[T],
+        "vm_hv_pu": vmf[T], "va_hv_degree": vaf[T], "vm_lv_pu": vmt[T], "va_lv_degree": vat[T],
+        "loading_percent": t_load})
+
+    # cargas e barras (p/q da barra: consumo líquido, convenção do pandapower)
+    ld = net.load
+    on_ld = ld.in_service.values.astype(bool) & reached[m.load_pos]
+    w = ld.scaling.values.astype(float) * on_ld
+    net["res_load"] = _frame(ld.index, {"p_mw": ld.p_mw.values * w, "q_mvar": ld.q_mvar.values * w})
+    s_bus = np.where(reached, s, 0.0) * sb
+    net["res_bus"] = _frame(net.bus.index, {"vm_pu": vm, "va_degree": va,
+                                            "p_mw": np.where(reached, s_bus.real, np.nan),
+                                            "q_mvar": np.where(reached, s_bus.imag, np.nan)})
+    # fonte: soma das correntes que saem da barra da ext_grid (carga local + ramos)
+    eg = net.ext_grid
+    s_eg = np.zeros(len(eg), dtype=complex)
+    eg_on = eg.in_service.values.astype(bool)
+    for k in np.flatnonzero(eg_on).tolist():
+        b = m.eg_pos[k]
+        out = np.flatnonzero(tree.on & ((m.f == b) | (m.t == b)))
+        flow = np.where(m.f[out] == b, s_f[out], s_t[out]).sum()
+        s_eg[k] = flow + s[b]
+    net["res_ext_grid"] = _frame(eg.index, {"p_mw": s_eg.real * sb, "q_mvar": s_eg.imag * sb})
+
+def _frame(index, cols):
+    import pandas as pd  # import tardio: só quem resolve fluxo paga o pandas
+    return pd.DataFrame(cols, index=index)
+
+def compare(net_a, net_b) -> Tuple[float, float]:
+    """Maior diferença de |V| (pu) e de carregamento de linha (%) entre dois resultados."""
+    dv = np.nanmax(np.abs(net_a.res_bus.vm_pu.values - net_b.res_bus.vm_pu.values), initial=0.0)
+    dl = np.nanmax(np.abs(net_a.res_line.loading_percent.values - net_b.res_line.loading_percent.values),
+                   initial=0.0)
+    return float(dv), float(dl)
@@ -0,0 +1,158 @@
+import math
+from dataclasses import asdict, dataclass
+from typing import Dict, FrozenSet, List, Tuple
+
+# ------------------------------------------------------------------
+#  Alimentadores sintéticos para medir escala (2.000–20.000 barras) com
+#  a mesma anatomia do W0321P3: tronco com religadores (RCL-*), ramais
+#  com chave (CH-*) e trafos 13,8/0,38 kV, interligações NA com trechos
+#  "(tie)". A carga total é fixa (repartida entre os trafos) e o tronco
+#  tem comprimento fixo, para o fluxo convergir em qualquer tamanho.
+#  Incrementar GENERATOR_VERSION sempre que a geração mudar.
+# ------------------------------------------------------------------
+GENERATOR_VERSION = "syn-1"
+
+@dataclass
+class SyntheticParams:
+    trunk_sections: int = 20
+    reclosers: int = 3              # religadores ao longo do tronco
+    laterals_per_section: int = 2
+    lateral_nodes: int = 3          # barras MT por ramal, após a chave
+    trafos_per_lateral: int = 4
+    ties: int = 2                   # 1ª: fim do tronco -> SE de socorro; demais: entre ramais
+    trunk_km: float = 12.0
+    total_mw: float = 6.0
+    pf: float = 0.97
+
+    def n_bus(self) -> int:
+        per_lateral = 2 + self.lateral_nodes + self.trafos_per_lateral
+        return (2 + self.trunk_sections + 2 * self.reclosers
+                + self.trunk_sections * self.laterals_per_section * per_lateral
+                + 2 * self.ties + (1 if self.ties else 0))
+
+def params_for(n_bus: int, **overrides) -> SyntheticParams:
+    """Parâmetros com ~n_bus barras: tronco ~√n seções, o resto em ramais."""
+    p = SyntheticParams(**overrides)
+    per_lateral = 2 + p.lateral_nodes + p.trafos_per_lateral
+    if "trunk_sections" not in overrides:
+        p.trunk_sections = min(200, max(10, int(math.sqrt(n_bus / per_lateral))))
+    if "laterals_per_section" not in overrides:
+        fixed = SyntheticParams(**{**asdict(p), "laterals_per_section": 0}).n_bus()
+        p.laterals_per_section = max(1, round((n_bus - fixed) / (p.trunk_sections * per_lateral)))
+    return p
+
+def build_synthetic(p: SyntheticParams) -> Tuple[object, FrozenSet[str], dict]:
+    """Retorna (rede com todas as linhas em serviço, chaves NA, layout no formato de geo)."""
+    import pandapower as pp  # import tardio: o servidor sobe sem a pilha do pandapower
+    coords: Dict[str, List[float]] = {}
+    segs: List[tuple] = []
+    trafos: List[tuple] = []
+    names: List[str] = []; vn: List[float] = []
+    # elementos acumulados e criados em lote no fim (create_* um a um domina o tempo em 20k barras)
+    lines: Dict[str, list] = {k: [] for k in ("f", "t", "km", "r", "x", "c", "imax", "name")}
+    trs: Dict[str, list] = {k: [] for k in ("hv", "lv", "sn", "pfe", "name")}
+    loads: List[Tuple[int, str]] = []
+    normally_open = set()
+
+    def bus(name: str, vn_kv: float, x: float, y: float) -> int:
+        names.append(name); vn.append(vn_kv); coords[name] = [float(x), float(y)]
+        return len(names) - 1
+
+    def line(a: int, b: int, km: float, name: str, max_i_ka: float = 0.6, r=0.3, x=0.4, c=10):
+        for k, v in zip(lines, (a, b, km, r, x, c, max_i_ka, name)): lines[k].append(v)
+        segs.append((name, names[a], names[b]))
+
+    def switch(a: int, b: int, name: str):
+        line(a, b, 0.01, name, 0.8, 0.1, 0.1, 1)
+
+    n_trafos = p.trunk_sections * p.laterals_per_section * p.trafos_per_lateral
+    p_tr = p.total_mw / max(1, n_trafos)
+    q_tr = p_tr * math.tan(math.acos(p.pf))
+
+    se = bus("SE-69kV", 69, -20, 0)
+    mt = bus("SE-BarraMT", 13.8, 0, 0)
+    trafos.append(("TR-SE", names[se], names[mt]))
+
+    # ---------- tronco ----------
+    dx = 100.0
+    sec_km = p.trunk_km / p.trunk_sections
+    every = max(1, p.trunk_sections // (p.reclosers + 1)) if p.reclosers else 0
+    trunk: List[int] = []
+    prev = mt; n_rcl = 0
+    for i in range(1, p.trunk_sections + 1):
+        x = i * dx
+        km = sec_km
+        if every and i % every == 0 and n_rcl < p.reclosers:
+            n_rcl += 1; km = sec_km / 2
+            ra = bus(f"R{n_rcl}A", 13.8, x - 0.6 * dx, 0); rb = bus(f"R{n_rcl}B", 13.8, x - 0.4 * dx, 0)
+            line(prev, ra, km, f"{names[prev]}-R{n_rcl}A", 0.8, 0.15, 0.35)
+            switch(ra, rb, f"RCL-{n_rcl:02d}")
+            prev = rb
+        b = bus(f"T{i:03d}", 13.8, x, 0)
+        line(prev, b, km, f"{names[prev]}-T{i:03d}", 0.8, 0.15, 0.35)  # tronco: cabo mais grosso
+        trunk.append(b); prev = b
+
+    # ---------- ramais ----------
+    n_ch = 0; n_tr = 0
+    lateral_ends: List[int] = []
+    for i, tb in enumerate(trunk, start=1):
+        for j in range(p.laterals_per_section):
+            n_ch += 1
+            side = 1 if j % 2 == 0 else -1
+            x0 = i * dx + (j // 2) * (dx / max(1, p.laterals_per_section))
+            code = f"{n_ch:03d}"
+            a = bus(f"CH{code}-A", 13.8, x0, side * 10); b = bus(f"CH{code}-B", 13.8, x0, side * 14)
+            line(tb, a, 0.05, f"{names[tb]}-CH{code}-A")
+            switch(a, b, f"CH-{code}")
+            nodes = []; prev = b
+            for k in range(1, p.lateral_nodes + 1):
+                nb = bus(f"L{code}-{k}", 13.8, x0, side * (14 + 8 * k))
+                line(prev, nb, 0.15 if k == 1 else 0.10, f"{names[prev]}-L{code}-{k}")
+                nodes.append(nb); prev = nb
+            lateral_ends.append(prev)
+            for t in range(p.trafos_per_lateral):
+                n_tr += 1
+                mv = nodes[t % len(nodes)] if nodes else b
+                mx, my = coords[names[mv]]
+                lv = bus(f"TR-{n_tr:05d}-LV", 0.38, mx + 3 + 3 * (t // max(1, len(nodes))), my)
+                sn = max(0.045, 3 * p_tr)  # perdas no ferro ~0,3% da potência nominal
+                for k, v in zip(trs, (mv, lv, sn, 3.0 * sn, f"TR-{n_tr:05d}")): trs[k].append(v)
+                trafos.append((f"TR-{n_tr:05d}", names[mv], names[lv]))
+                loads.append((lv, f"LD-TR-{n_tr:05d}"))
+
+    # ---------- interligações NA ----------
+    def tie(k: int, u: int, v: int):
+        ux, uy = coords[names[u]]; vx, vy = coords[names[v]]
+        ta = bus(f"TIE{k:02d}A", 13.8, ux + (vx - ux) / 3, uy + (vy - uy) / 3 + 20)
+        tb = bus(f"TIE{k:02d}B", 13.8, ux + 2 * (vx - ux) / 3, uy + 2 * (vy - uy) / 3 + 20)
+        line(u, ta, 0.10, f"{names[u]}-TIE{k:02d}A (tie)")
+        switch(ta, tb, f"RCL-T{k:02d}")
+        line(tb, v, 0.10, f"TIE{k:02d}B-{names[v]} (tie)")
+        normally_open.add(f"RCL-T{k:02d}")
+
+    backup = None
+    if p.ties:
+        backup = bus("SE-Socorro", 13.8, (p.trunk_sections + 2) * dx, 0)
+        tie(1, trunk[-1], backup)
+    step = max(1, len(lateral_ends) // max(1, p.ties))
+    for k in range(2, p.ties + 1):
+        u = lateral_ends[((k - 2) * step) % len(lateral_ends)]
+        v = lateral_ends[((k - 2) * step + step // 2 + 1) % len(lateral_ends)]
+        if u != v: tie(k, u, v)
+
+    # ---------- criação em lote ----------
+    net = pp.create_empty_network(sn_mva=100.)
+    pp.create_buses(net, len(names), vn_kv=vn, name=names)
+    pp.create_transformer_from_parameters(net, se, mt, sn_mva=max(25.0, 2 * p.total_mw), vn_hv_kv=69,
+                                          vn_lv_kv=13.8, vkr_percent=1, vk_percent=12, pfe_kw=15,
+                                          i0_percent=0.1, name="TR-SE")
+    pp.create_lines_from_parameters(net, lines["f"], lines["t"], lines["km"], lines["r"], lines["x"],
+                                    lines["c"], lines["imax"], name=lines["name"])
+    if trs["hv"]:
+        pp.create_transformers_from_parameters(net, trs["hv"], trs["lv"], trs["sn"], 13.8, 0.38, 4, 6,
+                                               trs["pfe"], 0.2, name=trs["name"])
+        pp.create_loads(net, [b for b, _ in loads], p_mw=p_tr, q_mvar=q_tr, name=[n for _, n in loads])
+    pp.create_ext_grid(net, se, vm_pu=1.0)
+    if backup is not None:
+        pp.create_ext_grid(net, backup, vm_pu=1.0)
+    return net, frozenset(normally_open), {"buses": coords, "lines": segs, "trafos": trafos}
@@ -0,0 +1,28 @@
+import os
+import sys
+from pathlib import Path
+
+# antes de importar app.*: banco em memória, estado em memória, sem aquecimento em thread
+os.environ.setdefault("SIM_DB_URL", "sqlite://")
+os.environ.setdefault("SIM_STATE_BACKEND", "memory")
+os.environ.setdefault("SIM_STARTUP", "lazy")
+os.environ.setdefault("SIM_WORKERS", "0")
+os.environ.setdefault("SIM_SYNTHETIC", "1")     # SYN-<barras> nos testes de planejamento e de estado
+
+# backend/ no path: os testes importam o pacote como o uvicorn (app.main, app.sim.*)
+sys.path.insert(0, str(Path(__file__).absolute().parents[1]))
+
+import pytest
+
+@pytest.fixture
+def fresh_net():
+    """Cópia do alimentador na configuração normal (chaves NA abertas)."""
+    from app.sim.feeders import FEEDERS
+    from app.sim.ops import apply_switching
+
+    def make(feeder_id: str = "W0321P3"):
+        fd = FEEDERS.get(feeder_id)
+        net = fd.new_network()
+        apply_switching(net, open_names=fd.normally_open)
+        return net
+    return make
@@ -0,0 +1,45 @@
+import pytest
+
+def _switch_feeder(path, trafo3w=False):
+    """SE -> B1 =(chave barra-barra fechada)= B2 -> B3; B1 -> B4 com chave de linha aberta."""
+    import pandapower as pp
+    net = pp.create_empty_network()
+    se, b1, b2, b3, b4 = (pp.create_bus(net, vn_kv=13.8, name=n) for n in ("SE", "B1", "B2", "B3", "B4"))
+    pp.create_ext_grid(net, se)
+    kw = dict(length_km=1.0, r_ohm_per_km=0.3, x_ohm_per_km=0.4, c_nf_per_km=0.0, max_i_ka=0.4)
+    pp.create_line_from_parameters(net, se, b1, name="L1", **kw)
+    pp.create_line_from_parameters(net, b2, b3, name="L2", **kw)
+    l3 = pp.create_line_from_parameters(net, b1, b4, name="L3", **kw)
+    pp.create_switch(net, b1, b2, et="b", closed=True, name="S1")
+    pp.create_switch(net, b4, l3, et="l", closed=False, name="S2")
+    pp.create_load(net, b3, p_mw=0.5); pp.create_load(net, b4, p_mw=0.5)
+    if trafo3w:
+        hv, mv, lv = (pp.create_bus(net, vn_kv=v) for v in (69.0, 13.8, 0.38))
+        pp.create_transformer3w(net, hv, mv, lv, std_type="63/25/38 MVA 110/20/10 kV")
+    pp.to_json(net, str(path))
+
+def test_pandapower_switches_become_lines(tmp_path):
+    from app.sim.feeders import FeederRegistry
+    from app.sim.ops import apply_switching
+    from app.sim.topology import connectivity
+    _switch_feeder(tmp_path / "SW1.json")
+    fd = FeederRegistry(root=tmp_path).get("SW1")
+    assert fd.normally_open == {"L3"}
+    net = fd.new_network()
+    assert not len(net.switch) and "CH-S1" in set(net.line.name)
+    apply_switching(net, open_names=fd.normally_open)
+    on = dict(zip(net.bus.name, connectivity(net).energized_mask(net)))
+    assert on == {"SE": True, "B1": True, "B2": True, "B3": True, "B4": False}
+    apply_switching(net, open_names=["CH-S1"])
+    assert not connectivity(net).energized_mask(net)[net.bus.index[net.bus.name == "B3"][0]]
+
+def test_trafo3w_feeder_is_rejected(tmp_path):
+    from app.sim.feeders import FeederRegistry, InvalidFeeder
+    _switch_feeder(tmp_path / "T3W.json", trafo3w=True)
+    with pytest.raises(InvalidFeeder, match="trafo3w"):
+        FeederRegistry(root=tmp_path).get("T3W")
+
+def test_synthetic_ids_are_canonical_and_capped():
+    from app.sim.feeders import FEEDERS, SYNTHETIC_MAX
+    assert FEEDERS.exists("SYN-200")
+    assert not any(FEEDERS.exists(i) for i in ("SYN-0200", "SYN-+200", "SYN-49", f"SYN-{SYNTHETIC_MAX + 1}"))
@@ -0,0 +1,15 @@
+from app.jobs import JobManager
+
+def test_cancelled_job_never_starts():
+    jobs = JobManager(workers=0)          # sem threads: o teste faz o papel do worker
+    job = jobs.submit({"force": True})
+    assert jobs.cancel(job.id).status == "cancelled"
+    assert not job.start()                # o worker pega o job da fila depois do cancelamento
+    assert job.status == "cancelled"
+    assert [e["event"] for e in job.events] == ["status", "cancelled"]
+
+def test_cancel_after_start_only_flags():
+    jobs = JobManager(workers=0)
+    job = jobs.submit({"force": True})
+    assert job.start()
+    assert jobs.cancel(job.id).status == "running" and job.cancel_flag.is_set()
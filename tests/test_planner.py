@@ -0,0 +1,82 @@
+import pytest
+
+from app.sim.planner import isolation_zone, isolation_zones, plan_restoration
+from app.sim.radial import energized_after
+
+# ---------- trecho isolado ----------
+def test_isolation_zone_w0321p3(fresh_net):
+    net = fresh_net()
+    zone, boundary = isolation_zone(net, "R3B-B3")
+    assert boundary == ["RCL-03", "CH-07", "CH-08", "CH-09", "CH-10", "CH-11", "CH-12"]
+    buses = set(net.bus.name.values[zone].tolist())
+    # o trecho de tie até o RCL-05 (NA) é ramo morto: entra no trecho em vez de abrir R5B-B3 (tie)
+    assert len(buses) == 19
+    assert {"W0321P3-B3", "R3B", "CH07-A", "CH12-A", "R5B"} <= buses
+    assert "W0321P3-B2" not in buses
+
+def test_isolation_zone_on_switch_is_empty(fresh_net):
+    zone, boundary = isolation_zone(fresh_net(), "RCL-03")
+    assert not zone.any() and boundary == []
+
+def test_isolation_zones_is_union(fresh_net):
+    net = fresh_net()
+    za, ba = isolation_zone(net, "R1B-B1")
+    zb, bb = isolation_zone(net, "R3B-B3")
+    zone, boundary = isolation_zones(net, ["R1B-B1", "R3B-B3"])
+    assert (zone == (za | zb)).all()
+    assert set(boundary) == set(ba) | set(bb)
+
+# ---------- plano ----------
+def test_plan_w0321p3_isolates_without_restoring(fresh_net):
+    net = fresh_net()
+    plan = plan_restoration(net, "R3B-B3", budget_s=10)
+    assert plan.complete
+    assert plan.isolate == ["RCL-03", "CH-07", "CH-08", "CH-09", "CH-10", "CH-11", "CH-12"]
+    assert plan.steps == []
+    assert (plan.clients_isolated, plan.clients_after, plan.prio_served) == (472, 472, 27)
+
+@pytest.mark.parametrize("fault, steps, after", [
+    ("T001-R1A", [("fechar", "RCL-T01"), ("fechar", "RCL-T02")], 60),
+    ("T002-T003", [("fechar", "RCL-T02")], 240),
+    ("RCL-03", [("fechar", "RCL-T01")], 0),
+])
+def test_plan_synthetic_restores_through_ties(fresh_net, fault, steps, after):
+    net = fresh_net("SYN-200")
+    plan = plan_restoration(net, fault, budget_s=10)
+    assert plan.complete
+    assert plan.steps == steps
+    assert plan.clients_after == after
+    # a configuração final continua radial (o índice radial só responde em rede radial)
+    assert energized_after(net) is not None
+
+def test_plan_is_deterministic(fresh_net):
+    plans = [plan_restoration(fresh_net("SYN-200"), "R2B-T004", budget_s=10) for _ in range(2)]
+    assert plans[0].steps == plans[1].steps == [("fechar", "RCL-T01"), ("fechar", "RCL-T02")]
+    assert plans[0].clients_after == plans[1].clients_after == 180
+
+def test_plan_step_cap(fresh_net):
+    plan = plan_restoration(fresh_net("SYN-200"), "T001-R1A", max_steps=1, budget_s=10)
+    assert plan.steps == [("fechar", "RCL-T01")]
+    assert plan.clients_after == 120
+
+def test_plan_budget_exhausted(fresh_net):
+    net = fresh_net("SYN-200")
+    plan = plan_restoration(net, "T001-R1A", budget_s=0)
+    assert not plan.complete
+    assert plan.steps == [] and plan.clients_after == plan.clients_isolated == 1200
+
+def test_plan_respects_locked(fresh_net):
+    plan = plan_restoration(fresh_net("SYN-200"), "T001-R1A", locked={"RCL-T01"}, budget_s=10)
+    assert all(name != "RCL-T01" for _, name in plan.steps)
+
+# ---------- /api/run padrão ----------
+def test_default_run_kpis():
+    from app.scenario import simulate
+    res = simulate({"force": True})
+    assert res["customers_total"] == 1104
+    assert res["clients_initial"] == res["clients_after_reconfig"] == 472
+    assert res["kpis"]["saidi_h"] == pytest.approx(0.142512, abs=1e-6)
+    assert res["kpis"]["ens_mwh"] == pytest.approx(2.36 * 20 / 60)   # 472 clientes = 2,36 MW isolados por 20 min
+    assert [e["op"] for e in res["timeline"]] == [
+        "abrir R3B-B3", "abrir RCL-03", "abrir CH-07", "abrir CH-08",
+        "abrir CH-09", "abrir CH-10", "abrir CH-11", "abrir CH-12"]
@@ -0,0 +1,142 @@
+import threading
+
+import pytest
+
+from app import state
+from app.state import StateConflict, drop_session, get_state, set_fault, set_switch, state_version
+from app.statestore import DbStateStore, MemoryStateStore, new_record
+
+FEEDER = "W0321P3"
+
+@pytest.fixture(params=["memory", "db"])
+def store(request, monkeypatch):
+    """Estado limpo sobre cada backend (STORE trocado, cópias locais descartadas)."""
+    if request.param == "db":
+        from app.db import SwitchState, db_session
+        with db_session() as s:
+            s.query(SwitchState).delete(); s.commit()
+        st = DbStateStore()
+    else:
+        st = MemoryStateStore()
+    monkeypatch.setattr(state, "STORE", st)
+    monkeypatch.setattr(state, "_SESSIONS", type(state._SESSIONS)())
+    monkeypatch.setattr(state, "_LIVE", type(state._LIVE)())
+    return st
+
+def _compact(**kw):
+    return get_state(FEEDER, "compact", **kw)
+
+# ---------- compare-and-set no backend ----------
+def test_store_put_is_compare_and_set(store):
+    rec = new_record({"RCL-04"})
+    assert store.put(FEEDER, "", rec, None)
+    assert not store.put(FEEDER, "", new_record(()), None)          # já existe
+    nxt = rec.replace({"RCL-04", "RCL-01"}, ())
+    assert not store.put(FEEDER, "", nxt, rec.version + 5)          # versão errada
+    assert store.put(FEEDER, "", nxt, rec.version)
+    assert store.get(FEEDER) == nxt
+    assert not store.put(FEEDER, "", nxt.replace((), ()), rec.version)  # a versão lida já passou
+
+# ---------- manobras ----------
+def test_if_version_mismatch_raises(store):
+    v = _compact()["version"]
+    set_switch("RCL-01", "open", feeder=FEEDER, fmt="compact", if_version=v)
+    with pytest.raises(StateConflict) as exc:
+        set_switch("RCL-02", "open", feeder=FEEDER, fmt="compact", if_version=v)
+    assert exc.value.version == v + 1
+    assert "RCL-02" not in _compact()["open"]
+
+def test_concurrent_write_is_retried(store, monkeypatch):
+    base = _compact()["version"]
+    real_put = store.put
+    raced = threading.Event()
+
+    def racing_put(feeder, session, rec, expect):
+        # outro worker grava entre a leitura e o CAS desta manobra
+        if not raced.is_set():
+            raced.set()
+            cur = store.get(feeder, session)
+            assert real_put(feeder, session, cur.replace(cur.open, cur.fault | {"RCL-02"}), cur.version)
+        return real_put(feeder, session, rec, expect)
+    monkeypatch.setattr(store, "put", racing_put)
+
+    out = set_switch("RCL-01", "open", feeder=FEEDER, fmt="compact")
+    assert raced.is_set()
+    assert out["version"] == base + 2
+    assert "RCL-01" in out["open"] and out["fault"] == ["RCL-02"]   # as duas manobras valem
+
+def test_conflict_with_if_version_is_not_retried(store, monkeypatch):
+    v = _compact()["version"]
+    real_put = store.put
+
+    def racing_put(feeder, session, rec, expect):
+        cur = store.get(feeder, session)
+        real_put(feeder, session, cur.replace(cur.open, {"RCL-02"}), cur.version)
+        return real_put(feeder, session, rec, expect)
+    monkeypatch.setattr(store, "put", racing_put)
+    with pytest.raises(StateConflict):
+        set_switch("RCL-01", "open", feeder=FEEDER, fmt="compact", if_version=v)
+
+# ---------- sessões de treino ----------
+def test_session_reads_shared_until_first_write(store):
+    shared = _compact()
+    sandbox = _compact(session="alice")
+    assert sandbox["version"] == shared["version"] and sandbox["tag"] == shared["tag"]
+    assert "session" not in sandbox
+    assert store.get(FEEDER, "alice") is None
+
+def test_session_fork_has_own_lineage(store):
+    shared_tag, shared_v = state_version(FEEDER)
+    out = set_fault("RCL-02", "apply", feeder=FEEDER, fmt="compact", session="alice")
+    assert out["session"] == "alice" and out["fault"] == ["RCL-02"]
+    fork = store.get(FEEDER, "alice")
+    assert fork.token != store.get(FEEDER).token
+    assert fork.version == shared_v + 1
+    tag, v = state_version(FEEDER, "alice")
+    assert tag != shared_tag and tag.endswith(".alice") and v == fork.version
+    # o compartilhado não mudou
+    assert state_version(FEEDER) == (shared_tag, shared_v)
+    assert _compact()["fault"] == []
+
+def test_drop_session_falls_back_to_shared(store):
+    set_switch("RCL-01", "open", feeder=FEEDER, fmt="compact", session="bob")
+    assert "RCL-01" in _compact(session="bob")["open"]
+    assert drop_session("bob") == 1
+    assert store.get(FEEDER, "bob") is None
+    back = _compact(session="bob")
+    assert "RCL-01" not in back["open"] and "session" not in back
+    assert state_version(FEEDER, "bob") == state_version(FEEDER)
+
+def test_api_returns_409_on_stale_version(store):
+    from fastapi.testclient import TestClient
+    from app.main import app
+    c = TestClient(app)
+    v = c.get("/api/state", params={"feeder": FEEDER, "format": "compact"}).json()["version"]
+    body = {"feeder": FEEDER, "format": "compact", "if_version": v}
+    assert c.post("/api/switch", json={**body, "name": "RCL-01", "action": "open"}).status_code == 200
+    r = c.post("/api/switch", json={**body, "name": "RCL-02", "action": "open"})
+    assert r.status_code == 409 and r.json()["version"] == v + 1
+
+def test_api_state_304_needs_exact_etag(store):
+    from fastapi.testclient import TestClient
+    from app.main import app
+    c = TestClient(app)
+    params = {"feeder": FEEDER, "format": "compact"}
+    tag = c.get("/api/state", params=params).headers["etag"]
+    for inm, code in ((f'"x", W/{tag}', 304), ("*", 304),
+                      (f'"x{tag[1:]}', 200), (tag + tag, 200)):   # contêm o ETag, mas não como item da lista
+        assert c.get("/api/state", params=params, headers={"If-None-Match": inm}).status_code == code, inm
+
+def test_sessions_do_not_pin_feeders(store, monkeypatch):
+    import gc
+    import weakref
+    from app.sim.feeders import FEEDERS
+    monkeypatch.setattr(state, "STATE_SESSIONS", 2)
+    refs = []
+    for n in (50, 51, 52):
+        get_state(f"SYN-{n}", "compact")
+        refs.append(weakref.ref(FEEDERS.get(f"SYN-{n}")))
+        FEEDERS.invalidate(f"SYN-{n}")
+    gc.collect()
+    assert all(r() is None for r in refs)          # nenhuma sessão segura o Feeder (nem o template)
+    assert len(state._SESSIONS) == 2
@@ -0,0 +1,18 @@
+from app.sim.sweep import supported
+
+def test_supported_base_feeder(fresh_net):
+    assert supported(fresh_net())
+
+def test_trafo3w_not_supported(fresh_net):
+    import pandapower as pp
+    net = fresh_net()
+    hv, mv, lv = (pp.create_bus(net, vn_kv=v) for v in (110.0, 20.0, 10.0))
+    pp.create_transformer3w(net, hv, mv, lv, std_type="63/25/38 MVA 110/20/10 kV")
+    assert not supported(net)
+
+def test_phase_shifting_trafo_not_supported(fresh_net):
+    net = fresh_net()
+    net.trafo.loc[net.trafo.index[0], "shift_degree"] = 30.0
+    assert not supported(net)
+    net.trafo.loc[net.trafo.index[0], "in_service"] = False   # fora de serviço não conta
+    assert supported(net)
@@ -0,0 +1,224 @@
+import copy
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import TYPE_CHECKING, Iterable, List, Tuple, Union
+
+import numpy as np
+
+from .topology import name_index
+
+if TYPE_CHECKING:
+    import pandas as pd  # em tempo de execução, importado só ao ler perfis
+
+# ------------------------------------------------------------------
+#  Simulação em série temporal: perfis de carga de 15 min por trafo
+#  (CSV/Parquet, até um ano = 35.040 passos). A configuração da rede é
+#  fixa durante a série, então a Ybus e a ordenação interna do
+#  pandapower são montadas uma única vez (um runpp) e todos os passos
+#  são resolvidos juntos, por blocos, com a fatoração LU reaproveitada.
+# ------------------------------------------------------------------
+STEP_MIN = 15.0
+
+@dataclass
+class LoadProfile:
+    index: "pd.Index"               # carimbo de tempo (ou nº do passo) de cada linha
+    p_mw: np.ndarray                # (passos, cargas), posicional em net.load
+    q_mvar: np.ndarray
+    step_min: float = STEP_MIN
+
+    @property
+    def n_steps(self) -> int:
+        return self.p_mw.shape[0]
+
+@dataclass
+class TimeSeriesResult:
+    index: "pd.Index"
+    vm_pu: np.ndarray               # (passos, barras) float32; NaN em barra desenergizada
+    p_load_mw: np.ndarray           # carga atendida por passo
+    converged: np.ndarray           # bool por passo
+    iterations: int = 0
+    fallback_steps: List[int] = field(default_factory=list)   # passos resolvidos com runpp
+    elapsed_s: float = 0.0
+
+def read_profiles(source: Union[str, Path, "pd.DataFrame"]) -> "pd.DataFrame":
+    """
+    Lê a tabela de perfis: uma linha por passo, uma coluna por trafo (TR-01...)
+    ou carga (LD-TR-01...). A primeira coluna do arquivo é o carimbo de tempo.
+    """
+    import pandas as pd
+    if isinstance(source, pd.DataFrame):
+        return source
+    path = Path(source)
+    if path.suffix.lower() in (".parquet", ".pq"):
+        df = pd.read_parquet(path)   # requer pyarrow ou fastparquet
+    else:
+        df = pd.read_csv(path)
+    df = df.set_index(df.columns[0])
+    try:
+        df.index = pd.to_datetime(df.index)
+    except (ValueError, TypeError):
+        pass
+    return df
+
+def _step_min(index: "pd.Index") -> float:
+    import pandas as pd
+    if isinstance(index, pd.DatetimeIndex) and len(index) > 1:
+        return float(np.median(np.diff(index.asi8))) / 60e9
+    return STEP_MIN
+
+def _load_columns(net, columns: Iterable[str]) -> List[Tuple[str, np.ndarray]]:
+    """Coluna -> posições das cargas que ela comanda (trafo: cargas da barra BT)."""
+    names = name_index(net)
+    load_bus = net.load.bus.values
+    load_pos = {n: p for p, n in enumerate(net.load.name.tolist())}
+    out, unknown = [], []
+    for col in columns:
+        if col in load_pos:
+            out.append((col, np.array([load_pos[col]])))
+        elif col in names.trafo:
+            lv = net.trafo.at[names.trafo[col], "lv_bus"]
+            out.append((col, np.flatnonzero(load_bus == lv)))
+        else:
+            unknown.append(col)
+    if unknown:
+        raise ValueError(f"colunas sem trafo/carga correspondente: {', '.join(map(str, unknown[:10]))}")
+    return out
+
+def load_profile(net, source: Union[str, Path, "pd.DataFrame"], unit: str = "pu") -> LoadProfile:
+    """
+    Monta as matrizes de carga por passo. unit="pu": multiplicador da carga
+    nominal; unit="mw": potência ativa absoluta, repartida entre as cargas do
+    trafo na proporção da nominal. Q segue o fator de potência nominal.
+    Cargas sem coluna ficam constantes.
+    """
+    if unit not in ("pu", "mw"):
+        raise ValueError("unit deve ser 'pu' ou 'mw'")
+    df = read_profiles(source)
+    p0 = net.load.p_mw.values.astype(float); q0 = net.load.q_mvar.values.astype(float)
+    T = len(df)
+    p = np.broadcast_to(p0, (T, len(p0))).copy()
+    q = np.broadcast_to(q0, (T, len(q0))).copy()
+    for col, pos in _load_columns(net, df.columns):
+        if not len(pos): continue
+        x = df[col].to_numpy(dtype=float)[:, None]
+        if unit == "pu":
+            p[:, pos] = x * p0[pos]; q[:, pos] = x * q0[pos]
+        else:
+            share = p0[pos] / p0[pos].sum() if p0[pos].sum() else np.full(len(pos), 1.0 / len(pos))
+            tan_phi = np.divide(q0[pos], p0[pos], out=np.zeros(len(pos)), where=p0[pos] != 0)
+            p[:, pos] = x * share; q[:, pos] = p[:, pos] * tan_phi
+    return LoadProfile(df.index, p, q, _step_min(df.index))
+
+class TimeSeriesSolver:
+    """
+    Fluxo de potência de muitos passos numa configuração fixa. Usa a Ybus
+    interna do pandapower (um runpp de referência) e resolve, para todos os
+    passos de um bloco ao mesmo tempo, a iteração de injeção de corrente
+        V = W + Ynn⁻¹ · conj(S / V)
+    com Ynn fatorada uma vez. Passos que não convergem caem no runpp.
+    """
+    def __init__(self, net, tol: float = 1e-8, max_iter: int = 30):
+        import pandapower as pp  # import tardio: o servidor sobe sem a pilha do pandapower
+        from scipy.sparse import csr_matrix
+        from scipy.sparse.linalg import splu
+        self.net = net; self.tol = tol; self.max_iter = max_iter
+        pp.runpp(net)
+        ppci = net._ppc["internal"]
+        Y = ppci["Ybus"].tocsr()
+        n = Y.shape[0]
+        ref = np.asarray(ppci["ref"], dtype=np.int64)
+        if len(ppci["pv"]):
+            raise ValueError("série temporal suporta só barras PQ além da referência")
+        self.base = float(ppci["baseMVA"])
+        other = np.setdiff1d(np.arange(n), ref)
+        self.other = other
+        self.lu = splu(Y[other][:, other].tocsc())
+        v_ref = np.asarray(ppci["V"])[ref]
+        self.w = self.lu.solve(-(Y[other][:, ref] @ v_ref).astype(complex))
+        self.v_ref = v_ref; self.ref = ref; self.n_int = n
+
+        # barra do pandapower -> barra interna (só barras energizadas entram na Ybus)
+        lookup = net._pd2ppc_lookups["bus"]
+        bus_int = lookup[net.bus.index.values]
+        self.bus_int = np.where(bus_int < n, bus_int, -1)
+        pos_of = np.full(n, -1, dtype=np.int64); pos_of[other] = np.arange(len(other))
+        load_int = self.bus_int[net.bus.index.get_indexer(net.load.bus.values)]
+        on = (load_int >= 0) & net.load.in_service.values.astype(bool)
+        self.load_on = on
+        # injeção por barra não-referência = C · (p + jq) das cargas
+        rows = np.where(on, pos_of[np.where(load_int >= 0, load_int, 0)], -1)
+        keep = rows >= 0
+        self.C = csr_matrix((np.ones(int(keep.sum())), (rows[keep], np.flatnonzero(keep))),
+                            shape=(len(other), len(net.load)))
+        self.scaling = net.load.scaling.values.astype(float)
+
+    def solve(self, profile: LoadProfile, chunk: int = 4096) -> TimeSeriesResult:
+        t_start = time.perf_counter()
+        T = profile.n_steps
+        vm = np.full((T, len(self.net.bus)), np.nan, dtype=np.float32)
+        converged = np.zeros(T, dtype=bool)
+        p_on = (profile.p_mw * self.scaling)[:, self.load_on].sum(axis=1) if T else np.zeros(0)
+        it_max = 0
+        bus_ok = self.bus_int >= 0
+        # coluna da tensão completa (ref + demais) para cada barra do pandapower
+        full = np.empty(self.n_int, dtype=np.int64)
+        full[self.ref] = np.arange(len(self.ref)); full[self.other] = len(self.ref) + np.arange(len(self.other))
+        cols = full[self.bus_int[bus_ok]]
+        for a in range(0, T, chunk):
+            b = min(T, a + chunk)
+            s = -(self.C @ ((profile.p_mw[a:b] + 1j * profile.q_mvar[a:b]) * self.scaling).T) / self.base
+            v = np.repeat(self.w[:, None], b - a, axis=1)
+            done = np.zeros(b - a, dtype=bool)
+            for it in range(1, self.max_iter + 1):
+                v_new = self.w[:, None] + self.lu.solve(np.conj(s / v))
+                err = np.abs(v_new - v).max(axis=0) if len(v) else np.zeros(b - a)
+                v = v_new; it_max = max(it_max, it)
+                done = err < self.tol
+                if done.all(): break
+            v_all = np.vstack([np.broadcast_to(self.v_ref[:, None], (len(self.ref), b - a)), v])
+            vm[a:b][:, bus_ok] = np.abs(v_all[cols]).T
+            converged[a:b] = done
+        fallback = np.flatnonzero(~converged).tolist()
+        if fallback:
+            self._fallback(profile, fallback, vm, converged)
+        return TimeSeriesResult(profile.index, vm, p_on, converged, it_max, fallback,
+                                time.perf_counter() - t_start)
+
+    def _fallback(self, profile: LoadProfile, steps: List[int], vm: np.ndarray, converged: np.ndarray):
+        import pandapower as pp
+        net = copy.deepcopy(self.net)
+        for k in steps:
+            net.load["p_mw"] = profile.p_mw[k]; net.load["q_mvar"] = profile.q_mvar[k]
+            try:
+                pp.runpp(net)
+            except Exception:
+                continue
+            vm[k] = net.res_bus.vm_pu.values.astype(np.float32)
+            converged[k] = True
+
+def run_timeseries(net, profile: LoadProfile, tol: float = 1e-8, max_iter: int = 30,
+                   chunk: int = 4096) -> TimeSeriesResult:
+    """Resolve a série na configuração atual de `net` (net não é alterada além dos resultados do runpp)."""
+    return TimeSeriesSolver(net, tol, max_iter).solve(profile, chunk)
+
+def window_weights(profile: LoadProfile, t0_min: float, duration_min: float) -> np.ndarray:
+    """Horas de cada passo cobertas pela janela [t0, t0 + duração), em minutos desde o início do perfil."""
+    start = np.arange(profile.n_steps) * profile.step_min
+    overlap = np.minimum(start + profile.step_min, t0_min + duration_min) - np.maximum(start, t0_min)
+    return np.clip(overlap, 0.0, None) / 60.0
+
+def energy_not_supplied(profile: LoadProfile, phases: Iterable[Tuple[float, np.ndarray]],
+                        t0_min: float = 0.0) -> float:
+    """
+    ENS (MWh) integrando a carga real interrompida no tempo.
+    phases: sequência de (duração em min, máscara das cargas desligadas),
+    consecutivas a partir de t0_min.
+    """
+    ens = 0.0; t = float(t0_min)
+    for duration, off in phases:
+        if duration > 0 and off.any():
+            w = window_weights(profile, t, duration)
+            ens += float(w @ profile.p_mw[:, off].sum(axis=1))
+        t += max(0.0, duration)
+    return ens
@@ -0,0 +1,109 @@
+import weakref
+from typing import Any, Callable, Dict, Set, Tuple
+
+import numpy as np
+
+# ------------------------------------------------------------------
+#  Motor de conectividade: responde "quais barras estão ligadas à
+#  ext_grid" só com a topologia (linhas/trafos em serviço), sem runpp.
+#  A estrutura (extremidades dos ramos) é pré-computada uma vez por rede;
+#  a cada consulta só as colunas in_service são lidas.
+# ------------------------------------------------------------------
+
+class Connectivity:
+    def __init__(self, net):
+        self.bus_index = net.bus.index.values
+        pos = net.bus.index
+        self.n_bus = len(pos)
+        self.n_line = len(net.line)
+        self.n_trafo = len(net.trafo)
+        # posições (0..n_bus-1) das extremidades: linhas primeiro, depois trafos
+        self.f = np.concatenate([pos.get_indexer(net.line.from_bus.values),
+                                 pos.get_indexer(net.trafo.hv_bus.values)])
+        self.t = np.concatenate([pos.get_indexer(net.line.to_bus.values),
+                                 pos.get_indexer(net.trafo.lv_bus.values)])
+        # adjacência (vizinho, ramo) por barra, para a busca a partir da fonte
+        self.adj = [[] for _ in range(self.n_bus)]
+        for e, (a, b) in enumerate(zip(self.f.tolist(), self.t.tolist())):
+            self.adj[a].append((b, e)); self.adj[b].append((a, e))
+
+    def energized_mask(self, net) -> np.ndarray:
+        """Máscara booleana (posicional em net.bus) das barras alimentadas."""
+        closed = np.concatenate([net.line.in_service.values.astype(bool),
+                                 net.trafo.in_service.values.astype(bool)])
+        bus_on = net.bus.in_service.values.astype(bool)
+        closed = closed.tolist()
+        on = bus_on.tolist()
+
+        eg_on = net.ext_grid.in_service.values.astype(bool)
+        src = net.bus.index.get_indexer(net.ext_grid.bus.values[eg_on]).tolist()
+        seen = [False] * self.n_bus
+        stack = [s for s in src if on[s]]
+        for s in stack: seen[s] = True
+        adj = self.adj
+        while stack:
+            u = stack.pop()
+            for v, e in adj[u]:
+                if not seen[v] and closed[e] and on[v]:
+                    seen[v] = True; stack.append(v)
+        return np.array(seen, dtype=bool)
+
+    def energized(self, net) -> Set[int]:
+        return set(self.bus_index[self.energized_mask(net)].tolist())
+
+def _signature(net) -> Tuple[int, int, int, int]:
+    return len(net.bus), len(net.line), len(net.trafo), len(net.load)
+
+# cache por objeto de rede: id(net) -> (weakref, {tipo: (assinatura, índice)})
+_CACHE: Dict[int, Tuple[weakref.ref, Dict[str, Tuple[tuple, Any]]]] = {}
+
+def _slot(net, indices=None):
+    key = id(net)
+    hit = _CACHE.get(key)
+    if hit is None or hit[0]() is not net or indices is not None:
+        hit = (weakref.ref(net, lambda _r, k=key: _CACHE.pop(k, None)),
+               {} if indices is None else indices)
+        _CACHE[key] = hit
+    return hit
+
+def per_net(net, kind: str, build: Callable[[Any], Any]):
+    """Índice derivado da estrutura da rede, refeito se a estrutura mudar."""
+    hit = _slot(net)
+    sig = _signature(net)
+    entry = hit[1].get(kind)
+    if entry is None or entry[0] != sig:
+        if entry is not None:
+            # estrutura divergiu de uma rede irmã: passa a ter índices próprios
+            hit = _slot(net, {})
+        entry = (sig, build(net))
+        hit[1][kind] = entry
+    return entry[1]
+
+def share_indices(src, dst):
+    """dst (cópia estrutural de src) passa a reutilizar os índices de src."""
+    _slot(dst, _slot(src)[1])
+
+class NameIndex:
+    """Nome -> índice de linhas, barras, trafos e cargas (primeira ocorrência)."""
+    def __init__(self, net):
+        # line_pos: posição (0..n-1) em net.line, para atribuições vetorizadas
+        self.line, self.line_pos = _name_map(net.line)
+        self.bus, _ = _name_map(net.bus)
+        self.trafo, _ = _name_map(net.trafo)
+        self.load, _ = _name_map(net.load)
+
+def _name_map(df) -> Tuple[Dict[str, int], Dict[str, int]]:
+    labels: Dict[str, int] = {}; pos: Dict[str, int] = {}
+    for p, (i, n) in enumerate(zip(df.index.tolist(), df.name.tolist())):
+        if n not in labels:
+            labels[n] = i; pos[n] = p
+    return labels, pos
+
+def name_index(net) -> NameIndex:
+    return per_net(net, "names", NameIndex)
+
+def connectivity(net) -> Connectivity:
+    return per_net(net, "connectivity", Connectivity)
+
+def energized_buses_topo(net) -> Set[int]:
+    return connectivity(net).energized(net)